@@ -0,0 +1,348 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file benchmarks the overhead of the framework itself. All benchmarks run
+on a single Linux machine without a network, DBMS or docker: the data trees,
+logs and result records are generated, and the command round trips are made
+against the LocalConnection executor. A real SSH round trip to the
+local host is only measured when a user is given.
+
+Benchmarks:
+- bit_flip:        insert_bit_flips throughput on a generated file.
+- restore:         _restore_cmd on a generated db_data tree with modified and new files.
+- verify_db:       SQLiteDB insert and check rates.
+- verify_query:    _verify_query scaling with the number of result rows.
+- log_results:     FIClient._get_log_results (or the LogCorrelator when the client
+                   dependencies are missing) on generated Cassandra logs.
+- command:         execute_cmd round trips of the LocalConnection (and optionally SSH).
+- summarize:       summarize_results and summarize_run on generated result records.
+
+The results are written as json, including the git commit, so the results of
+different commits can be compared.
+
+FILE: run_benchmarks.py
+
+USAGE: python benchmarks/run_benchmarks.py [-o results.json] [-only name ..] [-quick]
+                                           [-compare old_results.json] [-ssh-user user -ssh-password pw]
+
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import random
+import tarfile
+import argparse
+import platform
+import tempfile
+import datetime
+import subprocess
+from timeit import default_timer
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from src.faults.bit_flip import insert_bit_flips
+from src.verify_db import SQLiteDB
+from src import db_server_querying
+from src.log_correlation import LogCorrelator
+from src.local_conn import LocalConnection
+from result_analyzer import summarize_results, summarize_run
+
+
+# The scale of the generated data in quick mode.
+quick_scale = 0.1
+
+
+# Scale a count of generated items, at least a single item is generated.
+def scaled(count, scale):
+    return max(1, int(round(count * scale)))
+
+
+# Time a function repeat times, the timings are summarized in seconds. When ops is
+# given, the number of operations per second of a single call is added.
+def time_function(func, repeat=5, ops=None):
+    timings = []
+    for _ in range(repeat):
+        start = default_timer()
+        func()
+        timings.append(default_timer() - start)
+    timings.sort()
+    result = {'repeat': repeat, 'min': timings[0], 'median': timings[len(timings) // 2],
+              'mean': sum(timings) / len(timings), 'max': timings[-1]}
+    if ops is not None:
+        result['ops'] = ops
+        result['ops_per_sec'] = ops / result['median'] if result['median'] > 0 else None
+    return result
+
+
+# Run a function with the stdout discarded, as some framework functions print a lot.
+def run_silent(func):
+    stdout = sys.stdout
+    sys.stdout = io.open(os.devnull, 'wb')
+    try:
+        return func()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def bench_bit_flip(work_dir, scale):
+    path = os.path.join(work_dir, 'flip_target.db')
+    with io.open(path, 'wb') as f:
+        f.write(os.urandom(16 * 1024 * 1024))
+
+    n_flips = scaled(1000, scale)
+    return {'random_offsets': time_function(
+                lambda: run_silent(lambda: [insert_bit_flips([path]) for _ in range(n_flips)]), ops=n_flips),
+            'given_offsets': time_function(
+                lambda: run_silent(lambda: insert_bit_flips([path] * n_flips, range(n_flips),
+                                                            file_bits=[0] * n_flips)), ops=n_flips)}
+
+
+# Create a db_data tree with n_files of file_size bytes, and its backup archive.
+def create_data_tree(work_dir, n_files, file_size):
+    data_dir = os.path.join('fi-framework', 'db_data')
+    for i in range(n_files):
+        table_dir = os.path.join(work_dir, data_dir, 'data', 'files', 'table-{}'.format(i % 10))
+        if not os.path.exists(table_dir):
+            os.makedirs(table_dir)
+        with io.open(os.path.join(table_dir, 'ma-{}-big-Data.db'.format(i)), 'wb') as f:
+            f.write(os.urandom(file_size))
+    with tarfile.open(os.path.join(work_dir, 'fi-framework', 'backup.tar.gz'), 'w:gz') as tar:
+        tar.add(data_dir)
+    return data_dir
+
+
+def bench_restore(work_dir, scale):
+    n_files = scaled(100, scale)
+    data_dir = create_data_tree(work_dir, n_files, 64 * 1024)
+    run_params = {'backup': 'fi-framework/backup.tar.gz', 'data': data_dir}
+    data_files = sorted(os.path.join(root_dir, name) for root_dir, _, files in os.walk(data_dir) for name in files)
+
+    # Modify a few files and add a new one, as a fault injection run does.
+    def modify_data():
+        run_silent(lambda: insert_bit_flips(data_files[:5]))
+        with io.open(os.path.join(data_dir, 'data', 'files', 'ma-new-big-Data.db'), 'wb') as f:
+            f.write(os.urandom(1024))
+
+    def restore_modified():
+        modify_data()
+        db_server_querying._restore_cmd(run_params)
+
+    # The first restore creates the backup file list, which is reused afterwards.
+    first = time_function(lambda: db_server_querying._restore_cmd(run_params), repeat=1)
+    return {'files': n_files, 'first_restore': first,
+            'restore_unmodified': time_function(lambda: db_server_querying._restore_cmd(run_params)),
+            'restore_modified': time_function(restore_modified)}
+
+
+def bench_verify_db(work_dir, scale):
+    n_rows = scaled(2000, scale)
+    db = SQLiteDB(db_name=os.path.join(work_dir, 'verifications'))
+    db.drop_table()
+    db.setup()
+
+    def insert_rows():
+        for i in range(n_rows):
+            db.insert(i % 20, i // 20, 'file_{}'.format(i), '{:032x}'.format(i))
+
+    result = {'insert': time_function(insert_rows, repeat=1, ops=n_rows),
+              'check_row': time_function(lambda: [db.check(i % 20, i // 20) for i in range(n_rows)], ops=n_rows),
+              'check_query': time_function(lambda: [db.check(i) for i in range(20)], ops=20)}
+    db.close_connection()
+    return result
+
+
+def bench_verify_query(work_dir, scale):
+    results = {}
+    for n_rows in [scaled(count, scale) for count in [100, 1000, 5000]]:
+        rows = [[i, '{:032x}'.format(i), 'file_{}'.format(i)] for i in range(n_rows)]
+        rows += rows[:n_rows // 100]  # Some duplicates.
+        results[str(n_rows)] = time_function(lambda: db_server_querying._verify_query(rows), repeat=3, ops=n_rows)
+    return results
+
+
+# Generate Cassandra console logs around the query time stamps, with stack traces.
+def generate_logs(n_queries, n_logs, seed=1):
+    rng = random.Random(seed)
+    query_effects = {}
+    for query_id in range(n_queries):
+        query_effects[str(query_id)] = {'timestamp': '10:{:02d}:{:02d}.{:06d}'.format(
+            query_id // 60 % 60, query_id % 60, rng.randint(0, 999999))}
+
+    logs = []
+    for _ in range(n_logs):
+        secs = rng.randint(0, 3600)
+        level = rng.choice(['INFO', 'WARN', 'WARN', 'ERROR'])
+        logs.append('{}  10:{:02d}:{:02d},{:03d} Some log message\n'.format(level, secs // 60 % 60, secs % 60,
+                                                                           rng.randint(0, 999)))
+        if level == 'ERROR':
+            logs += ['java.io.IOException: Corrupted file\n', '\tat org.apache.cassandra.Class.method\n']
+    return logs, query_effects
+
+
+def bench_log_results(work_dir, scale):
+    logs, query_effects = generate_logs(scaled(1000, scale), scaled(10000, scale))
+    try:
+        from fi_client import FIClient
+    except ImportError as e:
+        # The client needs paramiko, the correlation of _get_log_results is measured instead.
+        query_times = dict((int(query_id), effect['timestamp']) for query_id, effect in query_effects.items())
+        return {'target': 'LogCorrelator.correlate', 'reason': str(e), 'log_lines': len(logs),
+                'correlate': time_function(lambda: LogCorrelator(query_times).correlate(logs), ops=len(logs))}
+
+    # Only the db_type of a client is used, so no connections have to be created.
+    class ClientStandIn:
+        db_type = 'cassandra'
+
+    get_log_results = FIClient._get_log_results.im_func
+    return {'target': 'FIClient._get_log_results', 'log_lines': len(logs),
+            'correlate': time_function(lambda: get_log_results(ClientStandIn(), logs, query_effects),
+                                       ops=len(logs))}
+
+
+def bench_command(work_dir, scale, ssh_user=None, ssh_password=None):
+    n_commands = scaled(50, scale)
+    local_connection = LocalConnection('127.0.0.1')
+    results = {'local_connection': time_function(
+        lambda: [local_connection.execute_cmd('echo fi', print_output=False, debug=False)
+                 for _ in range(n_commands)], ops=n_commands)}
+
+    if ssh_user is not None:
+        from src.server_conn import SSHConnection
+        connection = SSHConnection('127.0.0.1', user=ssh_user, password=ssh_password)
+        results['ssh_localhost'] = time_function(
+            lambda: [connection.execute_cmd('echo fi', print_output=False, debug=False) for _ in range(n_commands)],
+            ops=n_commands)
+        connection.close_connection()
+    return results
+
+
+# Generate result records as stored by the result stores.
+def generate_results(n_results, n_queries, seed=1):
+    rng = random.Random(seed)
+    results = []
+    for run_id in range(n_results):
+        effects = {}
+        for query_id in range(n_queries):
+            effect = dict((col, 1 if rng.random() < 0.01 else 0) for col in
+                          ['read_failure', 'time_out', 'coordinator_failure', 'write_failure', 'invalid_request',
+                           'no_host_available', 'verification_errors', 'results_missing', 'duplicates'])
+            effect['timestamp'] = '10:00:{:02d}.{:06d}'.format(query_id % 60, rng.randint(0, 999999))
+            effects[str(query_id)] = effect
+        results.append({'res_id': 'bench', 'run_id': run_id, 'time': datetime.datetime.now().isoformat(),
+                        'effects': effects,
+                        'test_scenario': {'FI_type': 'bitflip', 'num_files': 1, 'flips_per_file': 1,
+                                          'target_files': ['/var/lib/cassandra/data/files/ma-1-big-Data.db'],
+                                          'injection_times': ['10:00:01.000000'],
+                                          'db_error_logs': ['ERROR  10:00:02 Corrupted file']}})
+    return results
+
+
+def bench_summarize(work_dir, scale):
+    results = generate_results(scaled(100, scale), 100)
+    return {'records': len(results),
+            'summarize_results': time_function(lambda: run_silent(lambda: summarize_results(results)),
+                                               repeat=3, ops=len(results)),
+            'summarize_run': time_function(lambda: [summarize_run(result) for result in results], ops=len(results))}
+
+
+benchmarks = [('bit_flip', bench_bit_flip), ('restore', bench_restore), ('verify_db', bench_verify_db),
+              ('verify_query', bench_verify_query), ('log_results', bench_log_results),
+              ('command', bench_command), ('summarize', bench_summarize)]
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=repo_dir,
+                                       stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Run the benchmarks, each in its own temporary work directory.
+def run_benchmarks(names=None, scale=1, ssh_user=None, ssh_password=None):
+    report = {'commit': get_git_commit(), 'time': datetime.datetime.now().isoformat(),
+              'python': platform.python_version(), 'platform': platform.platform(), 'scale': scale,
+              'benchmarks': {}}
+    cwd = os.getcwd()
+    for name, benchmark in benchmarks:
+        if names is not None and name not in names:
+            continue
+        print "Running benchmark: {}".format(name)
+        work_dir = tempfile.mkdtemp(prefix='fi-bench-')
+        os.chdir(work_dir)
+        try:
+            if name == 'command':
+                report['benchmarks'][name] = benchmark(work_dir, scale, ssh_user, ssh_password)
+            else:
+                report['benchmarks'][name] = benchmark(work_dir, scale)
+        except Exception as e:
+            report['benchmarks'][name] = {'error': '{}: {}'.format(type(e).__name__, e)}
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+
+# Flatten the timings of a report to {benchmark/timing: median}.
+def flatten_medians(results, prefix=''):
+    medians = {}
+    for key, val in results.items():
+        if isinstance(val, dict) and 'median' in val:
+            medians[prefix + key] = val['median']
+        elif isinstance(val, dict):
+            medians.update(flatten_medians(val, prefix + key + '/'))
+    return medians
+
+
+def print_comparison(report, old_report):
+    new_medians = flatten_medians(report['benchmarks'])
+    old_medians = flatten_medians(old_report['benchmarks'])
+    print "=== Compared with commit: {} ===".format(old_report.get('commit'))
+    for key in sorted(new_medians):
+        if key in old_medians and old_medians[key] > 0:
+            print "{:<45} {:>10.4f}s {:>10.4f}s {:>7.2f}x".format(key, old_medians[key], new_medians[key],
+                                                                  new_medians[key] / old_medians[key])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the overhead of the fault injection framework.")
+    parser.add_argument("-o", type=str, dest='output', help="json file to write the results to.")
+    parser.add_argument("-only", type=str, nargs='+', choices=[name for name, _ in benchmarks],
+                        help="only run these benchmarks.")
+    parser.add_argument("-quick", action='store_true',
+                        help="run the benchmarks on {}x smaller generated data.".format(int(1 / quick_scale)))
+    parser.add_argument("-scale", type=float, default=1.0, help="scale of the generated data.")
+    parser.add_argument("-compare", type=str, help="json results of an earlier run to compare with.")
+    parser.add_argument("-ssh-user", type=str, dest='ssh_user', help="also measure ssh round trips to localhost.")
+    parser.add_argument("-ssh-password", type=str, dest='ssh_password', help="password of the ssh user.")
+    args = parser.parse_args()
+
+    bench_report = run_benchmarks(args.only, scale=args.scale * quick_scale if args.quick else args.scale,
+                                  ssh_user=args.ssh_user, ssh_password=args.ssh_password)
+    output = args.output
+    if output is None:
+        output = os.path.join(repo_dir, 'benchmarks', 'results',
+                              '{}.json'.format((bench_report['commit'] or 'unknown')[:12]))
+    if not os.path.exists(os.path.dirname(os.path.abspath(output))):
+        os.makedirs(os.path.dirname(os.path.abspath(output)))
+    with io.open(output, 'w') as f:
+        f.write(unicode(json.dumps(bench_report, indent=2, sort_keys=True)))
+    print "Results written to: {}".format(output)
+
+    for bench_name, timing in sorted(flatten_medians(bench_report['benchmarks']).items()):
+        print "{:<45} {:>10.4f}s".format(bench_name, timing)
+    for bench_name, bench_result in sorted(bench_report['benchmarks'].items()):
+        if 'error' in bench_result:
+            print "{:<45} {}".format(bench_name, bench_result['error'])
+
+    if args.compare is not None:
+        with io.open(args.compare, 'r') as f:
+            print_comparison(bench_report, json.loads(f.read()))
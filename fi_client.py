@@ -38,15 +38,47 @@ Project structure:
     - Retrieving target files
     - Testing and querying the database following the test scenario
 - attach_strace.py (used SERVER side)
-    Program that finds a cassandra instance and attaches strace. Will kill itself
-    automatically when the cassandra process closes.
+    Program that finds a cassandra instance and attaches strace, or samples its
+    opened files via /proc. Will kill itself automatically when the cassandra
+    process closes.
 - server_comm.py (used CLIENT side)
     Program that creates a ssh wrapper to transfer files and executes commands.
     It executes all server communication.
 - utils.py (used CLIENT/SERVER side)
     Contains some json helper functions, time string to datetime converters.
+- log_correlation.py (used CLIENT/SERVER side)
+    Correlates the DBMS logs with the time windows of the executed queries.
+- log_tailer.py (used SERVER side)
+    Follows the DBMS container logs and prints structured log events.
+- stat_paths.py (used SERVER side, in the docker container)
+    Stats a batch of candidate target paths in a single docker exec call.
+- fault_plan.py (used CLIENT side)
+    Expands the scenarios into seeded fault plans of (file, offset, bit, delay)
+    entries, which are stored with the results and can be replayed.
+- campaign_metrics.py (used CLIENT side)
+    Live campaign metrics in the Prometheus text format, written to a file or
+    served at a local HTTP endpoint ("metrics" field).
+- local_conn.py (used CLIENT side)
+    Executes the commands of loopback hosts locally with the SSHConnection
+    interface, and copies or hard links the files instead of archiving them.
+- container_manager.py (used CLIENT side)
+    Finds the docker image and container ids and restarts the containers in
+    batches via the Docker Engine API, with cached ids ("docker_api" field).
+- docker_engine.py (used SERVER side)
+    Executes a batch of Docker Engine API operations over the docker socket,
+    including the CRIU checkpoints of the "checkpoint" restore backend.
+- workload.py (used SERVER side)
+    Expands the static queries and the seeded parameterized workload of the
+    query file into the executed queries.
+- phase_timing.py (used CLIENT side)
+    Times the phases of each run per host, the spans are stored with the results
+    and can be exported as a Chrome trace timeline.
+- target_selection.py (used CLIENT side)
+    Chooses the fault injection targets uniformly, or weighted by the read counts
+    of the file tracer ("target_selection" scenario field).
 - store_results_local.py (used CLIENT side)
-    Program that creates a mongodb wrapper to store results more easily.
+    Program that creates a mongodb wrapper to store results more easily. An
+    embedded SQLite result store can be selected with the "result_store" field.
 - verify_db.py (used SERVER side)
     Program that contains the SQLite verification database used on the server.
 
@@ -55,12 +87,16 @@ Project structure:
     A program that insert a bit flip given a program name and the number of flips
     to be inserted.
 - stuck_bit.py (used SERVER side)
-    NOTE: can not be used yet, parsing code has to be implemented yet.
+    Pins bits to 0 or 1 and re-asserts them in a bounded loop for a duration
+    ("FI_type": "stuck_bit" scenarios).
 
 === src/databases/ ===
 - cassandra/db_functions.py (used SERVER side)
     Program that created a cassandra DBSession, including key space. Also contains
     functions to load data sets.
+- cassandra/sstable_layout.py (used SERVER side)
+    Parses the SSTable components into a cached map of file regions, such as the
+    compressed chunks, chunk CRCs, index entries and bloom filters.
 
 FILE: fi_framework.py
 
@@ -83,21 +119,37 @@ EXAMPLE USAGE OF FIFramework object:
 >>>
 >>> # Now execute your defined fault scenario's.
 >>> fi_client.run_test_scenarios(host_index=0, commit_image=True)
+>>>
+>>> # Replay a single fault plan of an earlier campaign (with a "fault_plan" field).
+>>> fi_client.replay_fault_plan(plan_id, host_index=0)
 
 """
 
-import re
+import io
+import os
 import sys
 import json
-import random
 import time
 import datetime
 import uuid
 import install_server_deps
-from src import server_conn
-from src.utils import print_json, load_json_file, get_time_from_str
-from src.store_results_local import LocalDB
-from threading import Thread
+from src.local_conn import create_connection
+from src.utils import print_json, load_json_file, time_str_to_micros
+from src.log_correlation import LogCorrelator
+from src.target_selection import TargetSelector
+from src.fault_plan import create_scenario_plans, group_plan_injections, new_seed
+from src.store_results_local import create_local_db
+from src.phase_timing import PhaseTimer, monotonic
+from src.container_manager import ContainerManager, create_container_config, get_done_operations
+from src.campaign_metrics import CampaignMetrics
+from src.adaptive_repetitions import create_rate_estimator, classify_run
+from threading import Thread, Event
+
+# The restore backends which can be chosen in the server meta data: recreate the
+# containers, or resume them from a CRIU checkpoint of the warmed up DBMS.
+restore_backends = ['recreate', 'checkpoint']
+checkpoint_name = 'fi-warm'
+checkpoint_backup = 'fi-framework/checkpoint.tar.gz'
 
 
 # Create the docker run commands given a db_type.
@@ -125,6 +177,21 @@ def get_docker_run_command(node_id, ip, main_ip, db_port, db_type, docker_image_
     return run_cmd
 
 
+# Create the Docker Engine API config of a container, equal to the docker run command.
+def get_docker_container_config(node_id, ip, main_ip, db_port, db_type, docker_image_id, connection,
+                                use_volume=True):
+    config = None
+    if db_type == "cassandra":
+        env = ["CASSANDRA_BROADCAST_ADDRESS={}".format(ip)]
+        if node_id != 0:  # Non main cassandra nodes have to listen to the main 'gossip' host.
+            env.append("CASSANDRA_SEEDS={}".format(main_ip))
+        binds = []
+        if use_volume:
+            binds.append("{}fi-framework/db_data:/var/lib/cassandra".format(connection.get_user_dir()))
+        config = create_container_config(docker_image_id, env=env, binds=binds, ports=[db_port])
+    return config
+
+
 # Get the docker image id given an image name.
 def get_docker_image_id(connection, image_name, db_version='latest'):
     (images, _) = connection.execute_cmd('docker images', sudo=True)
@@ -160,10 +227,11 @@ def get_docker_container_id(connection, image_id, image_name, db_version='latest
 # - num_files: the number of files targeted with bit flips.
 # - start_delay_ms: a start delay in ms (optional)
 # - delay_ms: delay between each bit flip fault injection (optional)
-def start_fi_thread(fi_con, container_id, target_list, test_scenario, return_files, return_times):
+# The targets are chosen by the TargetSelector, optionally within a hot offset range.
+def start_fi_thread(fi_con, container_id, target_selector, test_scenario, return_files, return_times):
     flips_per_file = test_scenario['flips_per_file']
 
-    if len(target_list) == 0:
+    if len(target_selector) == 0:
         print "No fault injection targets found."
         return
 
@@ -172,22 +240,161 @@ def start_fi_thread(fi_con, container_id, target_list, test_scenario, return_fil
 
     num_files_to_target = test_scenario['num_files']
     while num_files_to_target != 0:
-        file_name = random.choice(target_list)
+        file_name, offset_range = target_selector.choose()
+        flip_cmd = "bit_flip.py {} {}".format(file_name, flips_per_file)
+        if offset_range is not None:
+            flip_cmd += " {} {}".format(*offset_range)
         try:
-            (out, r) = fi_con.execute_cmd("docker exec {} python ".format(container_id) +
-                                          "bit_flip.py {} {}".format(file_name, flips_per_file),
+            (out, r) = fi_con.execute_cmd("docker exec {} python ".format(container_id) + flip_cmd,
                                           sudo=True, print_output=False)
         except EOFError:
             continue
         if len(out) > 0 and "ValueError" in out[-1]:  # Target was empty, choose another file.
             continue
-        return_times.append(datetime.datetime.utcnow().strftime('%H:%M:%S'))
+        return_times.append(datetime.datetime.utcnow().strftime('%H:%M:%S.%f'))
         if 'delay_ms' in test_scenario:
             time.sleep(test_scenario['delay_ms'] * 0.001)
         return_files.append(file_name)
         num_files_to_target -= 1
 
 
+# Thread function which injects the faults of a fault plan. The flips of a file which
+# directly follow each other are inserted with a single bit flip call.
+def start_fi_plan_thread(fi_con, container_id, fault_plan, return_files, return_times):
+    if len(fault_plan['flips']) == 0:
+        print "No fault injection targets found."
+        return
+
+    for delay_ms, file_name, flips in group_plan_injections(fault_plan):
+        time.sleep(delay_ms * 0.001)
+        flip_args = " ".join("{} {}".format(offset, bit) for offset, bit in flips)
+        try:
+            (out, r) = fi_con.execute_cmd("docker exec {} python ".format(container_id) +
+                                          "bit_flip.py {} -o {}".format(file_name, flip_args),
+                                          sudo=True, print_output=False)
+        except EOFError:
+            continue
+        if len(out) > 0 and "ValueError" in out[-1]:  # The planned offset is not in the file.
+            continue
+        return_times.append(datetime.datetime.utcnow().strftime('%H:%M:%S.%f'))
+        return_files.append(file_name)
+
+
+# Create the stuck bit specifications of a stuck_bit scenario, given a fault plan or
+# the target selector. Offsets, bits and values which are None are chosen randomly
+# in the container.
+def get_stuck_bit_specs(test_scenario, target_selector=None, fault_plan=None):
+    if fault_plan is not None:
+        return [{'file': flip['file'], 'offset': flip['offset'], 'bit': flip['bit'], 'value': flip.get('value')}
+                for flip in fault_plan['flips']]
+
+    specs = []
+    for _ in range(test_scenario['num_files'] if len(target_selector) > 0 else 0):
+        file_name, offset_range = target_selector.choose()
+        specs += [{'file': file_name, 'range': offset_range, 'offset': None, 'bit': None,
+                   'value': test_scenario.get('stuck_value')} for _ in range(test_scenario['flips_per_file'])]
+    return specs
+
+
+# Get the params of the stuck bit loop in the container of a stuck_bit scenario.
+def get_stuck_bit_params(test_scenario, stuck_bit_specs):
+    return {'duration': test_scenario.get('stuck_duration_ms', 10000) * 0.001,
+            'interval': test_scenario.get('stuck_interval_ms', 10) * 0.001,
+            'bits': stuck_bit_specs}
+
+
+# Thread function which pins the stuck bits of a stuck_bit scenario. The bits are
+# re-asserted in the container every stuck_interval_ms for stuck_duration_ms. The
+# params are read from the params file in the container, which is None when there
+# are no stuck bits. The asserted bits and the summary of the re-assert loop are
+# added to return_details.
+def start_stuck_bit_thread(fi_con, container_id, params_path, test_scenario, return_files, return_times,
+                           return_details):
+    if params_path is None:
+        print "No fault injection targets found."
+        return
+
+    if 'start_delay_ms' in test_scenario:
+        time.sleep(test_scenario['start_delay_ms'] * 0.001)
+
+    return_times.append(datetime.datetime.utcnow().strftime('%H:%M:%S.%f'))
+    try:
+        (out, _) = fi_con.execute_cmd("docker exec {} python stuck_bit.py @{}".format(container_id, params_path),
+                                      sudo=True, print_output=False)
+    except EOFError:
+        return
+
+    for line in out:
+        try:
+            result = json.loads(line.strip("\r\n"))
+        except ValueError:  # Not a result, e.g. an echoed sudo prompt.
+            continue
+        if isinstance(result, list):
+            return_details['stuck_bits'] = result
+            return_files.extend(sorted(set(stuck_bit[0] for stuck_bit in result)))
+        elif isinstance(result, dict):
+            return_details['stuck_bit_loop'] = result
+
+
+# Thread function which reads the structured log events of a live log tailer. The
+# detection latency in seconds since the last fault injection is added to each event.
+# When stop_callback is given, it is called once on an event with one of the stop_levels.
+def start_log_tail_thread(tail_stdout, injection_times, return_events, stop_callback=None,
+                          stop_levels=('ERROR', 'FATAL')):
+    for line in iter(tail_stdout.readline, ''):
+        try:
+            event = json.loads(line.strip("\r\n"))
+        except ValueError:  # Not an event, e.g. an echoed sudo prompt.
+            continue
+        # An event printed early is updated with the stack lines which followed.
+        if event.get('update', False):
+            for earlier_event in reversed(return_events):
+                if earlier_event['timestamp'] == event['timestamp'] and \
+                   earlier_event['message'] == event['message']:
+                    earlier_event['stack'] = event['stack']
+                    break
+            continue
+        received = datetime.datetime.utcnow().strftime('%H:%M:%S.%f')
+        event['received'] = received
+        if len(injection_times) > 0:
+            latency = time_str_to_micros(received) - time_str_to_micros(injection_times[-1])
+            event['detection_latency'] = latency * 10 ** -6
+        return_events.append(event)
+
+        if stop_callback is not None and event['level'] in stop_levels:
+            print "=== {} detected, stopping the run early ===".format(event['level'])
+            stop_callback()
+            stop_callback = None
+
+
+# Request the test query command to stop after its current query, with a stop line on
+# its stdin. The command still prints the results of the executed queries. The time
+# of the request is added to stop_times.
+def request_query_stop(query_stdin, stop_times):
+    stop_times.append(datetime.datetime.utcnow().strftime('%H:%M:%S.%f'))
+    try:
+        query_stdin.write('stop\n')
+        query_stdin.flush()
+    except (IOError, OSError):  # The query command already finished.
+        pass
+
+
+# Parse the removed and restored file counts printed by the restore command.
+def parse_restore_stats(out):
+    try:
+        return json.loads(out[-1].strip("\r\n"))
+    except (ValueError, IndexError):
+        return {}
+
+
+# Count the query time outs in the results of the test queries.
+def count_query_timeouts(server_results):
+    if not isinstance(server_results, dict):
+        return 0
+    return sum(query_effect.get('time_out', 0) for query_effect in server_results.values()
+               if isinstance(query_effect, dict))
+
+
 class FIClient:
     # To be modified to the number of different database types implemented.
     implemented_db_types = ['cassandra']
@@ -205,6 +412,7 @@ class FIClient:
 
         self.image_ids, self.container_ids = [], []
         self.backup_image_ids, self.backup_container_ids = [], []
+        self.readiness = []
 
         # Parse the file to get the file with all example data.
         self.db_port = None
@@ -218,6 +426,26 @@ class FIClient:
         if self.db_type == "cassandra":
             self.db_port = 7000
 
+        # The file tracer backend used to find the fault injection targets.
+        self.file_tracer = self.fi_file_json['file_tracer'] if 'file_tracer' in self.fi_file_json else 'strace'
+
+        # The local result store backend, MongoDB is used when none is given.
+        self.result_store_meta = self.fi_file_json['result_store'] if 'result_store' in self.fi_file_json else None
+
+        # The faults are planned ahead from a seed when a fault plan is given. A new seed
+        # is created when none is given, it is recorded with the plans.
+        self.fault_plan_meta = self.fi_file_json['fault_plan'] if 'fault_plan' in self.fi_file_json else None
+        if self.fault_plan_meta is not None and 'seed' not in self.fault_plan_meta:
+            self.fault_plan_meta['seed'] = new_seed()
+
+        # The timer of the run phases of a campaign, created when the test runs are prepared.
+        self.campaign_timer = None
+
+        # The live campaign metrics, exported to a file and/or a local HTTP endpoint
+        # when a metrics field is given.
+        metrics_meta = self.fi_file_json['metrics'] if 'metrics' in self.fi_file_json else {}
+        self.metrics = CampaignMetrics(metrics_file=metrics_meta.get('file'), port=metrics_meta.get('port'))
+
         # Initialize the connections from the server meta data.
         self._create_server_connections(self.fi_file_json['server_meta'])
 
@@ -266,11 +494,26 @@ class FIClient:
         else:
             self.passwords = [None] * self.n_nodes
 
+        # Loopback hosts can be executed locally instead of via SSH, see local_conn.py.
+        executor = server_meta['executor'] if 'executor' in server_meta else 'auto'
         for i in range(self.n_nodes):
-            conn = server_conn.SSHConnection(self.hosts[i], port=self.server_port,
-                                             user=self.users[i], password=self.passwords[i])
+            conn = create_connection(self.hosts[i], port=self.server_port, user=self.users[i],
+                                     password=self.passwords[i], executor=executor)
             self.ssh_connections.append(conn)
 
+        # The containers are managed via the Docker Engine API, unless the CLI is chosen.
+        self.container_managers = None
+        if server_meta.get('docker_api', 'engine') == 'engine':
+            self.container_managers = [ContainerManager(conn) for conn in self.ssh_connections]
+
+        self.restore_backend = server_meta.get('restore_backend', 'recreate')
+        if self.restore_backend not in restore_backends:
+            raise ValueError('Unknown restore backend: {}, implemented: {}'.format(self.restore_backend,
+                                                                                 restore_backends))
+        # Per host whether its container is resumed from a checkpoint, set by _create_checkpoints.
+        self.checkpoints = None
+        self.metrics.set_connections(self.ssh_connections)
+
     # Setup the framework on the servers, and transfer all framework files over.
     def setup_framework(self, install_server_dependencies=False):
         for i in range(self.n_nodes):
@@ -294,15 +537,16 @@ class FIClient:
         self.image_ids, self.container_ids = [], []
 
         # When starting up each docker container, its id is returned.
-        for startup_cmd, connection in zip(docker_startup_cmds, self.ssh_connections):
+        for host_index, (startup_cmd, connection) in enumerate(zip(docker_startup_cmds, self.ssh_connections)):
             if execute_startup:
                 connection.execute_cmd(startup_cmd, sudo=True)
 
             # Retrieve image id from created docker instance.
-            image_id = get_docker_image_id(connection, '{}-node'.format(self.db_type),
-                                           self.db_version)
+            if self.container_managers is not None:
+                self.container_managers[host_index].clear_cache()
+            image_id = self._get_image_id(host_index, '{}-node'.format(self.db_type), self.db_version)
             if image_id is None:
-                image_id = get_docker_image_id(connection, self.db_type, self.db_version)
+                image_id = self._get_image_id(host_index, self.db_type, self.db_version)
 
             container_id = None
             # Check if a id is found.
@@ -311,8 +555,7 @@ class FIClient:
                 print "Look at the above output of the executed startup command."
                 print "Trying to continue."
             else:
-                container_id = get_docker_container_id(connection, image_id, self.db_type,
-                                                       self.db_version)
+                container_id = self._get_container_id(host_index, image_id, self.db_type, self.db_version)
 
             self.image_ids.append(image_id)
             self.container_ids.append(container_id)
@@ -403,7 +646,90 @@ class FIClient:
     def run_test_scenarios(self, host_index=0, commit_image=True):
         start = time.time()
         connection, _, connect_dir = self.get_host_info(host_index)
+        query_cmd = self._prepare_test_runs(host_index, commit_image)
+        if query_cmd is None:
+            return
+
+        # Run all test scenarios a number of repetitions times. When the scenario is running,
+        # a fault injector thread is started as the database is queried again. The server will
+        # verify the results from the initialized mysql database.
+        #
+        # Afterwards all experiment results are saved in the local MongoDB database. Next the
+        # database docker image and the database volume is restored again. Up till all
+        # repetitions are finished. With adaptive repetitions a scenario stops as soon as
+        # its outcome rates are estimated with the target precision.
+        test_scenarios = self.fi_file_json['test_scenarios']
+        adaptive_meta = test_scenarios.get('adaptive_repetitions')
+        print "=== Starting {} test scenarios ===".format(len(test_scenarios['scenarios']))
+        for scenario_id in range(len(test_scenarios['scenarios'])):
+            result_uuid = uuid.uuid4()
+            print "=== Scenario run id: {} ===".format(result_uuid)
+            cur_container_id = self.backup_container_ids[host_index]
+            target_list = self._get_possible_targets(scenario_id, connection, cur_container_id, host_index)
+            test_scenario = test_scenarios['scenarios'][scenario_id]
+            target_selector = self._get_target_selector(test_scenario, target_list, host_index)
+            rate_estimator = None
+            test_repetitions = test_scenarios['repetitions']
+            if adaptive_meta is not None:
+                rate_estimator = create_rate_estimator(adaptive_meta, test_repetitions)
+                test_repetitions = rate_estimator.max_repetitions
+
+            # Expand the scenario into the fault plans of all repetitions beforehand.
+            fault_plans = None
+            if self.fault_plan_meta is not None:
+                fault_plans = self._create_fault_plans(scenario_id, test_scenario, target_selector,
+                                                       test_repetitions, cur_container_id, host_index)
+            for run_id in range(test_repetitions):
+                fault_plan = None
+                if fault_plans is not None:
+                    if run_id not in fault_plans:
+                        print "=== Skipping run: {}/{}, plan already evaluated ===".format(run_id + 1,
+                                                                                         test_repetitions)
+                        continue
+                    fault_plan = fault_plans[run_id]
+
+                print "=== Starting run: {}/{} ===".format(run_id + 1, test_repetitions)
+                run_records = []
+                if not self._execute_run(host_index, query_cmd, test_scenario, target_selector,
+                                         result_uuid, run_id, fault_plan, run_records):
+                    return
+                if rate_estimator is not None and len(run_records) > 0:
+                    rate_estimator.add_run(run_records[0]['run_outcome'])
+                    if rate_estimator.should_stop():
+                        print "=== Stopping scenario after {} runs, converged: {} ===".format(
+                            rate_estimator.n_runs, rate_estimator.is_converged())
+                        rate_estimator.print_estimates()
+                        break
+        print "=== Finished scenarios ==="
+        print "Took: {} seconds".format(time.time() - start)
+        self.campaign_timer.print_totals()
+
+    # Replay a single fault plan entry of an earlier campaign, stored in the result store.
+    # The backup containers of the campaign are reused. The result is stored with a new
+    # res_id, and the test scenario is marked with the replayed plan id.
+    def replay_fault_plan(self, plan_id, host_index=0):
+        local_result_db = create_local_db(self.local_database_name, self.result_store_meta)
+        fault_plans = list(local_result_db.query_fault_plans({'plan_id': plan_id}))
+        if len(fault_plans) == 0:
+            print "=== Unknown fault plan: {} ===".format(plan_id)
+            return
+
+        query_cmd = self._prepare_test_runs(host_index, commit_image=False)
+        if query_cmd is None:
+            return
+        fault_plan = fault_plans[0]
+        test_scenario = dict(self.fi_file_json['test_scenarios']['scenarios'][fault_plan['scenario_id']])
+        test_scenario['replay_of'] = plan_id
+        result_uuid = uuid.uuid4()
+        print "=== Replaying fault plan {} with run id: {} ===".format(plan_id, result_uuid)
+        self._execute_run(host_index, query_cmd, test_scenario, None, result_uuid, fault_plan['run_id'], fault_plan)
+
+    # Prepare the backup containers and the file tracer for the test runs, and create the
+    # test query command. None is returned when the DBMS cluster is not available.
+    def _prepare_test_runs(self, host_index=0, commit_image=True):
         self.backup_image_ids, self.backup_container_ids = [], []
+        self.campaign_timer = PhaseTimer(on_span=self.metrics.observe_span)
+        self.metrics.start()
 
         if commit_image:
             # Commit and backup all containers, the host_index variable only is used
@@ -416,106 +742,205 @@ class FIClient:
         else:  # Obtain the backup ids from the running backups.
             image_name = '{}-backup'.format(self.db_type)
             for i in range(self.n_nodes):
-                temp_connection = self.ssh_connections[i]
-                backup_image_id = get_docker_image_id(temp_connection, image_name, db_version='1.0')
-                backup_container_id = get_docker_container_id(temp_connection, backup_image_id, image_name, '1.0')
+                backup_image_id = self._get_image_id(i, image_name, db_version='1.0')
+                backup_container_id = self._get_container_id(i, backup_image_id, image_name, '1.0')
                 self.backup_image_ids.append(backup_image_id)
                 self.backup_container_ids.append(backup_container_id)
                 self._prepare_fi_host(backup_container_id, host_index=i)
 
         if len(self.backup_container_ids) == 0 or None in self.backup_container_ids:
             print "=== Something went wrong with retrieving backup docker ids of DBMS cluster. ==="
-            return
+            return None
 
         # Ensure all cassandra instances can be queried.
         if not self.ensure_all_running():
             print "=== Timeout on waiting on database connections. ==="
-            return
+            return None
 
         # Create query_cmd.
         query_cmd = self._get_db_querying_cmd()
         test_cmd = {'type': 'test'}
-        test_scenarios = self.fi_file_json['test_scenarios']
-        test_repetitions = test_scenarios['repetitions']
-        test_cmd['data_type'] = test_scenarios['data_type']
+        test_cmd['data_type'] = self.fi_file_json['test_scenarios']['data_type']
+        # Optionally execute all test queries on a single node, instead of routing them to
+        # the replicas of each partition.
+        if 'query_node' in self.fi_file_json['test_scenarios']:
+            test_cmd['node_ip'] = self.fi_file_json['db_meta']['connection_ip'][
+                self.fi_file_json['test_scenarios']['query_node']]
         query_cmd += " {} '{}'".format(host_index, json.dumps(test_cmd))
 
         self.setup_framework(False)
+        if self._create_checkpoints(host_index, query_cmd) and not self.ensure_all_running():
+            print "=== Timeout on waiting on the database connections after the checkpoints. ==="
+            return None
         self.start_db_file_tracer(host_index)
-
-        # Run all test scenarios a number of repetitions times. When the scenario is running,
-        # a fault injector thread is started as the database is queried again. The server will
-        # verify the results from the initialized mysql database.
-        #
-        # Afterwards all experiment results are saved in the local MongoDB database. Next the
-        # database docker image and the database volume is restored again. Up till all
-        # repetitions are finished.
-        print "=== Starting {} test scenarios ===".format(len(test_scenarios['scenarios']))
-        for scenario_id in range(len(test_scenarios['scenarios'])):
-            result_uuid = uuid.uuid4()
-            print "=== Scenario run id: {} ===".format(result_uuid)
-            cur_container_id = self.backup_container_ids[host_index]
-            target_list = self._get_possible_targets(scenario_id, connection, cur_container_id, host_index)
-            test_scenario = test_scenarios['scenarios'][scenario_id]
-            for run_id in range(test_repetitions):
-                print "=== Starting run: {}/{} ===".format(run_id + 1, test_repetitions)
-                print "=== Ensuring all {}:{} instances are running ===".format(self.db_type, self.db_version)
-                if not self.ensure_all_running():
-                    print "=== Timeout on waiting on database reconnection. ==="
-                    return
-
-                cur_container_id = self.backup_container_ids[host_index]
-                targeted_files = []
-                injection_times = []
-                fi_thread = Thread(target=start_fi_thread,
-                                   args=(connection, cur_container_id, target_list, test_scenario,
-                                         targeted_files, injection_times,))
-
-                print "=== Starting the fault injector and db queries ==="
-                # Return streams, so that the io is asynchronous.
-                (stdin, stdout, stderr) = connection.execute_cmd(query_cmd, return_streams=True)
-                fi_thread.start()
-                out = stdout.readlines()
-                fi_thread.join()
-                server_results = []
-                try:
-                    server_results = json.loads(out[-1].strip("\r\n").strip("'"))
-                except ValueError:
-                    print out
-                stdin.close(), stderr.close(), stdout.close()
-                time.sleep(5.0)
-                (logs, _) = connection.execute_cmd("docker logs {}".format(cur_container_id),
-                                                   sudo=True, print_output=False)
-                result_assemble_thread = Thread(target=self._assemble_results_thread,
-                                                args=(test_scenario, logs, server_results, targeted_files,
-                                                      injection_times, result_uuid, run_id,))
-                result_assemble_thread.start()
-                print "=== Finished run, restoring everything ==="
-
-                db_ips = self.fi_file_json['db_meta']['connection_ip']
-                main_ip = db_ips[host_index]
-                for i in range(self.n_nodes):
-                    sec_connection = self.ssh_connections[i]
-                    backup_id = self.backup_container_ids[i]
-                    sec_connection.execute_cmd('docker stop {}'.format(backup_id), sudo=True)
-                    sec_connection.execute_cmd('docker rm {}'.format(backup_id), sudo=True)
-                    self._restore_tar_backup(host_index=i)
-
-                    # Restore docker by stopping and running command again with all data.
-                    run_cmd = get_docker_run_command(i, db_ips[i], main_ip, self.db_port,
-                                                     self.db_type, self.backup_image_ids[i], sec_connection,
-                                                     load_image=True)
-
+        return query_cmd
+
+    # Execute a single run of a test scenario, and restore the DBMS cluster afterwards. The
+    # faults are inserted following the fault plan when given, else they are chosen by the
+    # target selector. The stored result record of the run is added to return_records.
+    # False is returned when the DBMS cluster is not available.
+    def _execute_run(self, host_index, query_cmd, test_scenario, target_selector, result_uuid, run_id,
+                     fault_plan=None, return_records=None):
+        # The phases of the run are timed per host, and stored with the result.
+        timer = PhaseTimer(parent=self.campaign_timer)
+        connection = self.ssh_connections[host_index]
+        print "=== Ensuring all {}:{} instances are running ===".format(self.db_type, self.db_version)
+        with timer.span('readiness_wait', host_index):
+            if not self.ensure_all_running():
+                print "=== Timeout on waiting on database reconnection. ==="
+                return False
+        # The test scenario is shared by all repetitions, the fields of this run are set on a copy.
+        test_scenario = dict(test_scenario, time_to_ready=[result['time_to_ready'] for result in self.readiness])
+
+        cur_container_id = self.backup_container_ids[host_index]
+        run_start = self._get_server_time(host_index)
+        targeted_files = []
+        injection_times = []
+        fault_details = {}
+        if test_scenario.get('FI_type') == 'stuck_bit':
+            stuck_bit_specs = get_stuck_bit_specs(test_scenario, target_selector, fault_plan)
+            params_path = None
+            if len(stuck_bit_specs) > 0:
+                params_path = self._transfer_container_params(cur_container_id,
+                                                              get_stuck_bit_params(test_scenario, stuck_bit_specs),
+                                                              'stuck_bit_params.json', host_index)
+            fi_thread = Thread(target=timer.timed('injection', start_stuck_bit_thread, host_index),
+                               args=(connection, cur_container_id, params_path, test_scenario,
+                                     targeted_files, injection_times, fault_details,))
+        elif fault_plan is not None:
+            fi_thread = Thread(target=timer.timed('injection', start_fi_plan_thread, host_index),
+                               args=(connection, cur_container_id, fault_plan, targeted_files, injection_times,))
+        else:
+            fi_thread = Thread(target=timer.timed('injection', start_fi_thread, host_index),
+                               args=(connection, cur_container_id, target_selector, test_scenario,
+                                     targeted_files, injection_times,))
+
+        # Optionally follow the DBMS logs while the faults are injected.
+        stop_on_fatal = test_scenario.get('stop_on_fatal', False)
+        log_events, tail_thread, tail_streams, stop_times = [], None, None, []
+        if test_scenario.get('live_log_tail', False) or stop_on_fatal:
+            tail_streams = self.start_log_tail(cur_container_id, since=run_start, host_index=host_index)
+
+        print "=== Starting the fault injector and db queries ==="
+        with timer.span('query', host_index):
+            # Return streams, so that the io is asynchronous.
+            (stdin, stdout, stderr) = connection.execute_cmd(query_cmd, return_streams=True)
+            if tail_streams is not None:
+                stop_callback = None
+                if stop_on_fatal:
+                    stop_callback = lambda: request_query_stop(stdin, stop_times)
+                tail_thread = Thread(target=start_log_tail_thread,
+                                     args=(tail_streams[1], injection_times, log_events, stop_callback,))
+                tail_thread.start()
+            fi_thread.start()
+            out = stdout.readlines()
+        fi_thread.join()
+        server_results = []
+        try:
+            server_results = json.loads(out[-1].strip("\r\n").strip("'"))
+        except (ValueError, IndexError):
+            print out
+        if len(stop_times) > 0:
+            # The early stop is recorded with the fault details of the run.
+            fault_details['stopped_early'] = {'time': stop_times[0], 'executed_queries': len(server_results)}
+        stdin.close(), stderr.close(), stdout.close()
+        if tail_thread is not None:
+            tail_streams[1].channel.close()
+            tail_thread.join()
+        with timer.span('log_settle', host_index):
+            time.sleep(5.0)
+        with timer.span('log_fetch', host_index):
+            logs = self._collect_db_logs(cur_container_id, since=run_start, host_index=host_index)
+
+        # The result is stored when the restore is done, so its spans are stored as well.
+        restore_done = Event()
+        self.metrics.change_backlog(1)
+        result_assemble_thread = Thread(target=self._assemble_results_thread,
+                                        args=(test_scenario, logs, server_results, targeted_files,
+                                              injection_times, result_uuid, run_id, log_events, fault_plan,
+                                              fault_details, timer, host_index, restore_done, return_records,))
+        result_assemble_thread.start()
+        print "=== Finished run, restoring everything ==="
+
+        # The result is also stored when a restore step fails, as it waits till the restore is done.
+        try:
+            db_ips = self.fi_file_json['db_meta']['connection_ip']
+            main_ip = db_ips[host_index]
+            for i in range(self.n_nodes):
+                sec_connection = self.ssh_connections[i]
+                backup_id = self.backup_container_ids[i]
+
+                # Resume the container from its checkpoint, and recreate it when that fails.
+                if self.checkpoints is not None and self.checkpoints[i]:
+                    if self._restore_checkpoint(i, timer):
+                        continue
+                    self.checkpoints[i] = False
+
+                # Restore the container in a single batch via the Docker Engine API, and fall
+                # back to the docker CLI when it fails. The CLI skips the steps of the batch
+                # which succeeded.
+                engine_done = set()
+                if self.container_managers is not None and self.container_managers[i].available:
+                    (container_id, results) = self._recreate_backup_container(i, main_ip, timer)
+                    if container_id is not None:
+                        self.backup_container_ids[i] = container_id
+                        continue
+                    engine_done = get_done_operations(results)
+
+                if 'remove' not in engine_done:
+                    with timer.span('container_stop', i):
+                        sec_connection.execute_cmd('docker stop {}'.format(backup_id), sudo=True)
+                    with timer.span('container_rm', i):
+                        sec_connection.execute_cmd('docker rm {}'.format(backup_id), sudo=True)
+                if 'command' not in engine_done:
+                    with timer.span('tar_restore', i):
+                        self.metrics.add_restore(self._restore_tar_backup(host_index=i))
+
+                # Restore docker by stopping and running command again with all data.
+                run_cmd = get_docker_run_command(i, db_ips[i], main_ip, self.db_port,
+                                                 self.db_type, self.backup_image_ids[i], sec_connection,
+                                                 load_image=True)
+
+                with timer.span('container_start', i):
                     (container_id, _) = sec_connection.execute_cmd(run_cmd, sudo=True)
-                    self.backup_container_ids[i] = container_id[:12]
-                result_assemble_thread.join()
-                self.start_db_file_tracer(host_index)
-        print "=== Finished scenarios ==="
-        print "Took: {} seconds".format(time.time() - start)
+                self.backup_container_ids[i] = container_id[:12]
+        finally:
+            restore_done.set()
+        result_assemble_thread.join()
+        self.start_db_file_tracer(host_index)
+        self.metrics.add_run(n_injections=len(targeted_files), n_timeouts=count_query_timeouts(server_results))
+        return True
 
+    # Create the fault plans of all repetitions of a scenario from the recorded seed, and
+    # store them. Returned as {run_id: plan}, without the already evaluated plans when
+    # skip_evaluated is set.
+    def _create_fault_plans(self, scenario_id, test_scenario, target_selector, repetitions,
+                            container_id, host_index=0):
+        file_sizes = dict((path, path_stat['size']) for path, path_stat in
+                          self.stat_container_paths(container_id, target_selector.target_list, host_index).items()
+                          if path_stat['exists'])
+        plans = create_scenario_plans(self.fault_plan_meta['seed'], scenario_id, test_scenario, target_selector,
+                                      file_sizes, repetitions)
+
+        local_result_db = create_local_db(self.local_database_name, self.result_store_meta)
+        local_result_db.insert_fault_plans(plans)
+        evaluated_plan_ids = set()
+        if self.fault_plan_meta.get('skip_evaluated', False):
+            evaluated_plan_ids = local_result_db.get_evaluated_plan_ids()
+        print "=== Fault plans with seed: {}, {} already evaluated ===".format(
+            self.fault_plan_meta['seed'], len([plan for plan in plans if plan['plan_id'] in evaluated_plan_ids]))
+        return dict((plan['run_id'], plan) for plan in plans if plan['plan_id'] not in evaluated_plan_ids)
+
+    # Thread function which stores the result record of a run: a copy of the test scenario
+    # with the injected faults, the correlated logs and the outcome of the run. The record
+    # is added to return_records when given.
     def _assemble_results_thread(self, test_scenario, logs, server_results,
-                                 targeted_files, injection_times, result_uuid, run_id):
-        local_result_db = LocalDB(self.local_database_name)
+                                 targeted_files, injection_times, result_uuid, run_id, log_events=None,
+                                 fault_plan=None, fault_details=None, timer=None, host_index=0, restore_done=None,
+                                 return_records=None):
+        local_result_db = create_local_db(self.local_database_name, self.result_store_meta)
+        if timer is None:
+            timer = PhaseTimer()
 
         # Insert the results from the scenario run.
         def insert_scenario_result(run_res_id, res_id, test_scenario_data, server_result):
@@ -525,69 +950,209 @@ class FIClient:
                                              db_meta, dataset, test_scenario_data, server_result,
                                              run_res_id, res_id)
 
-        db_logs = self._get_log_results(logs, server_results)
-        test_scenario['target_files'] = targeted_files
-        test_scenario['injection_times'] = injection_times
-        test_scenario['db_error_logs'] = db_logs
-        insert_scenario_result(run_id, result_uuid, test_scenario, server_results)
-
-    # Retrieve the logging results of the databases.
+        with timer.span('result_assembly', host_index):
+            db_logs, db_log_query_ids = self._get_log_results(logs, server_results)
+            # The test scenario is shared by all repetitions, so the fields of a run may not
+            # leak into the records of the later runs.
+            run_record = dict(test_scenario)
+            run_record['target_files'] = targeted_files
+            run_record['injection_times'] = injection_times
+            run_record['db_error_logs'] = db_logs
+            run_record['db_error_log_queries'] = db_log_query_ids
+            run_record['run_outcome'] = classify_run(server_results, db_logs)
+            if log_events is not None:
+                run_record['db_log_events'] = log_events
+            if fault_details is not None:
+                run_record.update(fault_details)
+            if fault_plan is not None:
+                run_record['plan_id'] = fault_plan['plan_id']
+                run_record['fault_plan_seed'] = fault_plan['seed']
+                run_record['fault_plan'] = fault_plan['flips']
+
+        if restore_done is not None:
+            restore_done.wait()
+        run_record['phase_timing'] = timer.to_dict()
+        insert_scenario_result(run_id, result_uuid, run_record, server_results)
+        if fault_plan is not None:
+            local_result_db.set_plan_evaluated(fault_plan['plan_id'], result_uuid, run_id)
+        if return_records is not None:
+            return_records.append(run_record)
+        if restore_done is not None:
+            self.metrics.change_backlog(-1)
+
+    # Retrieve the logging results of the databases, and the ids of the queries
+    # that were executed within the interval (in secs) of each log.
     def _get_log_results(self, logs, query_effects, interval=3):
         errors = []
         if self.db_type == "cassandra":
-
-            delta_time_pairs = []
+            query_times = {}
             # A list is received when it was not possible to retrieve any
             # results from the DBMS.
             if isinstance(query_effects, dict):
-                for query_res in query_effects.values():
-                    # Check if there is an error with this query, if not the interval is
-                    # not really interesting to search for warnings.
-                    # if sum([val for val in query_res.values() if isinstance(val, int)]) == 0:
-                    #     continue
-                    timestamp = get_time_from_str(query_res['timestamp'], return_list=True)
-                    if len(timestamp) > 3:
-                        timestamp = datetime.datetime(1, 1, 1, timestamp[0], timestamp[1], timestamp[2], timestamp[3])
-                    else:
-                        timestamp = datetime.datetime(1, 1, 1, timestamp[0], timestamp[1], timestamp[2])
-                    delta_time_pairs.append([(timestamp - datetime.timedelta(seconds=interval)).time(),
-                                             (timestamp + datetime.timedelta(seconds=interval)).time()])
-
-            # Expression to analyse the Cassandra database logs:
-            # WARN  10:19:29  the log message.
-            # It extracts the timestamp and warning.
-            log_regex = re.compile('(WARN|ERROR|FATAL)\s*([0-9]{2}:[0-9]{2}:[0-9]{2})')
-            log_starts = re.compile('WARN|ERROR|FATAL|INFO')
-
-            for i in range(len(logs)):
-                result = log_regex.match(logs[i])
-
-                if result is not None:
-                    message, log_time = result.groups()
-                    # All fatal or error logs are retrieved.
-                    if message in ['ERROR', 'FATAL']:
-                        errors.append(logs[i].strip())
-                    else:
-                        # Extract only relevant warning logs.
-                        log_time = get_time_from_str(log_time)
-                        for time_min, time_max in delta_time_pairs:
-                            if time_min <= log_time <= time_max:
-                                errors.append(logs[i].strip())
-                # Check if a new log is starting or maybe the current log is continuing.
-                # This can happen with stack traces which are split on multi lines.
-                elif log_starts.match(logs[i]) is None and len(errors) > 0:
-                    # Just append to the last string all other additional information.
-                    errors[-1] += logs[i]
-
-        return errors
+                for query_id, query_res in query_effects.items():
+                    query_times[int(query_id)] = query_res['timestamp']
+            errors = LogCorrelator(query_times, interval=interval).correlate(logs)
+
+        return [log for log, _ in errors], [query_ids for _, query_ids in errors]
 
+    # Start the live log tailer of a container on a host, which prints a JSON log event
+    # per line. The streams of the command are returned.
+    def start_log_tail(self, container_id, since=None, host_index=0):
+        connection, _, connection_dir = self.get_host_info(host_index)
+        tail_cmd = 'python {}src/log_tailer.py {}'.format(connection_dir, container_id)
+        if since is not None:
+            tail_cmd += ' {}'.format(since)
+        return connection.execute_cmd(tail_cmd, sudo=True, return_streams=True)
+
+    # Get the current unix time stamp of a host, as used by the docker --since option.
+    def _get_server_time(self, host_index=0):
+        (out, _) = self.ssh_connections[host_index].execute_cmd('date +%s.%N', print_output=False)
+        return out[-1].strip() if len(out) > 0 else None
+
+    # Only retrieve the relevant docker log lines of a container written since the
+    # given server time stamp. The lines are filtered on the server.
+    def _collect_db_logs(self, container_id, since=None, host_index=0):
+        run_params = {'type': 'collect_logs', 'container_id': container_id}
+        if since is not None:
+            run_params['since'] = since
+        logs_cmd = self._get_db_querying_cmd() + " {} '{}'".format(host_index, json.dumps(run_params))
+        (logs, _) = self.ssh_connections[host_index].execute_cmd(logs_cmd, sudo=True, print_output=False)
+        return logs
+
+    # Restore the data directory of a host from the backup tar. The number of removed
+    # and restored files and the restored bytes are returned.
     def _restore_tar_backup(self, host_index=0):
+        (out, _) = self.ssh_connections[host_index].execute_cmd(self._get_restore_cmd(host_index), sudo=True,
+                                                                print_output=False)
+        return parse_restore_stats(out)
+
+    def _get_restore_cmd(self, host_index=0, backup='fi-framework/backup.tar.gz'):
         restore_cmd = {
             "type": "restore",
-            "backup": "fi-framework/backup.tar.gz",
+            "backup": backup,
             "data": "fi-framework/db_data"}
-        restore_cmd = self._get_db_querying_cmd() + " {} '{}'".format(host_index, json.dumps(restore_cmd))
-        self.ssh_connections[host_index].execute_cmd(restore_cmd, sudo=True, print_output=False)
+        return self._get_db_querying_cmd() + " {} '{}'".format(host_index, json.dumps(restore_cmd))
+
+    # Stop and remove the backup container of a host, restore the data directory and start
+    # a new container in a single Docker Engine API batch. The spans of the operations are
+    # recorded one after the other from the start of the batch. The new container id,
+    # None when the container could not be started, and the results are returned.
+    def _recreate_backup_container(self, host_index, main_ip, timer):
+        connection = self.ssh_connections[host_index]
+        db_ip = self.fi_file_json['db_meta']['connection_ip'][host_index]
+        config = get_docker_container_config(host_index, db_ip, main_ip, self.db_port, self.db_type,
+                                             self.backup_image_ids[host_index], connection)
+        start = monotonic()
+        (container_id, results) = self.container_managers[host_index].recreate(
+            self.backup_container_ids[host_index], config, commands=[self._get_restore_cmd(host_index)])
+        if results is None:
+            return None, results
+
+        self._record_engine_results(host_index, results, start, timer,
+                                    {'stop': 'container_stop', 'remove': 'container_rm', 'command': 'tar_restore',
+                                     'create': 'container_create', 'start': 'container_start'})
+        return container_id, results
+
+    # Record the spans of the Docker Engine API operations one after the other from the
+    # start of the batch, with the phase of each operation.
+    def _record_engine_results(self, host_index, results, start, timer, phases):
+        for result in results:
+            timer.record(phases[result['op']], start, start + result['duration'], host_index)
+            start += result['duration']
+            if 'error' in result:
+                print "Docker engine {} failed: {}".format(result['op'], result['error'])
+            elif result['op'] == 'command' and phases['command'] == 'tar_restore':
+                self.metrics.add_restore(parse_restore_stats(result['output']))
+
+    # Checkpoint the warmed up DBMS containers with CRIU, together with an archive of their
+    # data directories, so each run resumes the warm DBMS instead of a cold JVM. The
+    # containers are warmed up by the test queries. When a checkpoint can not be created,
+    # e.g. without CRIU or an experimental docker daemon, the containers of all hosts are
+    # recreated for each run instead. True is returned when the containers were checkpointed.
+    def _create_checkpoints(self, host_index, query_cmd):
+        self.checkpoints = None
+        if self.restore_backend != 'checkpoint':
+            return False
+        if self.container_managers is None:
+            print "=== Checkpoints need the Docker Engine API, recreating the containers instead ==="
+            return False
+
+        print "=== Warming up the DBMS with the test queries ==="
+        self.ssh_connections[host_index].execute_cmd(query_cmd, print_output=False)
+
+        # The nodes are flushed and checkpointed at the same time, so their states match.
+        results = [(False, None)] * self.n_nodes
+
+        def checkpoint_thread(i):
+            flush_cmd = 'docker exec {} nodetool flush'.format(self.backup_container_ids[i])
+            # The checksum list of the archive is created again by the first restore.
+            archive_cmd = 'tar -czf {0} fi-framework/db_data && rm -f {1}'.format(
+                checkpoint_backup, checkpoint_backup[:-len('.tar.gz')] + '_file_list.json')
+            results[i] = self.container_managers[i].checkpoint(self.backup_container_ids[i], checkpoint_name,
+                                                               prepare_commands=[flush_cmd], commands=[archive_cmd])
+        threads = [Thread(target=checkpoint_thread, args=(i,)) for i in range(self.n_nodes)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Resume the checkpointed containers, and start the others cold when it fails.
+        checkpoints = []
+        for i, (created, operation_results) in enumerate(results):
+            resumed = False
+            if created:
+                (resumed, _) = self.container_managers[i].restore_checkpoint(self.backup_container_ids[i],
+                                                                             checkpoint_name)
+            else:
+                print "Checkpoint of host {} failed: {}".format(self.hosts[i], operation_results)
+            # The checkpoint stops the container, also when a command of the batch failed.
+            if not resumed:
+                self.container_managers[i].execute([{'op': 'start', 'container': self.backup_container_ids[i]}])
+            checkpoints.append(resumed)
+
+        if all(checkpoints):
+            print "=== Checkpointed the warm DBMS containers, each run resumes from them ==="
+            self.checkpoints = checkpoints
+        else:
+            print "=== Checkpoints are not available, recreating the containers instead ==="
+        return True
+
+    # Stop the container of a host, restore the data directory from the checkpoint archive
+    # and resume the container from its checkpoint, in a single batch. Returned is whether
+    # the container was resumed.
+    def _restore_checkpoint(self, host_index, timer):
+        start = monotonic()
+        (resumed, results) = self.container_managers[host_index].restore_checkpoint(
+            self.backup_container_ids[host_index], checkpoint_name,
+            commands=[self._get_restore_cmd(host_index, backup=checkpoint_backup)])
+        if results is None:
+            return False
+
+        self._record_engine_results(host_index, results, start, timer,
+                                    {'stop': 'container_stop', 'command': 'tar_restore',
+                                     'start': 'checkpoint_restore'})
+        if not resumed:
+            print "=== Resuming the checkpoint of host {} failed, recreating its container ===".format(
+                self.hosts[host_index])
+        return resumed
+
+    # Get a docker image id of a host, via the Docker Engine API when it is available.
+    def _get_image_id(self, host_index, image_name, db_version='latest'):
+        if self.container_managers is not None and self.container_managers[host_index].available:
+            image_id = self.container_managers[host_index].get_image_id(image_name, db_version)
+            if self.container_managers[host_index].available:
+                return image_id
+        return get_docker_image_id(self.ssh_connections[host_index], image_name, db_version)
+
+    # Get the running docker container id of an image on a host, via the Docker Engine API
+    # when it is available.
+    def _get_container_id(self, host_index, image_id, image_name, db_version='latest'):
+        if self.container_managers is not None and self.container_managers[host_index].available:
+            container_id = self.container_managers[host_index].get_container_id(
+                image_id, '{}:{}'.format(image_name, db_version))
+            if self.container_managers[host_index].available:
+                return container_id
+        return get_docker_container_id(self.ssh_connections[host_index], image_id, image_name, db_version)
 
     def _remove_tar_backup(self, host_index):
         self.ssh_connections[host_index].execute_cmd('rm -rf fi-framework/db_data', sudo=True)
@@ -602,14 +1167,82 @@ class FIClient:
         (targets, _) = connection.execute_cmd(query_cmd, print_output=False)
         return [target.strip('\r\n') for target in targets]
 
+    # Create the target selector of a scenario. The weighted modes use the read counts
+    # recorded by the file tracer while the data was verified and queried before.
+    # When the scenario has a target_region, the faults are inserted in the offset ranges
+    # of these (SSTable) regions only.
+    def _get_target_selector(self, test_scenario, target_list, host_index=0):
+        mode = test_scenario.get('target_selection', 'uniform')
+        counts = None
+        if mode != 'uniform':
+            counts = self.get_db_file_tracer_counts(host_index)
+            if len(counts.get('reads', {})) == 0 and len(counts.get('accesses', {})) == 0:
+                print "=== No file tracer counts found, targets are chosen uniformly ==="
+        region_ranges = None
+        if 'target_region' in test_scenario:
+            region_ranges = self.get_region_ranges(test_scenario['target_region'], host_index)
+        return TargetSelector(target_list, counts, mode=mode, region_ranges=region_ranges)
+
+    # Stat the paths in a container of a host in a single call, as {path: {'exists', 'type', 'size'}}.
+    # The run params are transferred as a file, as the path list can exceed the maximum
+    # length of a command argument, and the paths can contain quotes.
+    def stat_container_paths(self, container_id, paths, host_index=0, params_file='stat_paths_params.json'):
+        run_params = {'type': 'stat_paths', 'container_id': container_id, 'paths': paths}
+        with io.open(params_file, 'w') as f:
+            f.write(unicode(json.dumps(run_params)))
+        connection, _, connect_dir = self.get_host_info(host_index)
+        try:
+            connection.transfer_file(params_file, connect_dir)
+        finally:
+            os.remove(params_file)
+        query_cmd = self._get_db_querying_cmd() + " {} @fi-framework/{}".format(host_index, params_file)
+        (out, _) = connection.execute_cmd(query_cmd, print_output=False)
+        try:
+            return json.loads(out[-1].strip("\r\n"))
+        except (ValueError, IndexError):
+            print "=== Could not stat the container paths: {} ===".format(out)
+            return {}
+
+    # Get the offset ranges of DBMS file regions, such as the chunk CRCs of the SSTables,
+    # as {container_path: [[start, end], ..], ..}. The ranges are cached per backup at the
+    # server side.
+    def get_region_ranges(self, regions, host_index=0):
+        run_params = {'type': 'sstable_regions', 'regions': regions}
+        query_cmd = self._get_db_querying_cmd() + " {} '{}'".format(host_index, json.dumps(run_params))
+        (out, _) = self.ssh_connections[host_index].execute_cmd(query_cmd, sudo=True, print_output=False)
+        try:
+            return json.loads(out[-1].strip("\r\n"))
+        except (ValueError, IndexError):
+            print "=== Could not retrieve the target regions: {} ===".format(out)
+            return {}
+
+    # Write the params of a command in a container to a json file in the container, as
+    # the params can exceed the maximum length of a command argument, and can contain
+    # quotes. The path of the file in the container is returned.
+    def _transfer_container_params(self, container_id, params, params_file, host_index=0):
+        with io.open(params_file, 'w') as f:
+            f.write(unicode(json.dumps(params)))
+        connection, _, connect_dir = self.get_host_info(host_index)
+        try:
+            connection.transfer_file(params_file, connect_dir)
+        finally:
+            os.remove(params_file)
+        connection.execute_cmd('docker cp {}{} {}:/{}'.format(connect_dir, params_file, container_id, params_file),
+                               sudo=True, print_output=False)
+        return '/' + params_file
+
     # Automatically used by the run test scenario function. Prepare the host where
     # fault injections will occur by transferring the json files and copying the
-    # fault injector file into the docker container.
+    # fault injector and target discovery files into the docker container.
     def _prepare_fi_host(self, container_id, host_index=0):
         connection, _, connect_dir = self.get_host_info(host_index)
 
         connection.execute_cmd('docker cp {}src/faults/bit_flip.py'.format(connect_dir) +
                                ' {}:/bit_flip.py'.format(container_id), sudo=True)
+        connection.execute_cmd('docker cp {}src/faults/stuck_bit.py'.format(connect_dir) +
+                               ' {}:/stuck_bit.py'.format(container_id), sudo=True)
+        connection.execute_cmd('docker cp {}src/stat_paths.py'.format(connect_dir) +
+                               ' {}:/stat_paths.py'.format(container_id), sudo=True)
 
     # Commit the images used in the docker tests. This will be automatically executed before
     # a fault injection test is done.
@@ -623,7 +1256,7 @@ class FIClient:
             connection = self.ssh_connections[node_id]
 
             # Check if a backup already exists, if it does do nothing.
-            backup_image_id = get_docker_image_id(connection, backup_name, db_version='1.0')
+            backup_image_id = self._get_image_id(node_id, backup_name, db_version='1.0')
             if not backup_image_id:
                 # Create a backup image and archive of the mounted volume.
                 # When doing so, get the backup image id and stop the current running db image.
@@ -635,8 +1268,8 @@ class FIClient:
                 (container_id, _) = connection.execute_cmd(run_cmd, sudo=True)
                 backup_container_id = container_id[:12]
             else:
-                backup_container_id = get_docker_container_id(connection, backup_image_id,
-                                                              self.db_type, self.db_version)
+                backup_container_id = self._get_container_id(node_id, backup_image_id,
+                                                             self.db_type, self.db_version)
 
             self.backup_image_ids.append(backup_image_id)
             self.backup_container_ids.append(backup_container_id)
@@ -658,20 +1291,45 @@ class FIClient:
 
         return backup_image_id.split(':')[1][:12]
 
-    # Wait till each host docker instance is up and running.
-    def ensure_all_running(self):
-        for connection, host in zip(self.ssh_connections, self.hosts):
-            (out, _) = connection.execute_cmd('python fi-framework/src/databases/' +
-                                              '{}/db_functions.py '.format(self.db_type))
-            for line in out:
-                if "ERROR" in line:
-                    return False
-        return True
-
-    # Start the strace and lsof combination process to track all opened files.
+    # Get the id of the running container of a host, the backup container when it exists.
+    def _get_running_container_id(self, host_index):
+        if host_index < len(self.backup_container_ids) and self.backup_container_ids[host_index] is not None:
+            return self.backup_container_ids[host_index]
+        if host_index < len(self.container_ids):
+            return self.container_ids[host_index]
+        return None
+
+    # Wait till each host docker instance is up and running. The readiness probes of all
+    # hosts are started at once, each follows the log of its container, probes the
+    # native protocol port and checks the gossip and schema agreement of the cluster.
+    # The result of each host, with its time to ready, is kept in self.readiness.
+    def ensure_all_running(self, timeout=300):
+        db_ips = self.fi_file_json['db_meta']['connection_ip']
+        probes = []
+        for i, connection in enumerate(self.ssh_connections):
+            params = {'host': db_ips[i], 'port': 9042, 'timeout': timeout, 'expected_nodes': self.n_nodes,
+                      'container_id': self._get_running_container_id(i)}
+            probes.append(connection.execute_cmd('python fi-framework/src/databases/{}/readiness.py \'{}\''.format(
+                self.db_type, json.dumps(params)), sudo=True, return_streams=True))
+
+        self.readiness = []
+        for i, (stdin, stdout, stderr) in enumerate(probes):
+            out = stdout.readlines()
+            stdin.close(), stdout.close(), stderr.close()
+            try:
+                result = json.loads(out[-1].strip("\r\n"))
+            except (ValueError, IndexError):
+                result = {'ready': False, 'time_to_ready': None, 'error': ''.join(out[-5:])}
+            if not result['ready']:
+                print "Host {} is not ready: {}".format(self.hosts[i], result.get('error'))
+            self.readiness.append(result)
+        return all(result['ready'] for result in self.readiness)
+
+    # Start the file tracer process (strace or proc sampling) to track all opened files.
     def start_db_file_tracer(self, host_index=0):
         connection, _, connection_dir = self.get_host_info(host_index)
-        connection.execute_cmd(self._get_strace_cmd(connection_dir) + ' {} start'.format(self.db_type),
+        connection.execute_cmd(self._get_strace_cmd(connection_dir) +
+                               ' {} start {}'.format(self.db_type, self.file_tracer),
                                return_streams=True, sudo=True)
 
     # List all files opened files of the database in the docker container.
@@ -681,6 +1339,16 @@ class FIClient:
                                           print_output=False, sudo=True)
         return [row.strip() for row in out]
 
+    # Get the access, read and offset range read counts of the files opened by the db.
+    def get_db_file_tracer_counts(self, host_index=0):
+        connection, _, connection_dir = self.get_host_info(host_index)
+        (out, _) = connection.execute_cmd(self._get_strace_cmd(connection_dir) + ' {} counts'.format(self.db_type),
+                                          print_output=False, sudo=True)
+        try:
+            return json.loads(out[-1].strip("\r\n"))
+        except (ValueError, IndexError):
+            return {}
+
     # Empty the list of files opened by the db while querying the database.
     def empty_db_file_tracer_results(self, host_index=0):
         connection, _, connection_dir = self.get_host_info(host_index)
@@ -715,15 +1383,20 @@ class FIClient:
     # this class. This is more of a simple test function.
     def inject_fault(self, image_name, version, file_name, n_flips, host_index=0):
         connection, _, connection_dir = self.get_host_info(host_index)
-        image_id = get_docker_image_id(connection, image_name, db_version=version)
-        container_id = get_docker_container_id(connection, image_id, image_name, version)
+        image_id = self._get_image_id(host_index, image_name, db_version=version)
+        container_id = self._get_container_id(host_index, image_id, image_name, version)
         connection.execute_cmd('docker exec {} python bit_flip.py {} {}'.format(container_id, file_name, n_flips),
                                sudo=True)
 
 
 if __name__ == '__main__':
-    if len(sys.argv[1:]) != 1:
+    if len(sys.argv[1:]) == 2:  # Replay a single fault plan of an earlier campaign.
+        framework_obj = FIClient(sys.argv[1])
+        framework_obj.setup_framework(install_server_dependencies=False)
+        framework_obj.replay_fault_plan(sys.argv[2], host_index=0)
+    elif len(sys.argv[1:]) != 1:
         print 'Give a test scenario\'s file in the form provided in the examples map.'
+        print 'Optionally give a fault plan id to replay: fi_client.py scenarios.json plan_id'
     else:
         framework_obj = FIClient(sys.argv[1])
         framework_obj.setup_framework(install_server_dependencies=False)
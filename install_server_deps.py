@@ -14,7 +14,6 @@ where port, user and password are optional.
 """
 
 import argparse
-from src import server_conn
 
 
 def install_docker(ssh, db_type):
@@ -53,6 +52,8 @@ def install_python_deps(ssh, db_type):
         if res1.strip() != 'OK':
             print "Installing cassandra-driver (This may take a while...)"
             ssh.execute_cmd("pip install cassandra-driver")
+        # Used by the driver to compress the protocol frames of the blob heavy reads.
+        ssh.execute_cmd("pip install lz4")
         ssh.execute_cmd("rm check_cassandra.py")
 
     print "=== END Installing python dependencies ==="
@@ -82,6 +83,7 @@ if __name__ == '__main__':
     user = None if 'user' not in args else args.user
     password = None if 'password' not in args else args.password
 
-    # Communication
+    # Communication, paramiko is only imported when the dependencies are installed over SSH.
+    from src import server_conn
     server_ssh = server_conn.SSHConnection(args.host, port=port, user=user, password=password)
     install_dependencies(server_ssh)
@@ -8,15 +8,26 @@ particular database.
 
 FILE: result_analyzer.py
 
-USAGE: python result_analyzer.py <db_name> [Opt:run_id_UUID]
+USAGE: python result_analyzer.py <db_name> [Opt:run_id_UUID] [-backend mongodb/sqlite] [-path dir] [-verbose]
+                                                  [-trace timeline.json]
+
+       By default only the aggregated rows of the result store are streamed. Use
+       -verbose to print the summary of each single result document. With
+       -incremental a compact summary of each run, and the totals of each scenario,
+       are cached in the result store, and only the results inserted after the last
+       summarized result are read.
+       With -trace the phase timings of the runs are exported as a Chrome trace,
+       which can be opened with chrome://tracing or https://ui.perfetto.dev.
 
 NOTE: this file is not really flexible and not really neatly written.
       so if errors occur you probably can debug it yourself.
 
 """
-from src.store_results_local import LocalDB
+from src.store_results_local import create_local_db, result_store_backends, effect_columns, db_error_columns
 from src.utils import get_time_from_str, get_time_difference
-import sys
+from src.latency_analysis import LatencyAnalysis, micros_to_str
+from src.phase_timing import export_chrome_trace
+import argparse
 import uuid
 
 
@@ -126,27 +137,221 @@ def summarize_results(results, db_type='cassandra'):
     return query_stats, total
 
 
+# Summarize the results via the aggregations of the result store, instead of
+# iterating all result documents.
+def summarize_aggregated(result_db, query=None):
+    total = {}
+    print "=== Scenario totals ==="
+    for row in result_db.aggregate_scenarios(query):
+        print row['res_id'], ':', ', '.join('{}: {}'.format(key, val) for (key, val) in sorted(row.items())
+                                             if key != 'res_id' and val != 0)
+        add_item(total, 'total_results', row['runs'])
+        add_item(total, 'errors', row['errors'])
+        add_item(total, 'no_errors', row['runs'] - row['errors'])
+        add_item(total, 'flips_per_file_n=' + str(row['flips_per_file']), row['runs'])
+        for key in ['error_sum', 'error_sum_detected_db', 'error_sum_detected_log'] + effect_columns:
+            add_item(total, key, row[key])
+
+    # All time differences are computed on integer microseconds since midnight.
+    fault_latencies = LatencyAnalysis()
+    log_latencies = LatencyAnalysis()
+    db_error_logs = set()
+    for row in result_db.aggregate_run_times(query):
+        if len(row['db_error_logs']) > 0:
+            db_error_logs.update(normalize_db_logs(row['db_error_logs']))
+
+        if len(row['injection_times']) == 0:
+            continue
+        if len(row['db_error_logs']) > 0:
+            log_latencies.add_latency(row['injection_times'][-1], extract_log_time_str(row['db_error_logs'][0]))
+        fault_latencies.add_nearest(row['injection_times'], row['fault_times'])
+
+    return print_totals(total, fault_latencies, log_latencies, db_error_logs)
+
+
+# Summarize a single result document in a compact run summary, which is cached
+# by the result store. Latencies are stored in microseconds.
+def summarize_run(result):
+    test_scenario = result['test_scenario']
+    summary = {'res_id': result['res_id'], 'run_id': result['run_id'], 'time': result['time'],
+               'insert_id': result.get('insert_id'), 'error_sum': 0, 'detected_db': False, 'fault_latencies': [], 'log_latency': None}
+    for field in ['FI_type', 'num_files', 'flips_per_file']:
+        summary[field] = test_scenario.get(field)
+
+    counters = dict((col, 0) for col in effect_columns)
+    fault_times = []
+    # A list of effects is stored when no results could be retrieved from the DBMS.
+    effects = result['effects'].values() if isinstance(result['effects'], dict) else []
+    for query_effect in effects:
+        if not isinstance(query_effect, dict):
+            continue
+        query_sum = 0
+        for col in effect_columns:
+            val = query_effect.get(col, 0)
+            counters[col] += val
+            query_sum += abs(val)
+            if val != 0 and col in db_error_columns:
+                summary['detected_db'] = True
+        if query_sum != 0:
+            fault_times.append(query_effect['timestamp'])
+        summary['error_sum'] += query_sum
+    summary['counters'] = counters
+
+    db_error_logs = test_scenario.get('db_error_logs', [])
+    injection_times = test_scenario.get('injection_times', [])
+    summary['n_db_error_logs'] = len(db_error_logs)
+    summary['log_signatures'] = normalize_db_logs(db_error_logs)
+    summary['first_log_time'] = extract_log_time_str(db_error_logs[0]) if len(db_error_logs) > 0 else None
+    if len(injection_times) > 0:
+        latencies = LatencyAnalysis()
+        summary['fault_latencies'] = list(latencies.add_nearest(injection_times, fault_times))
+        if summary['first_log_time'] is not None:
+            summary['log_latency'] = latencies.add_latency(injection_times[-1], summary['first_log_time'])
+    summary['min_fault_latency'] = min(summary['fault_latencies']) if len(summary['fault_latencies']) > 0 else None
+    return summary
+
+
+# Create the empty aggregate of the run summaries of a scenario (res_id).
+def new_summary_aggregate(res_id):
+    return {'res_id': res_id, 'totals': {}, 'fault_latencies': [], 'log_latencies': [], 'log_signatures': []}
+
+
+# Add a run summary to the aggregate of its scenario.
+def add_to_aggregate(aggregate, summary):
+    total = aggregate['totals']
+    add_item(total, 'total_results', 1)
+    add_item(total, 'errors' if summary['error_sum'] != 0 else 'no_errors', 1)
+    add_item(total, 'flips_per_file_n=' + str(summary['flips_per_file']), 1)
+    add_item(total, 'error_sum', summary['error_sum'])
+    add_item(total, 'error_sum_detected_db', int(summary['detected_db']))
+    add_item(total, 'error_sum_detected_log', int(summary['n_db_error_logs'] > 0))
+    for (key, val) in summary['counters'].items():
+        add_item(total, key, val)
+
+    aggregate['fault_latencies'].extend(summary['fault_latencies'])
+    if summary['log_latency'] is not None:
+        aggregate['log_latencies'].append(summary['log_latency'])
+    aggregate['log_signatures'] = sorted(set(aggregate['log_signatures']) | set(summary['log_signatures']))
+    return aggregate
+
+
+# Summarize the results which are inserted after the high water mark of the result store,
+# and cache the run summaries and the updated aggregates of their scenarios in batches.
+# The mark is the insert id of the last summarized result, so results which are stored
+# out of order by concurrent runs are not skipped. The summaries of the results which
+# are not settled yet (MongoDB) are returned instead of cached, as a result with a lower
+# insert id can still be in flight.
+def update_run_summaries(result_db, batch_size=1000):
+    high_water_mark = result_db.get_high_water_mark()
+    if high_water_mark is None:
+        # Cached summaries without a valid mark are summarized again.
+        result_db.clear_run_summaries()
+    settled_mark = result_db.get_settled_mark()
+
+    aggregates, summaries, pending = {}, [], []
+
+    def store_batch(mark):
+        result_db.insert_run_summaries(summaries, aggregates=aggregates.values(), high_water_mark=mark)
+        aggregates.clear()
+        del summaries[:]
+
+    last_insert_id = None
+    for result in result_db.query_new_results(high_water_mark):
+        if len(pending) > 0 or (settled_mark is not None and result['insert_id'] >= settled_mark):
+            if 'effects' in result:
+                pending.append(summarize_run(result))
+            continue
+        last_insert_id = result['insert_id']
+        if 'effects' not in result:
+            continue
+
+        summary = summarize_run(result)
+        if summary['res_id'] not in aggregates:
+            cached = list(result_db.query_summary_aggregates({'res_id': summary['res_id']}))
+            aggregates[summary['res_id']] = cached[0] if len(cached) > 0 else new_summary_aggregate(summary['res_id'])
+        add_to_aggregate(aggregates[summary['res_id']], summary)
+        summaries.append(summary)
+        if len(summaries) == batch_size:
+            store_batch(last_insert_id)
+    if last_insert_id is not None:
+        store_batch(last_insert_id)
+    return pending
+
+
+# Summarize the results from the cached aggregates of the run summaries, after the new
+# results are summarized, so only the new results and one aggregate per scenario are
+# read. Only the res_id and run_id fields can be used in the query, with a run_id the
+# cached run summaries of the run are read instead.
+def summarize_incremental(result_db, query=None):
+    pending = update_run_summaries(result_db)
+    query = query if query is not None else {}
+
+    if 'run_id' in query:
+        run_aggregate = new_summary_aggregate(None)
+        for summary in result_db.query_run_summaries(query):
+            add_to_aggregate(run_aggregate, summary)
+        aggregates = [run_aggregate]
+    else:
+        aggregates = list(result_db.query_summary_aggregates(query))
+    pending_aggregate = new_summary_aggregate(None)
+    for summary in pending:
+        if all(summary.get(key) == val for (key, val) in query.items()):
+            add_to_aggregate(pending_aggregate, summary)
+    aggregates.append(pending_aggregate)
+
+    total = {}
+    fault_latencies = LatencyAnalysis()
+    log_latencies = LatencyAnalysis()
+    db_error_logs = set()
+    for aggregate in aggregates:
+        for (key, val) in aggregate['totals'].items():
+            add_item(total, key, val)
+        fault_latencies.extend(aggregate['fault_latencies'])
+        log_latencies.extend(aggregate['log_latencies'])
+        db_error_logs.update(aggregate['log_signatures'])
+
+    return print_totals(total, fault_latencies, log_latencies, db_error_logs)
+
+
+# Print the totals of the aggregated or incremental summary.
+def print_totals(total, fault_latencies, log_latencies, db_error_logs):
+    print
+    print "=== Total results: {} ===".format(total.get('total_results', 0))
+    for (key, val) in total.items():
+        if val != 0:
+            print key, ':', val
+    for (key, latencies) in [('time_diff_fault_time_and_injections', fault_latencies),
+                             ('time_diff_last_injection_log_error', log_latencies)]:
+        total[key] = latencies.summary()
+        print_latency_summary(key, total[key])
+    print 'db_error_logs :', list(db_error_logs)
+    print "==="
+    return total
+
+
+# Print the latency summary of a LatencyAnalysis object, all values in seconds.
+def print_latency_summary(key, summary):
+    if summary['n'] == 0:
+        return
+    print key, ': n = {}, mean = {:.6f}, min = {:.6f}, max = {:.6f}'.format(summary['n'], summary['mean'],
+                                                                          summary['min'], summary['max'])
+    print '    percentiles :', ', '.join('p{} = {:.6f}'.format(percent, val)
+                                         for (percent, val) in sorted(summary['percentiles'].items()))
+    print '    histogram   :', ', '.join('{:g}s: {}'.format(start, count) for (start, count) in summary['histogram'])
+
+
 def get_smallest_time_differences(query_stat):
     key = 'time_diff_fault_time_and_injections'
-    injection_times = []
-    for injection_time in query_stat['injection_times']:
-        injection_times.append(get_time_from_str(injection_time))
-    fault_times = []
-    for fault_time in query_stat['fault_time']:
-        fault_times.append(get_time_from_str(fault_time))
-    for fault_time in fault_times:
-        smallest_time = None
-        for injection_time in injection_times:
-            diff_time = get_time_difference(fault_time, injection_time)
-            if smallest_time is None or diff_time < smallest_time:
-                smallest_time = diff_time
-        add_item(query_stat, key, [str(smallest_time)])
+    differences = LatencyAnalysis().add_nearest(query_stat['injection_times'], query_stat['fault_time'])
+    add_item(query_stat, key, [micros_to_str(difference) for difference in differences])
     return query_stat
 
 
 def add_item(dictionary, key, val):
     if key in dictionary:
         dictionary[key] += val
+    elif isinstance(val, list):  # Copy, so the extended list is not shared with the result.
+        dictionary[key] = list(val)
     else:
         dictionary[key] = val
 
@@ -161,7 +366,11 @@ def normalize_db_logs(db_logs):
 # Extract a datetime.time object from a db log in the form:
 # e.g. 'WARN 23:30:20 ....'
 def extract_log_time(db_log):
-    return get_time_from_str(db_log.split(' ', 3)[2])
+    return get_time_from_str(extract_log_time_str(db_log))
+
+
+def extract_log_time_str(db_log):
+    return db_log.split(' ', 3)[2]
 
 
 def calc_avg_time(time_list):
@@ -177,11 +386,31 @@ def time_to_secs(time_stamp):
 
 
 if __name__ == '__main__':
-    session = LocalDB(sys.argv[1])
-    # When two arguments are given, filter on results from a single experiment.
-    if len(sys.argv) == 3:
-        test_results = session.query_db({"res_id": uuid.UUID(sys.argv[2])})
+    parser = argparse.ArgumentParser(description="Summarize the stored fault injection results.")
+    parser.add_argument("db_name", type=str, help="name of the local result database.")
+    parser.add_argument("res_id", type=str, nargs='?', help="only analyse the results of this run id.")
+    parser.add_argument("-backend", type=str, default='mongodb', choices=result_store_backends,
+                        help="result store backend, as the 'result_store' field of a scenario file.")
+    parser.add_argument("-path", type=str, help="directory of the sqlite result store.")
+    parser.add_argument("-verbose", action='store_true', help="summarize every single result document.")
+    parser.add_argument("-incremental", action='store_true',
+                        help="cache run summaries and only summarize the new results.")
+    parser.add_argument("-trace", type=str, help="export the phase timings of the runs to this trace file.")
+    args = parser.parse_args()
+
+    session = create_local_db(args.db_name, {'backend': args.backend, 'path': args.path})
+    # When a run id is given, filter on results from a single experiment.
     # Else analyse all results.
+    result_query = None
+    if args.res_id is not None:
+        result_query = {"res_id": uuid.UUID(args.res_id)}
+
+    if args.trace is not None:
+        n_events = export_chrome_trace(session.query_db(result_query), args.trace)
+        print "Exported {} trace events to: {}".format(n_events, args.trace)
+    elif args.verbose:
+        summarize_results(session.query_db(result_query))
+    elif args.incremental:
+        summarize_incremental(session, result_query)
     else:
-        test_results = session.query_db()
-    summarize_results(test_results)
+        summarize_aggregated(session, result_query)
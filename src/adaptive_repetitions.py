@@ -0,0 +1,136 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file decides when the repetitions of a scenario can stop. Instead of always
+running the fixed number of repetitions, the outcome of each run is classified,
+and running estimates of the outcome rates of the scenario are kept:
+
+- error:             a query returned an error or wrong results.
+- detected:          the DBMS raised an error for a query, or logged an error.
+- silent_corruption: wrong results were returned without any DBMS error or log.
+
+The Wilson score interval is used as the confidence interval of each rate, as it
+stays valid for rates close to 0 or 1 and for few runs. A scenario stops when the
+half width of the intervals of all rates is at most the target precision, after a
+minimum number of runs, and at the latest after the maximum number of runs. They
+are set with the "adaptive_repetitions" field of the test scenarios:
+
+    "adaptive_repetitions": {"precision": 0.05, "confidence": 0.95,
+                             "min_repetitions": 20, "max_repetitions": 300}
+
+FILE: adaptive_repetitions.py
+
+USAGE:
+    from adaptive_repetitions import RateEstimator, classify_run
+    estimator = RateEstimator(precision=0.05, confidence=0.95, min_repetitions=20)
+    estimator.add_run(classify_run(server_results, db_error_logs))
+    if estimator.is_converged():
+        estimator.print_estimates()
+
+"""
+
+import math
+from store_results_local import effect_columns, db_error_columns
+
+# The rates which are estimated per scenario.
+outcome_rates = ['error', 'detected', 'silent_corruption']
+
+
+# Get the z value of a two sided confidence level, by bisection of the normal cdf.
+def confidence_z(confidence):
+    low, high = 0.0, 10.0
+    for _ in range(100):
+        mid = (low + high) / 2
+        if math.erf(mid / math.sqrt(2)) < confidence:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2
+
+
+# Get the Wilson score interval (low, high) of successes out of n runs.
+def wilson_interval(successes, n, z):
+    if n == 0:
+        return 0.0, 1.0
+    p = float(successes) / n
+    denominator = 1 + z ** 2 / n
+    center = (p + z ** 2 / (2 * n)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+# Classify the outcome of a run, given the query effects returned by the server and
+# the correlated DBMS error logs. A list of effects is returned when no results
+# could be retrieved from the DBMS, which counts as a detected error.
+def classify_run(query_effects, db_error_logs=None):
+    if not isinstance(query_effects, dict):
+        return {'error': True, 'detected': True, 'silent_corruption': False}
+
+    error, detected = False, db_error_logs is not None and len(db_error_logs) > 0
+    for query_effect in query_effects.values():
+        if not isinstance(query_effect, dict):
+            continue
+        if any(query_effect.get(col, 0) != 0 for col in effect_columns):
+            error = True
+        if any(query_effect.get(col, 0) != 0 for col in db_error_columns):
+            detected = True
+    return {'error': error, 'detected': detected, 'silent_corruption': error and not detected}
+
+
+class RateEstimator:
+    def __init__(self, precision=0.05, confidence=0.95, min_repetitions=20, max_repetitions=None):
+        self.precision = precision
+        self.confidence = confidence
+        self.z = confidence_z(confidence)
+        self.min_repetitions = min_repetitions
+        self.max_repetitions = max_repetitions
+        self.n_runs = 0
+        self.counts = dict((rate, 0) for rate in outcome_rates)
+
+    def add_run(self, outcome):
+        self.n_runs += 1
+        for rate in outcome_rates:
+            self.counts[rate] += int(outcome[rate])
+
+    # The estimate of each rate: {rate: (estimate, low, high)}.
+    def estimates(self):
+        estimates = {}
+        for rate in outcome_rates:
+            (low, high) = wilson_interval(self.counts[rate], self.n_runs, self.z)
+            estimate = float(self.counts[rate]) / self.n_runs if self.n_runs > 0 else 0.0
+            estimates[rate] = (estimate, low, high)
+        return estimates
+
+    # Check if the intervals of all rates are within the target precision.
+    def is_converged(self):
+        if self.n_runs < self.min_repetitions:
+            return False
+        return all((high - low) / 2 <= self.precision for (_, low, high) in self.estimates().values())
+
+    # Check if the scenario can stop, when converged or at the maximum repetitions.
+    def should_stop(self):
+        if self.max_repetitions is not None and self.n_runs >= self.max_repetitions:
+            return True
+        return self.is_converged()
+
+    def to_dict(self):
+        return {'n_runs': self.n_runs, 'confidence': self.confidence, 'precision': self.precision,
+                'converged': self.is_converged(),
+                'rates': dict((rate, {'estimate': estimate, 'low': low, 'high': high})
+                              for rate, (estimate, low, high) in self.estimates().items())}
+
+    def print_estimates(self):
+        print "=== Outcome rates after {} runs ({:.0f}% confidence) ===".format(self.n_runs, self.confidence * 100)
+        for rate, (estimate, low, high) in sorted(self.estimates().items()):
+            print "{:<18} {:6.3f}  [{:.3f}, {:.3f}]".format(rate, estimate, low, high)
+
+
+# Create the rate estimator of a scenario from the "adaptive_repetitions" field, the
+# repetitions of the test scenarios are the maximum by default.
+def create_rate_estimator(adaptive_meta, repetitions):
+    return RateEstimator(precision=adaptive_meta.get('precision', 0.05),
+                         confidence=adaptive_meta.get('confidence', 0.95),
+                         min_repetitions=adaptive_meta.get('min_repetitions', 20),
+                         max_repetitions=adaptive_meta.get('max_repetitions', repetitions))
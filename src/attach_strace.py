@@ -7,21 +7,36 @@ This file attaches a strace process on the cassandra process to track
 which files it is reading or writing to while querying. Will for now write output
 to a file.
 
+The file descriptors are resolved to file paths by reading the /proc/<pid>/fd
+links of the process (or thread), and cached until the descriptor is closed.
+
+As strace slows down every system call of the traced process, a low overhead
+'proc' tracer is available as well. It periodically samples the /proc/<pid>/fd
+links and the file mappings in /proc/<pid>/maps. Both tracers write the same
+opened_files.txt target list, and the number of accesses (strace) or samples
+(proc) of each file to opened_files_counts.json. The strace tracer also counts
+the reads of each file, and the reads per offset range of pread64 calls.
+
 NOTE: this file has to be run with sudo rights. And ensure no other strace cmd
       is running.
 
 FILE: attach_strace.py
 
-USAGE: python attach_strace.py <db_type> <start/kill/empty/list>
+USAGE: python attach_strace.py <db_type> <start/kill/empty/list/counts> [Opt:strace/proc]
 """
 
 import io
 import re
 import os
 import sys
+import json
 import time
+import signal
 import subprocess
 
+# The implemented file tracer backends.
+tracer_backends = ['strace', 'proc']
+
 
 # Using a grep command and ps -aux output, get all output from the grep command.
 def search_process_pid(grep_param):
@@ -55,16 +70,36 @@ def kill_strace(strace_cmd):
         kill.wait()
 
 
-# Attach, kill, list results of a strace process.
-def attach_strace(db_type, command_option='start', db_files='opened_files.txt'):
+# Kill the proc sampler process, of which the pid is written on start.
+def kill_sampler(pid_file):
+    if not os.path.exists(pid_file):
+        return
+    with io.open(pid_file, 'r') as f:
+        sampler_pid = int(f.read().strip())
+    print "Killing proc sampler.."
+    try:
+        os.kill(sampler_pid, signal.SIGTERM)
+    except OSError:  # Already stopped.
+        pass
+    os.remove(pid_file)
+
+
+# Attach, kill, list results of a strace process or proc sampler.
+def attach_strace(db_type, command_option='start', db_files='opened_files.txt',
+                  db_counts='opened_files_counts.json', tracer='strace', pid_file='file_tracer.pid'):
     if command_option == 'list':
         with io.open(db_files, 'a+') as f:
             f.seek(0)
             for line in f:
                 print line,
         return
+    elif command_option == 'counts':
+        print json.dumps(AccessCounter(db_counts).counts)
+        return
     elif command_option == 'empty':
-        os.remove(db_files)
+        for tracer_file in [db_files, db_counts]:
+            if os.path.exists(tracer_file):
+                os.remove(tracer_file)
         return
 
     pid = None
@@ -74,22 +109,124 @@ def attach_strace(db_type, command_option='start', db_files='opened_files.txt'):
         print "No {} process found, or not implemented.".format(db_type)
         return
 
-    strace_cmd = 'strace -p {} -f -e trace=write,read,open'.format(pid)
+    strace_cmd = 'strace -p {} -f -e trace=write,read,open,openat,pread64,pwrite64,mmap,close'.format(pid)
     if command_option == 'kill':
         kill_strace(strace_cmd)
+        kill_sampler(pid_file)
         return
 
-    strace = start_strace(strace_cmd)
-    opened_files = []
+    opened_files = set()
     with io.open(db_files, 'a+') as file_list:
         file_list.seek(0)
-        opened_files.append(file_list.readline().strip())
-    analyse_output(strace.stderr, pid, opened_files, db_files)
+        opened_files.update(line.strip() for line in file_list)
+    counter = AccessCounter(db_counts)
+
+    if tracer == 'proc':
+        with io.open(pid_file, 'w') as f:
+            f.write(unicode(os.getpid()))
+        try:
+            sample_proc_files(pid, opened_files, db_files, counter)
+        finally:
+            if os.path.exists(pid_file):
+                os.remove(pid_file)
+        return
+
+    strace = start_strace(strace_cmd)
+    analyse_output(strace.stderr, pid, opened_files, db_files, counter)
 
     strace.stdout.close()
     strace.stderr.close()
 
 
+# Append a newly found file to the opened files list.
+def add_opened_file(path, opened_files, db_files):
+    opened_files.add(path)
+    with io.open(db_files, 'a+') as f:
+        f.write(path + unicode('\n'))
+
+
+# Counts the accesses and reads of each file, and the reads per offset range of
+# range_size bytes when the offset is known. The counts are written to a json
+# file at most once per write_interval seconds, in the format:
+# {"accesses": {path: n}, "reads": {path: n}, "read_ranges": {path: {range_index: n}},
+#  "range_size": range_size}
+class AccessCounter:
+    def __init__(self, db_counts, write_interval=1.0, range_size=65536):
+        self.db_counts = db_counts
+        self.write_interval = write_interval
+        self.last_write = time.time()
+        self.counts = {'accesses': {}, 'reads': {}, 'read_ranges': {}, 'range_size': range_size}
+        if os.path.exists(db_counts):
+            with io.open(db_counts, 'r') as f:
+                counts = json.loads(f.read())
+            # Older count files only contain the accesses of each file.
+            if 'accesses' in counts:
+                self.counts = counts
+            else:
+                self.counts['accesses'] = counts
+        self.range_size = self.counts['range_size']
+
+    def add(self, path, n=1, read=False, offset=None):
+        accesses = self.counts['accesses']
+        accesses[path] = accesses.get(path, 0) + n
+        if read:
+            reads = self.counts['reads']
+            reads[path] = reads.get(path, 0) + n
+            if offset is not None:
+                # Json keys are strings, so are the range indices.
+                ranges = self.counts['read_ranges'].setdefault(path, {})
+                range_index = str(offset // self.range_size)
+                ranges[range_index] = ranges.get(range_index, 0) + n
+        if time.time() - self.last_write > self.write_interval:
+            self.write()
+
+    def write(self):
+        with io.open(self.db_counts, 'w') as f:
+            f.write(unicode(json.dumps(self.counts)))
+        self.last_write = time.time()
+
+
+# Check if a process is running, and did not stop as a zombie process.
+def process_running(process_pid):
+    try:
+        with io.open('/proc/{}/stat'.format(process_pid), 'r') as f:
+            # Format: pid (name) state ..., the name can contain spaces.
+            return f.read().rsplit(')', 1)[1].split()[0] not in ['Z', 'X']
+    except (IOError, IndexError):
+        return False
+
+
+# Sample the files opened (/proc/<pid>/fd) and mapped (/proc/<pid>/maps) by a process,
+# every sample_interval seconds until the process stops.
+def sample_proc_files(process_pid, opened_files, db_files, counter, sample_interval=0.1):
+    fd_dir = '/proc/{}/fd'.format(process_pid)
+    maps_file = '/proc/{}/maps'.format(process_pid)
+    try:
+        while process_running(process_pid):
+            sampled_files = set()
+            for fd in os.listdir(fd_dir):
+                try:
+                    sampled_files.add(os.readlink(os.path.join(fd_dir, fd)))
+                except OSError:  # Closed while sampling.
+                    continue
+            with io.open(maps_file, 'r') as maps:
+                for mapping in maps:
+                    # Format: address perms offset dev inode [path], file mappings have an inode.
+                    mapping = mapping.split(None, 5)
+                    if len(mapping) == 6 and mapping[4] != '0':
+                        sampled_files.add(mapping[5].strip())
+
+            for path in sampled_files:
+                if path.startswith('/'):
+                    counter.add(path)
+                    if path not in opened_files:
+                        add_opened_file(path, opened_files, db_files)
+            time.sleep(sample_interval)
+    except (IOError, OSError):  # The process stopped while sampling.
+        pass
+    counter.write()
+
+
 def get_cassandra_pid():
     # Search the cassandra pid.
     output = search_process_pid('cassandra')
@@ -125,27 +262,85 @@ def search_file_descriptor_file(process_pid, fd):
     lsof.stderr.close()
 
 
-# Parse the open, read and write commands retrieved from the strace pipe output.
-def analyse_output(input_file, process_pid, opened_files, db_files):
-    open_pattern = re.compile('open\(.*\) = ([0-9]*)')
-    read_pattern = re.compile('read\(([0-9]*)')
-    write_pattern = re.compile('write\(([0-9]*)')
-
-    file_descriptors = []
+# Resolve the file descriptors of a process to file paths via the /proc/<pid>/fd
+# links, or the links of one of its threads in /proc/<pid>/task/<tid>/fd. The
+# resolved paths are cached until the descriptor is invalidated by an open or close
+# call. Descriptors which could not be resolved are cached as misses until then as
+# well, so a closed descriptor which is still used spawns at most a single lsof.
+class FileDescriptorResolver:
+    def __init__(self, process_pid, use_lsof=True):
+        self.process_pid = process_pid
+        self.use_lsof = use_lsof
+        self.cache = {}
+        self.misses = set()
+
+    def resolve(self, fd, tid=None):
+        if fd in self.cache:
+            return self.cache[fd]
+        if fd in self.misses:
+            return None
+
+        fd_links = ['/proc/{}/fd/{}'.format(self.process_pid, fd)]
+        if tid is not None:
+            fd_links.append('/proc/{}/task/{}/fd/{}'.format(self.process_pid, tid, fd))
+        path = None
+        for fd_link in fd_links:
+            try:
+                path = os.readlink(fd_link)
+                break
+            except OSError:  # Already closed, or no permission to read the link.
+                continue
+        if path is None and self.use_lsof:
+            path = search_file_descriptor_file(self.process_pid, fd)
+
+        if path:
+            self.cache[fd] = path.strip()
+            return self.cache[fd]
+        self.misses.add(fd)
+        return None
+
+    def invalidate(self, fd):
+        self.cache.pop(fd, None)
+        self.misses.discard(fd)
+
+
+# Parse the open(at), (p)read(64), (p)write(64), mmap and close commands retrieved
+# from the strace pipe output.
+def analyse_output(input_file, process_pid, opened_files, db_files, counter=None):
+    open_pattern = re.compile('open(?:at)?\(.*\) = ([0-9]+)')
+    access_pattern = re.compile('p?(read|write)(?:64)?\(([0-9]+)')
+    # Format: pread64(fd, "buffer"..., count, offset) = n
+    pread_pattern = re.compile('pread64\(.*, ([0-9]+)\) = [0-9]+')
+    mmap_pattern = re.compile('mmap\((?:[^,]*, ){4}([0-9]+),')
+    close_pattern = re.compile('close\(([0-9]+)\)')
+    # With strace -f, the lines of other threads are prefixed with: [pid  <tid>]
+    thread_pattern = re.compile('\[pid\s+([0-9]+)\]')
+
+    resolver = FileDescriptorResolver(process_pid)
+    file_descriptors = set()
     no_input_counter = 0
 
-    def find_descriptor(result):
-        # Retrieve file descriptor anSd check if is a new one.
-        descriptor = result.groups()[0]
+    def find_descriptor(result, line, read=False, offset=None):
+        # Retrieve file descriptor, the file path is cached by the resolver.
+        descriptor = result.groups()[-1]
+        thread = thread_pattern.match(line)
+        fd = resolver.resolve(descriptor, tid=thread.groups()[0] if thread is not None else None)
+        if fd is None:
+            return
+        if counter is not None:
+            counter.add(fd, read=read, offset=offset)
+        # Now check if it is a new one and append to file list used by a process.
         if descriptor not in file_descriptors:
-            # Now find corresponding file and append to file list used by a process.
-            file_descriptors.append(descriptor)
-            fd = search_file_descriptor_file(process_pid, descriptor)
-            if fd and fd not in opened_files:
-                opened_files.append(fd.strip())
-                with io.open(db_files, 'a+') as f:
-                    f.write(fd.strip() + unicode('\n'))
-                print fd, file_descriptors
+            file_descriptors.add(descriptor)
+            if fd not in opened_files:
+                add_opened_file(fd, opened_files, db_files)
+                print fd, len(file_descriptors)
+
+    # A closed descriptor number can be reused for another file.
+    def close_descriptor(result):
+        descriptor = result.groups()[0]
+        file_descriptors.discard(descriptor)
+        resolver.invalidate(descriptor)
 
     while True:
         line = input_file.readline()
@@ -154,25 +349,37 @@ def analyse_output(input_file, process_pid, opened_files, db_files):
             no_input_counter += 1
         else:
             no_input_counter = 0
-            res = read_pattern.search(line)
+            res = access_pattern.search(line)
             if res:
-                find_descriptor(res)
+                offset = None
+                if res.groups()[0] == 'read':
+                    pread = pread_pattern.search(line)
+                    offset = int(pread.groups()[0]) if pread is not None else None
+                find_descriptor(res, line, read=res.groups()[0] == 'read', offset=offset)
                 continue
 
             res = open_pattern.search(line)
             if res:
-                find_descriptor(res)
+                close_descriptor(res)  # A new file is opened on this descriptor.
+                find_descriptor(res, line)
+                continue
+
+            res = close_pattern.search(line)
+            if res:
+                close_descriptor(res)
                 continue
 
-            # Mostly certain a write call is found.
-            res = write_pattern.search(line)
+            res = mmap_pattern.search(line)
             if res:
-                find_descriptor(res)
+                find_descriptor(res, line)
         # When no input is retrieved for 10 secs, the while loop can be stopped.
         # As it is unlikely to retrieve any information.
         if no_input_counter == 100:
             break
+    if counter is not None:
+        counter.write()
 
 if __name__ == '__main__':
-    # To be called as: python attach_strace.py db_type kill/start/list/empty
-    attach_strace(db_type=sys.argv[1], command_option=sys.argv[2])
+    # To be called as: python attach_strace.py db_type kill/start/list/empty/counts [strace/proc]
+    attach_strace(db_type=sys.argv[1], command_option=sys.argv[2],
+                  tracer=sys.argv[3] if len(sys.argv) > 3 else 'strace')
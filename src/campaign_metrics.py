@@ -0,0 +1,201 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file keeps the live operational metrics of a fault injection campaign, such
+as the repetitions per hour, the mean and p95 duration of each run phase, the
+restored bytes, the injection and query time out counts, the number and latency
+of the SSH commands and the backlog of results still to be written.
+
+The metrics are updated as the run loop advances, and are exported in the
+Prometheus text format to a file (which can be read by the node exporter textfile
+collector), and/or served by a small local HTTP endpoint at /metrics. They are
+selected with the "metrics" field of a scenario file:
+
+    "metrics": {"file": "fi-metrics.prom", "port": 9464}
+
+FILE: campaign_metrics.py
+
+USAGE:
+    from campaign_metrics import CampaignMetrics
+    metrics = CampaignMetrics(metrics_file='fi-metrics.prom', port=9464)
+    metrics.set_connections(ssh_connections)
+    metrics.start()
+    metrics.observe_span({'phase': 'query', 'host': 0, 'duration': 1.2, ..})
+    metrics.add_run(n_injections=1, n_timeouts=0)
+    print metrics.render()
+
+"""
+
+import os
+import io
+import time
+from threading import Lock, Thread
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+
+# Get a quantile of a sorted list of samples, with linear interpolation.
+def quantile(sorted_samples, q):
+    if len(sorted_samples) == 0:
+        return float('nan')
+    position = (len(sorted_samples) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_samples) - 1)
+    return sorted_samples[lower] + (sorted_samples[upper] - sorted_samples[lower]) * (position - lower)
+
+
+# Escape a Prometheus label value.
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_metric(name, value, labels=None):
+    if labels:
+        name += '{' + ','.join('{}="{}"'.format(key, escape_label(val)) for key, val in sorted(labels.items())) + '}'
+    return '{} {}\n'.format(name, repr(float(value)))
+
+
+class CampaignMetrics:
+    # Only the last max_samples durations of each phase are used for the quantiles.
+    def __init__(self, metrics_file=None, port=None, max_samples=1000):
+        self.metrics_file = metrics_file
+        self.port = port
+        self.max_samples = max_samples
+        self.lock = Lock()
+        # The metrics file is written by the run, injection and result threads.
+        self.write_lock = Lock()
+        self.server = None
+        self.connections = []
+
+        self.start_time = time.time()
+        self.repetitions = 0
+        self.injections = 0
+        self.query_timeouts = 0
+        self.restored_bytes = 0
+        self.restored_files = 0
+        self.result_backlog = 0
+        # {phase: (count, total duration, [last durations])}
+        self.phases = {}
+
+    # The connections of which the command counts and latencies are reported.
+    def set_connections(self, connections):
+        self.connections = connections
+
+    # Start the HTTP endpoint when a port is given, and write the first metrics file.
+    def start(self):
+        if self.port is not None and self.server is None:
+            metrics = self
+
+            class MetricsHandler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split('?')[0] not in ['/', '/metrics']:
+                        self.send_error(404)
+                        return
+                    body = metrics.render()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                # Do not print each request in between the run output.
+                def log_message(self, *args):
+                    pass
+
+            self.server = HTTPServer(('127.0.0.1', self.port), MetricsHandler)
+            server_thread = Thread(target=self.server.serve_forever)
+            server_thread.daemon = True
+            server_thread.start()
+            print "=== Serving metrics at http://127.0.0.1:{}/metrics ===".format(self.port)
+        self.update()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    # Add the duration of a phase span, as recorded by a PhaseTimer.
+    def observe_span(self, span):
+        with self.lock:
+            count, total, samples = self.phases.get(span['phase'], (0, 0.0, []))
+            samples.append(span['duration'])
+            if len(samples) > self.max_samples:
+                del samples[0]
+            self.phases[span['phase']] = (count + 1, total + span['duration'], samples)
+        self.update()
+
+    # Add a finished repetition with its number of injections and query time outs.
+    def add_run(self, n_injections=0, n_timeouts=0):
+        with self.lock:
+            self.repetitions += 1
+            self.injections += n_injections
+            self.query_timeouts += n_timeouts
+        self.update()
+
+    def add_restore(self, restore_stats):
+        with self.lock:
+            self.restored_bytes += restore_stats.get('restored_bytes', 0)
+            self.restored_files += restore_stats.get('restored_files', 0)
+        self.update()
+
+    # Change the number of results which are not written to the result store yet.
+    def change_backlog(self, change):
+        with self.lock:
+            self.result_backlog += change
+        self.update()
+
+    # Render the metrics in the Prometheus text format.
+    def render(self):
+        with self.lock:
+            elapsed = time.time() - self.start_time
+            text = '# HELP fi_repetitions_total Finished fault injection repetitions.\n'
+            text += '# TYPE fi_repetitions_total counter\n'
+            text += format_metric('fi_repetitions_total', self.repetitions)
+            text += '# TYPE fi_repetitions_per_hour gauge\n'
+            text += format_metric('fi_repetitions_per_hour', self.repetitions * 3600.0 / elapsed if elapsed > 0 else 0)
+            text += '# TYPE fi_campaign_seconds gauge\n'
+            text += format_metric('fi_campaign_seconds', elapsed)
+
+            text += '# HELP fi_phase_duration_seconds Duration of the run phases.\n'
+            text += '# TYPE fi_phase_duration_seconds summary\n'
+            mean_text = '# TYPE fi_phase_duration_mean_seconds gauge\n'
+            for phase, (count, total, samples) in sorted(self.phases.items()):
+                sorted_samples = sorted(samples)
+                for q in [0.5, 0.95]:
+                    text += format_metric('fi_phase_duration_seconds', quantile(sorted_samples, q),
+                                          {'phase': phase, 'quantile': q})
+                text += format_metric('fi_phase_duration_seconds_sum', total, {'phase': phase})
+                text += format_metric('fi_phase_duration_seconds_count', count, {'phase': phase})
+                mean_text += format_metric('fi_phase_duration_mean_seconds', total / count, {'phase': phase})
+            text += mean_text
+
+            for name, value in [('fi_restored_bytes_total', self.restored_bytes),
+                                ('fi_restored_files_total', self.restored_files),
+                                ('fi_injections_total', self.injections),
+                                ('fi_query_timeouts_total', self.query_timeouts)]:
+                text += '# TYPE {} counter\n'.format(name) + format_metric(name, value)
+            text += '# TYPE fi_result_write_backlog gauge\n'
+            text += format_metric('fi_result_write_backlog', self.result_backlog)
+
+        # The commands executed on each host, and their latency.
+        command_metrics = [('fi_ssh_commands_total', 'counter', lambda conn: conn.n_commands),
+                           ('fi_ssh_command_seconds_total', 'counter', lambda conn: conn.command_time),
+                           ('fi_ssh_command_mean_seconds', 'gauge',
+                            lambda conn: conn.command_time / conn.n_commands if conn.n_commands > 0 else 0)]
+        for name, metric_type, get_value in command_metrics:
+            text += '# TYPE {} {}\n'.format(name, metric_type)
+            for host_index, connection in enumerate(self.connections):
+                text += format_metric(name, get_value(connection), {'host': host_index})
+        return text
+
+    # Write the metrics file, via a rename so a reader never sees a partial file.
+    def update(self):
+        if self.metrics_file is None:
+            return
+        temp_file = self.metrics_file + '.tmp'
+        with self.write_lock:
+            with io.open(temp_file, 'w') as f:
+                f.write(unicode(self.render()))
+            os.rename(temp_file, self.metrics_file)
@@ -0,0 +1,156 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file manages the docker containers of a host via the Docker Engine API. The
+operations are sent in batches to docker_engine.py on the host, over the
+connection of the host (SSH or local), so a whole container lifecycle costs a
+single command. The found image and container ids are cached.
+
+A docker engine object can be given instead of a connection, e.g. the
+FakeDockerEngine, to execute the operations in this process.
+
+FILE: container_manager.py
+
+USAGE:
+    from container_manager import ContainerManager
+    manager = ContainerManager(connection)
+    image_id = manager.get_image_id('cassandra-backup', '1.0')
+    container_id = manager.get_container_id(image_id, 'cassandra-backup:1.0')
+
+    # Stop and remove a container, execute the restore command and start a new one.
+    (container_id, results) = manager.recreate(container_id, config, commands=[restore_cmd])
+
+    # Checkpoint a warm container with CRIU, and resume it from the checkpoint later.
+    (created, results) = manager.checkpoint(container_id, 'fi-warm', commands=[archive_cmd])
+    (restored, results) = manager.restore_checkpoint(container_id, 'fi-warm', commands=[restore_cmd])
+
+"""
+
+import json
+import base64
+from docker_engine import run_operations
+
+
+# Create the Engine API config of a container, equivalent to the options of
+# the docker run command: docker run -d -P -p port:port --net=host -e env -v binds image
+def create_container_config(image, env=None, binds=None, ports=None, network_mode='host'):
+    config = {'Image': image, 'Env': env if env is not None else [],
+              'HostConfig': {'NetworkMode': network_mode, 'PublishAllPorts': True,
+                             'Binds': binds if binds is not None else []}}
+    if ports is not None:
+        config['ExposedPorts'] = dict(('{}/tcp'.format(port), {}) for port in ports)
+        config['HostConfig']['PortBindings'] = dict(('{}/tcp'.format(port), [{'HostPort': str(port)}])
+                                                    for port in ports)
+    return config
+
+
+# Get the operations of a batch which succeeded, e.g. to skip them when the batch is
+# executed again with the docker CLI.
+def get_done_operations(results):
+    return set(result['op'] for result in (results if results is not None else []) if 'error' not in result)
+
+
+class ContainerManager:
+    def __init__(self, connection=None, engine=None, script='fi-framework/src/docker_engine.py'):
+        self.connection = connection
+        self.engine = engine
+        self.script = script
+        self.image_ids = {}
+        self.container_ids = {}
+        # Set to False when the operations could not be executed, e.g. when the docker
+        # socket is not found, so the docker CLI can be used instead.
+        self.available = True
+
+    # Execute a batch of operations, None is returned when they could not be executed.
+    def execute(self, operations):
+        if self.engine is not None:
+            return run_operations(self.engine, operations)
+
+        encoded = base64.b64encode(json.dumps(operations))
+        (out, _) = self.connection.execute_cmd('python {} {}'.format(self.script, encoded), sudo=True,
+                                               print_output=False)
+        try:
+            return json.loads(out[-1].strip("\r\n"))
+        except (ValueError, IndexError):
+            print "Docker engine operations failed: {}".format(''.join(out))
+            self.available = False
+            return None
+
+    # Get the id of an image, only found ids are cached.
+    def get_image_id(self, name, tag='latest'):
+        if (name, tag) not in self.image_ids:
+            results = self.execute([{'op': 'image', 'name': name, 'tag': tag}])
+            if results is None or 'error' in results[0] or results[0]['id'] is None:
+                return None
+            self.image_ids[(name, tag)] = results[0]['id']
+        return self.image_ids[(name, tag)]
+
+    # Get the id of a running container of an image, given as id or as name:tag.
+    def get_container_id(self, image_id, image_tag=None):
+        if (image_id, image_tag) not in self.container_ids:
+            results = self.execute([{'op': 'container', 'image_id': image_id, 'image_tag': image_tag}])
+            if results is None or 'error' in results[0] or results[0]['id'] is None:
+                return None
+            self.container_ids[(image_id, image_tag)] = results[0]['id']
+        return self.container_ids[(image_id, image_tag)]
+
+    # Forget the cached ids, e.g. when containers are changed with the docker CLI.
+    def clear_cache(self):
+        self.image_ids, self.container_ids = {}, {}
+
+    # Stop and remove a container, execute the commands and create and start a new
+    # container in a single batch. The new container id (None on failure) and the
+    # results of the operations are returned. When an operation fails, a container
+    # created by the batch is removed again, so the container can be recreated.
+    def recreate(self, container_id, config, commands=None, name=None):
+        operations = [{'op': 'stop', 'container': container_id}, {'op': 'remove', 'container': container_id}]
+        operations += [{'op': 'command', 'cmd': cmd} for cmd in (commands if commands is not None else [])]
+        operations += [{'op': 'create', 'config': config, 'name': name}, {'op': 'start'}]
+        results = self.execute(operations)
+        if results is None:
+            return None, results
+
+        new_container_id = None
+        if all('error' not in result for result in results):
+            new_container_id = results[-1]['id']
+        else:
+            created_ids = [result['id'] for result in results if result['op'] == 'create' and 'error' not in result]
+            if len(created_ids) > 0:
+                self.execute([{'op': 'stop', 'container': created_ids[0]},
+                              {'op': 'remove', 'container': created_ids[0]}])
+        # The cached ids of the removed container are replaced, or forgotten on failure.
+        if 'error' not in results[1]:
+            for key, cached_id in self.container_ids.items():
+                if cached_id == container_id:
+                    self.container_ids[key] = new_container_id
+            self.container_ids = dict((key, cached_id) for key, cached_id in self.container_ids.items()
+                                      if cached_id is not None)
+        return new_container_id, results
+
+    # Execute the prepare commands, checkpoint the running container (which stops it)
+    # and execute the commands, e.g. to archive the data directory of the stopped
+    # container. Returned is whether the checkpoint was created and all commands
+    # succeeded, and the results.
+    def checkpoint(self, container_id, name, prepare_commands=None, commands=None):
+        operations = [{'op': 'command', 'cmd': cmd} for cmd in (prepare_commands if prepare_commands is not None
+                                                                 else [])]
+        operations.append({'op': 'checkpoint', 'container': container_id, 'name': name})
+        operations += [{'op': 'command', 'cmd': cmd} for cmd in (commands if commands is not None else [])]
+        results = self.execute(operations)
+        if results is None:
+            return False, results
+        return all('error' not in result for result in results), results
+
+    # Stop a container, execute the commands and resume the container from a checkpoint.
+    # Returned is whether the container was resumed after all commands succeeded, and the
+    # results.
+    def restore_checkpoint(self, container_id, name, commands=None):
+        operations = [{'op': 'stop', 'container': container_id}]
+        operations += [{'op': 'command', 'cmd': cmd} for cmd in (commands if commands is not None else [])]
+        operations.append({'op': 'start', 'container': container_id, 'checkpoint': name})
+        results = self.execute(operations)
+        if results is None:
+            return False, results
+        return all('error' not in result for result in results), results
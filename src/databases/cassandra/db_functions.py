@@ -8,6 +8,17 @@ database and obtain the results.
 
 This file is made to create a simple Apache-Cassandra wrapper.
 
+The session connects to the contact points of the cluster (the connection ips of
+all nodes) on the native protocol port, and routes each query to a replica of its
+partition with the token aware load balancing policy. The protocol frames are
+compressed when a compression library (lz4 or snappy) is installed. A session of
+a single node can be used to execute the queries on that node only.
+
+The parameterized queries are prepared once per session and cached by their query
+text, so the DBMS does not parse a query each time it is executed, and the bound
+statements carry the routing key for the token aware policy. The static queries
+are executed directly, as each of them is only executed once per process.
+
 Data sets in the form of a CSV can be loaded via 'insert_csv'  function,
 a folder structure with files (images or anything else), can be loaded via the 'insert_files'
 command.
@@ -15,7 +26,10 @@ command.
 FILE db_functions.py
 
 USAGE: python db_functions.py # This will run the can_connect function.
+       - readiness.py waits till the whole cluster is ready instead.
        - Create a DBSession to insert files or anything else.
+         db_session = DBSession('files', contact_points=['10.0.0.1', '10.0.0.2'])
+         db_session.query_db('SELECT * FROM files', node_ip='10.0.0.2')
 
 """
 
@@ -28,8 +42,12 @@ import datetime as dt
 import cassandra
 from cassandra.cluster import Cluster, NoHostAvailable, NoConnectionsAvailable
 from cassandra.protocol import ConfigurationException
+from cassandra.policies import TokenAwarePolicy, DCAwareRoundRobinPolicy, WhiteListRoundRobinPolicy
 import hashlib
 
+# The native protocol port of cassandra, port 7000 is used by the nodes to gossip.
+native_port = 9042
+
 
 # Code referenced from:
 # http://stackoverflow.com/questions/3431825/
@@ -61,23 +79,33 @@ def can_connect():
     retries = 0
     start = time.time()
     while True:
+        cluster = Cluster()
         try:
-            cluster = Cluster().connect()
+            cluster.connect()
             return retries
         except (NoHostAvailable, NoConnectionsAvailable):
             retries += 1
             time.sleep(2.0)
+        finally:
+            cluster.shutdown()
         if time.time() - start > 300:
             print "ERROR: could not connect."
             sys.exit()
 
 
 class DBSession:
-    def __init__(self, keyspace, host='127.0.0.1', port=7000, keyspace_init=None, reuse_keyspace=True):
+    def __init__(self, keyspace, host='127.0.0.1', port=native_port, keyspace_init=None, reuse_keyspace=True,
+                 contact_points=None, compression=True):
         self.keyspace = keyspace
         self.data_id = 0
         self.host = host
         self.port = port
+        self.contact_points = contact_points if contact_points else [host]
+        self.compression = compression
+        # {node_ip: session} of the sessions which only query a single node.
+        self.node_sessions = {}
+        # {(node_ip, query): prepared statement}, None is the node ip of the cluster session.
+        self.prepared_queries = {}
         self.session = self.open_db(keyspace_init, reuse_keyspace=reuse_keyspace)
         self.session.default_timeout = 60
 
@@ -89,10 +117,15 @@ class DBSession:
         self.session.execute("CREATE KEYSPACE {} ".format(self.keyspace) +
                              "WITH REPLICATION = {};".format(str(replication_parameters)), timeout=60)
 
+    def _create_cluster(self, contact_points, load_balancing_policy):
+        cluster = Cluster(contact_points, port=self.port, load_balancing_policy=load_balancing_policy,
+                          compression=self.compression)
+        cluster.connect_timeout = 20
+        return cluster
+
     # Open the database with a lot of error handling as it is not easy to check if key spaces exist.
     def open_db(self, keyspace_init=None, reuse_keyspace=True):
-        cluster = Cluster()  # Cluster([self.host], port=self.port)
-        cluster.connect_timeout = 20
+        cluster = self._create_cluster(self.contact_points, TokenAwarePolicy(DCAwareRoundRobinPolicy()))
 
         try:
             self.session = cluster.connect()
@@ -119,18 +152,41 @@ class DBSession:
             self.session.execute("USE {}".format(self.keyspace))
         return self.session
 
-    # Execute a query statement with time out 5 sec.
-    def query_db(self, query, params=None, time_out=60.0, hash_files=False):
+    # Get the session which only queries a single node, e.g. the node in which the faults
+    # are injected. The sessions are kept till the shutdown.
+    def node_session(self, node_ip):
+        if node_ip not in self.node_sessions:
+            cluster = self._create_cluster([node_ip], WhiteListRoundRobinPolicy([node_ip]))
+            try:
+                session = cluster.connect(self.keyspace)
+            except NoHostAvailable:
+                cluster.shutdown()
+                raise
+            session.default_timeout = 60
+            self.node_sessions[node_ip] = session
+        return self.node_sessions[node_ip]
+
+    # Get the prepared statement of a query in the session of a node (or of the cluster when
+    # no node ip is given). Each query is only prepared once per session.
+    def prepare_query(self, query, node_ip=None):
+        if (node_ip, query) not in self.prepared_queries:
+            session = self.session if node_ip is None else self.node_session(node_ip)
+            self.prepared_queries[(node_ip, query)] = session.prepare(query)
+        return self.prepared_queries[(node_ip, query)]
+
+    # Execute a query statement with time out 5 sec, on a single node when its ip is given.
+    def query_db(self, query, params=None, time_out=60.0, hash_files=False, node_ip=None):
         results = []
         start = time.time()
         query_res = []
         return_results = {}
 
         try:
+            session = self.session if node_ip is None else self.node_session(node_ip)
             if params is None:
-                query_res = self.session.execute(query, timeout=time_out)
+                query_res = session.execute(query, timeout=time_out)
             else:
-                query_res = self.execute_stmt(query, params, time_out=time_out)
+                query_res = session.execute(self.prepare_query(query, node_ip), params, timeout=time_out)
             return_results['timestamp'] = query_res.response_future.message.timestamp * 10.0 ** -6
         except cassandra.ReadFailure:   # Result could not be read.
             return_results['read_failure'] = 1
@@ -267,6 +323,8 @@ class DBSession:
         return self.data_id
 
     def shutdown(self):
+        for session in self.node_sessions.values():
+            session.cluster.shutdown()
         self.session.cluster.shutdown()
         self.session.shutdown()
 
@@ -0,0 +1,155 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file waits till the cassandra node of a host, and the cluster it is part of,
+is ready to be queried. Instead of connecting a new cluster object every few
+seconds, the readiness is detected in three steps:
+
+- log:     the docker log of the container is followed till cassandra logs
+           "Starting listening for CQL clients", or stops when the container does.
+- port:    the native protocol port is probed with a plain socket connect, with
+           an exponential backoff.
+- cluster: a single driver connection checks that the expected number of nodes
+           is up (gossip) and that all nodes agree on the schema.
+
+The result is printed as json, with the seconds till each step was ready:
+    {"ready": true, "time_to_ready": 21.3, "log_ready": 20.9, "port_ready": 21.0,
+     "cluster_ready": 21.3, "nodes_up": 3, "schema_agreement": true}
+
+FILE: readiness.py
+
+USAGE: python readiness.py '<json params>'
+
+       e.g. the params:
+       {"container_id": "abc", "host": "127.0.0.1", "port": 9042, "timeout": 300,
+        "expected_nodes": 3}
+
+NOTE: This file needs sudo privileges to follow the docker logs.
+"""
+
+import os
+import sys
+import json
+import time
+import select
+import socket
+import subprocess
+
+ready_log_line = 'Starting listening for CQL clients'
+
+
+# Follow the docker log of the container till the line is logged. False is returned
+# on a time out, or when the log ends because the container stopped.
+def wait_for_log_line(container_id, line, deadline):
+    p = subprocess.Popen(['docker', 'logs', '-f', container_id], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    try:
+        buf = ''
+        while time.time() < deadline:
+            (readable, _, _) = select.select([p.stdout], [], [], max(0.0, min(1.0, deadline - time.time())))
+            if len(readable) == 0:
+                continue
+            data = os.read(p.stdout.fileno(), 65536)
+            if data == '':
+                return False
+            # Keep the end of the buffer, the line could be split over two reads.
+            buf += data
+            if line in buf:
+                return True
+            buf = buf[-len(line):]
+        return False
+    finally:
+        if p.poll() is None:
+            p.terminate()
+        p.wait()
+
+
+# Probe the port with a socket connect till it accepts connections, the delay in
+# between the probes is doubled till max_delay.
+def wait_for_port(host, port, deadline, delay=0.1, max_delay=2.0):
+    while True:
+        try:
+            sock = socket.create_connection((host, port), timeout=1.0)
+            sock.close()
+            return True
+        except socket.error:
+            pass
+        if time.time() + delay > deadline:
+            return False
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+
+# Wait till the expected number of nodes is up and the nodes agree on the schema,
+# with a single cluster object which is always shut down.
+def wait_for_cluster(host, port, expected_nodes, deadline, delay=0.1, max_delay=2.0):
+    from cassandra.cluster import Cluster, NoHostAvailable
+
+    result = {'nodes_up': 0, 'schema_agreement': False}
+    while True:
+        # The driver shuts a cluster down when its first connect fails.
+        cluster = Cluster([host], port=port, connect_timeout=5)
+        try:
+            cluster.connect()
+            while True:
+                result['nodes_up'] = len([node for node in cluster.metadata.all_hosts() if node.is_up])
+                result['schema_agreement'] = cluster.control_connection.wait_for_schema_agreement(
+                    wait_time=max(1.0, deadline - time.time()))
+                if result['nodes_up'] >= expected_nodes and result['schema_agreement']:
+                    return True, result
+                if time.time() + delay > deadline:
+                    return False, result
+                time.sleep(delay)
+                delay = min(delay * 2, max_delay)
+                cluster.refresh_nodes()
+        except NoHostAvailable as e:
+            result['error'] = str(e)
+        finally:
+            cluster.shutdown()
+        if time.time() + delay > deadline:
+            return False, result
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+
+# Execute the readiness steps, the seconds since the start of the probe are recorded
+# for each ready step.
+def wait_till_ready(params):
+    start = time.time()
+    deadline = start + params.get('timeout', 300)
+    host, port = params.get('host', '127.0.0.1'), params.get('port', 9042)
+    result = {'ready': False, 'time_to_ready': None}
+
+    if params.get('container_id') is not None:
+        if not wait_for_log_line(params['container_id'], ready_log_line, deadline):
+            result['error'] = 'The log line "{}" was not found.'.format(ready_log_line)
+            return result
+        result['log_ready'] = time.time() - start
+
+    if not wait_for_port(host, port, deadline):
+        result['error'] = 'Port {}:{} is not accepting connections.'.format(host, port)
+        return result
+    result['port_ready'] = time.time() - start
+
+    try:
+        (cluster_ready, cluster_result) = wait_for_cluster(host, port, params.get('expected_nodes', 1), deadline)
+    except ImportError:
+        # Without the driver the cluster state can not be checked.
+        (cluster_ready, cluster_result) = True, {'cluster_check': 'skipped'}
+    result.update(cluster_result)
+    if not cluster_ready:
+        result.setdefault('error', 'The cluster did not become ready.')
+        return result
+    result['cluster_ready'] = time.time() - start
+
+    result['ready'] = True
+    result['time_to_ready'] = time.time() - start
+    return result
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print 'Give the json params of the readiness probe.'
+        sys.exit(1)
+    print json.dumps(wait_till_ready(json.loads(sys.argv[1])))
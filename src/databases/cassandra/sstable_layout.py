@@ -0,0 +1,278 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file parses the layout of the Cassandra SSTable components, so faults can
+be aimed at specific regions of the files instead of random offsets. The
+CompressionInfo, Index, Summary, Filter and Statistics components are parsed
+into a section map of (start, end) offset ranges per file and region:
+
+- chunk_payload:       the compressed chunks of a Data.db file.
+- chunk_crc:           the 4 byte CRC32 following each compressed chunk.
+- data:                a Data.db file without compression.
+- compression_header:  the compressor, options and lengths of CompressionInfo.db.
+- chunk_offsets:       the chunk offset array of CompressionInfo.db.
+- index_key:           the partition keys of the Index.db entries.
+- index_position:      the Data.db positions of the Index.db entries.
+- index_promoted:      the promoted (row) indices of the Index.db entries.
+- summary_header:      the header of Summary.db.
+- summary_offsets:     the index summary offsets.
+- summary_entries:     the sampled index summary entries and first/last keys.
+- bloom_filter_header: the hash and word count of Filter.db.
+- bloom_filter:        the bloom filter bitset.
+- statistics_toc:      the component table of Statistics.db.
+- statistics:          the metadata components of Statistics.db.
+
+The 'ka' (2.1/2.2) and 'ma' and newer (3.x) SSTable formats are supported; the
+maximum compressed chunk length is present in CompressionInfo.db from 'na' on.
+
+The section map is parsed once per backup snapshot, and cached in a json file
+with the snapshot fingerprint. As the parsing is done on the host, the paths in
+the data volume are mapped to the paths in the docker container.
+
+FILE: sstable_layout.py
+
+USAGE:
+    from databases.cassandra.sstable_layout import get_region_ranges
+    ranges = get_region_ranges('fi-framework/db_data', ['chunk_crc'], fingerprint,
+                               keyspaces=['files'])
+    # {container_path: [[start, end], ..], ..}
+
+"""
+
+import io
+import os
+import re
+import json
+import struct
+
+# The regions a section map can contain.
+sstable_regions = ['chunk_payload', 'chunk_crc', 'data', 'compression_header', 'chunk_offsets',
+                   'index_key', 'index_position', 'index_promoted', 'summary_header', 'summary_offsets',
+                   'summary_entries', 'bloom_filter_header', 'bloom_filter', 'statistics_toc', 'statistics']
+
+# The directory of the data volume in the Cassandra docker container.
+container_data_dir = '/var/lib/cassandra'
+
+# SSTable component names, e.g.: ma-1-big-Data.db (3.x) or files-images-ka-1-Data.db (2.x).
+component_regex = re.compile('(?:^|-)([a-z]{2})-([0-9]+)-(?:big-)?' +
+                             '(Data|CompressionInfo|Index|Summary|Filter|Statistics)\.db$')
+
+
+# Read big endian values as written by a Java DataOutput stream.
+class SSTableReader:
+    def __init__(self, path):
+        with io.open(path, 'rb') as f:
+            self.data = f.read()
+        self.offset = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def read(self, fmt):
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values[0]
+
+    def skip(self, n):
+        if n < 0 or self.offset + n > len(self.data):
+            raise ValueError('Invalid skip of {} bytes at offset {}.'.format(n, self.offset))
+        self.offset += n
+
+    def read_utf(self):
+        length = self.read('>H')
+        value = self.data[self.offset:self.offset + length]
+        self.skip(length)
+        return value
+
+    # Read an unsigned vint, the number of leading one bits of the first byte is
+    # the number of extra bytes.
+    def read_unsigned_vint(self):
+        first_byte = self.read('>B')
+        extra_bytes = 0
+        while extra_bytes < 8 and first_byte & (0x80 >> extra_bytes):
+            extra_bytes += 1
+        value = first_byte & (0xff >> extra_bytes)
+        for _ in range(extra_bytes):
+            value = (value << 8) | self.read('>B')
+        return value
+
+
+def parse_compression_info(path, version, data_length):
+    reader = SSTableReader(path)
+    reader.read_utf()  # Compressor class name.
+    for _ in range(reader.read('>i')):  # Compression options.
+        reader.read_utf(), reader.read_utf()
+    reader.read('>i')  # Chunk length.
+    if version >= 'na':
+        reader.read('>i')  # Maximum compressed chunk length.
+    reader.read('>q')  # Uncompressed data length.
+    chunk_count = reader.read('>i')
+    header_end = reader.offset
+    chunk_offsets = [reader.read('>q') for _ in range(chunk_count)]
+
+    # Each chunk is followed by a 4 byte checksum, the last chunk ends at the file end.
+    payloads, crcs = [], []
+    chunk_ends = chunk_offsets[1:] + [data_length]
+    for start, end in zip(chunk_offsets, chunk_ends):
+        if end - 4 > start:
+            payloads.append([start, end - 4])
+            crcs.append([end - 4, end])
+
+    layout = {'compression_header': [[0, header_end]], 'chunk_offsets': [[header_end, reader.offset]]}
+    return layout, {'chunk_payload': payloads, 'chunk_crc': crcs}
+
+
+def parse_index(path, version):
+    reader = SSTableReader(path)
+    layout = {'index_key': [], 'index_position': [], 'index_promoted': []}
+    while reader.offset < len(reader):
+        key_start = reader.offset
+        reader.skip(reader.read('>H'))
+        position_start = reader.offset
+        if version >= 'ma':
+            reader.read_unsigned_vint()
+            promoted_start = reader.offset
+            promoted_size = reader.read_unsigned_vint()
+        else:
+            reader.read('>q')
+            promoted_start = reader.offset
+            promoted_size = reader.read('>i')
+        reader.skip(promoted_size)
+
+        layout['index_key'].append([key_start, position_start])
+        layout['index_position'].append([position_start, promoted_start])
+        if promoted_size > 0:
+            layout['index_promoted'].append([promoted_start, reader.offset])
+    return layout
+
+
+def parse_summary(path):
+    reader = SSTableReader(path)
+    reader.read('>i')  # Minimal index interval.
+    offset_count = reader.read('>i')
+    reader.read('>q')  # Size of the offsets and entries.
+    reader.read('>i'), reader.read('>i')  # Sampling level and size at full sampling.
+    header_end = reader.offset
+    reader.skip(offset_count * 4)
+    return {'summary_header': [[0, header_end]],
+            'summary_offsets': [[header_end, reader.offset]],
+            'summary_entries': [[reader.offset, len(reader)]]}
+
+
+def parse_filter(path):
+    reader = SSTableReader(path)
+    reader.read('>i')  # Hash count.
+    reader.read('>i')  # Number of words of the bitset.
+    return {'bloom_filter_header': [[0, reader.offset]], 'bloom_filter': [[reader.offset, len(reader)]]}
+
+
+def parse_statistics(path):
+    reader = SSTableReader(path)
+    component_offsets = []
+    for _ in range(reader.read('>i')):
+        reader.read('>i')  # Metadata type.
+        component_offsets.append(reader.read('>i'))
+    toc_end = reader.offset
+
+    # Each component ends at the start of the next one.
+    component_ends = sorted(component_offsets)[1:] + [len(reader)]
+    components = [[start, end] for start, end in zip(sorted(component_offsets), component_ends) if end > start]
+    return {'statistics_toc': [[0, toc_end]], 'statistics': components}
+
+
+# Parse the section map of all components of a single SSTable, given as
+# {component name: path}.
+def parse_sstable(components, version):
+    layouts = {}
+    parsers = [('Index', lambda path: parse_index(path, version)), ('Summary', parse_summary),
+               ('Filter', parse_filter), ('Statistics', parse_statistics)]
+
+    data_path = components.get('Data')
+    if data_path is not None:
+        layouts[data_path] = {'data': [[0, os.path.getsize(data_path)]]}
+        if 'CompressionInfo' in components:
+            try:
+                info_layout, data_layout = parse_compression_info(components['CompressionInfo'], version,
+                                                                  os.path.getsize(data_path))
+                layouts[components['CompressionInfo']] = info_layout
+                layouts[data_path] = data_layout
+            except (struct.error, ValueError, IOError):
+                pass
+
+    for component, parser in parsers:
+        if component in components:
+            try:
+                layouts[components[component]] = parser(components[component])
+            except (struct.error, ValueError, IOError):
+                continue
+    return layouts
+
+
+# Parse the section maps of all SSTables in the data directory, optionally only of the
+# given keyspaces. The paths are mapped to the paths in the docker container.
+def parse_data_dir(data_dir, keyspaces=None):
+    sstables = {}
+    for root_dir, _, files in os.walk(os.path.join(data_dir, 'data')):
+        if keyspaces is not None:
+            keyspace = os.path.relpath(root_dir, os.path.join(data_dir, 'data')).split(os.sep)[0]
+            if keyspace not in keyspaces:
+                continue
+        for name in files:
+            result = component_regex.search(name)
+            if result is None:
+                continue
+            version, generation, component = result.groups()
+            sstable = sstables.setdefault((root_dir, version, generation), {})
+            sstable[component] = os.path.join(root_dir, name)
+
+    section_map = {}
+    for (_, version, _), components in sstables.items():
+        for path, layout in parse_sstable(components, version).items():
+            section_map[to_container_path(path, data_dir)] = layout
+    return section_map
+
+
+# Map a path in the data volume on the host to the path in the docker container.
+def to_container_path(path, data_dir):
+    return container_data_dir + '/' + os.path.relpath(path, data_dir).replace(os.sep, '/')
+
+
+# Load the section map from the cache, or parse and cache it when the snapshot changed.
+def load_section_map(data_dir, fingerprint, keyspaces=None, cache_file='fi-framework/sstable_layout_cache.json'):
+    cache_key = json.dumps(sorted(keyspaces) if keyspaces is not None else None)
+    cache = {'fingerprint': fingerprint, 'section_maps': {}}
+    if fingerprint is not None and os.path.exists(cache_file):
+        with io.open(cache_file, 'r') as f:
+            try:
+                cached = json.loads(f.read())
+            except ValueError:
+                cached = None
+        if cached is not None and cached['fingerprint'] == fingerprint:
+            cache = cached
+            if cache_key in cache['section_maps']:
+                return cache['section_maps'][cache_key]
+
+    section_map = parse_data_dir(data_dir, keyspaces)
+    if fingerprint is not None:
+        cache['section_maps'][cache_key] = section_map
+        with io.open(cache_file, 'w') as f:
+            f.write(unicode(json.dumps(cache)))
+    return section_map
+
+
+# Get the offset ranges of the requested regions of each file, as:
+# {container_path: [[start, end], ..], ..}
+def get_region_ranges(data_dir, regions, fingerprint, keyspaces=None):
+    unknown_regions = set(regions) - set(sstable_regions)
+    if len(unknown_regions) > 0:
+        raise ValueError('Unknown SSTable regions: {}, implemented: {}'.format(list(unknown_regions),
+                                                                                sstable_regions))
+
+    region_ranges = {}
+    for path, layout in load_section_map(data_dir, fingerprint, keyspaces).items():
+        ranges = [[start, end] for region in regions for start, end in layout.get(region, []) if end > start]
+        if len(ranges) > 0:
+            region_ranges[path] = ranges
+    return region_ranges
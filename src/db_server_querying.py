@@ -13,7 +13,7 @@ files also is performed using the restore command in this file.
 
 FILE: db_server_querying.py
 
-USAGE: python db_server_querying.py scenario.json index '{"type": "query/verify/test/restore"}'
+USAGE: python db_server_querying.py scenario.json index '{"type": "query/verify/test/restore/collect_logs/sstable_regions/stat_paths"}'
        Also see the main method of this file for more information.
 
 """
@@ -23,10 +23,14 @@ import json
 import os
 import io
 import re
+import select
 import subprocess
 import tarfile
-from utils import print_json, load_json_file, ascii_encode_dict, gen_checksum_from_file, color_str
+from utils import print_json, load_json_file, ascii_encode_dict, gen_checksum_from_file, gen_checksum_from_bytes, \
+    color_str
 from verify_db import SQLiteDB
+from log_correlation import filter_log_lines
+from workload import expand_workload
 
 
 # Insert data in the database.
@@ -59,12 +63,18 @@ def create_dbsession_from_type(db_type, db_meta, host='127.0.0.1', force_reuse_k
         if force_reuse_keyspace:  # Do only delete the keyspace when inserting data.
             db_reuse_key = True
         db_init_params = db_meta['init'] if 'init' in db_meta else None
+        # - Optional: The connection ips of all nodes are the contact points of the cluster,
+        #             the given host is contacted first.
+        # - Optional: The native protocol port, default 9042, and the protocol compression.
+        contact_points = [host] + [ip for ip in db_meta.get('connection_ip', []) if ip != host]
 
         # Load cassandra db_functions.
-        from databases.cassandra.db_functions import DBSession
+        from databases.cassandra.db_functions import DBSession, native_port
         # Ascii is only accepted...
         db_init_params = ascii_encode_dict(db_init_params)
-        db_session = DBSession(db_key, host=host, keyspace_init=db_init_params, reuse_keyspace=db_reuse_key)
+        db_session = DBSession(db_key, host=host, port=db_meta.get('port', native_port),
+                               keyspace_init=db_init_params, reuse_keyspace=db_reuse_key,
+                               contact_points=contact_points, compression=db_meta.get('compression', True))
 
     if db_session is None:
         print "Session could not be started with db_type: {}.".format(db_type)
@@ -77,12 +87,15 @@ def verify_and_test_db(main_file, host_id, run_params):
     # Parse main query file.
     parse_data = load_json_file(main_file)
     query_data = load_json_file('fi-framework/' + parse_data['query_file'])
-    queries = query_data['queries']
+    queries = expand_workload(query_data)
 
     db_type = parse_data['db_type']
     db_init = parse_data['db_meta']
 
+    # Connect to the DBMS node of this host via its connection ip.
     localhost = '127.0.0.1'
+    if len(db_init.get('connection_ip', [])) > host_id:
+        localhost = db_init['connection_ip'][host_id]
     run_type = run_params['type']
     db_session = None
     if db_type == 'cassandra' and run_type in ['verify', 'test', 'query']:
@@ -103,25 +116,38 @@ def verify_and_test_db(main_file, host_id, run_params):
         _test_cmd(db_session, queries, run_params, db_type)
         db_session.shutdown()
     elif run_type == 'retrieve_targets':  # Retrieve DBMS target files.
-        password = ''
-        if 'password' in parse_data['server_meta']:
-            password = parse_data['server_meta']['password']
-            if not (isinstance(password, unicode) or isinstance(password, str)):
-                password = password[host_id]
+        password = _get_host_password(parse_data, host_id)
         _retrieve_cmd(run_params, parse_data, password, db_type)
     elif run_type == 'clear_verification_db':  # Clear the verification DBMS.
         print "Deleting verification db."
         verification_db = SQLiteDB()
         verification_db.drop_table()
     elif run_type == 'restore':  # Restore the current db_data directory with the backup tar.
-        _restore_cmd(run_params)
+        print json.dumps(_restore_cmd(run_params))
     elif run_type == 'query':  # Query the DBSession.
         _query_cmd(db_session, run_params)
         db_session.shutdown()
+    elif run_type == 'collect_logs':  # Print the relevant container logs since a time stamp.
+        _collect_logs_cmd(run_params)
+    elif run_type == 'stat_paths':  # Stat paths in the container in a single call.
+        password = _get_host_password(parse_data, host_id)
+        print json.dumps(stat_container_paths(run_params['container_id'], run_params['paths'], password))
+    elif run_type == 'sstable_regions':  # Print the offset ranges of SSTable regions.
+        _sstable_regions_cmd(run_params, parse_data, db_type)
     else:
         print "Unknown command given: {}".format(run_type)
 
 
+# Get the sudo password of a host from the scenario file.
+def _get_host_password(parse_data, host_id):
+    password = ''
+    if 'password' in parse_data['server_meta']:
+        password = parse_data['server_meta']['password']
+        if not (isinstance(password, unicode) or isinstance(password, str)):
+            password = password[host_id]
+    return password
+
+
 def _insert_and_verify_cmd(parse_data, db_session, queries):
     if 'insert_data' in parse_data and parse_data['insert_data'] == True:
         insert_data(db_session, parse_data['data_to_insert'])
@@ -137,9 +163,9 @@ def _insert_and_verify_cmd(parse_data, db_session, queries):
     if 'files' in parse_data['data_to_insert']:
         hash_data = True
 
-    for query in queries:
-        print "Querying: {}".format(query)
-        query_res = db_session.query_db(query, hash_files=hash_data, time_out=300)
+    for (query, params) in queries:
+        print "Querying: {} {}".format(query, params if params is not None else '')
+        query_res = db_session.query_db(query, params, hash_files=hash_data, time_out=300)
         query_res_count = 0
         # Row result is expected to contain:
         # [[ID, file hashed by query_db function, file name], ...]
@@ -149,7 +175,7 @@ def _insert_and_verify_cmd(parse_data, db_session, queries):
         if query_res_count == 0:
             warning = color_str("WARNING: ", color='y')
             print warning, "Invalid query occurred, no results retrieved (may be intentional)."
-            print warning, "QUERY {}".format(query)
+            print warning, "QUERY {} {}".format(query, params if params is not None else '')
             print warning, "RESULT {}".format(query_res)
         query_results.append(query_res)
         query_id += 1
@@ -174,11 +200,16 @@ def _test_cmd(db_session, queries, run_params, db_type):
                       "write_failure", "invalid_request", "no_host_available"]
 
     query_id = 0
-    for query in queries:
+    for (query, params) in queries:
+        if stop_requested():
+            print "=== Stopped after {} of {} queries ===".format(query_id, len(queries))
+            break
+
         # Query the database and check the query results.
         # The expected result is formatted as:
         # {result: [[ID, File contents hash, File name], ...], timeout: 1, ..}
-        query_res = db_session.query_db(query, hash_files=hash_data, time_out=300)
+        query_res = db_session.query_db(query, params, hash_files=hash_data, time_out=300,
+                                        node_ip=run_params.get('node_ip'))
         query_faults[query_id] = {}
         if len(query_res['result']) == 0:
             for error in error_list:
@@ -209,6 +240,15 @@ def _test_cmd(db_session, queries, run_params, db_type):
     print "'{}'".format(json.dumps(query_faults))
 
 
+# Check if the client requested to stop the test queries, with a stop line on stdin.
+def stop_requested(stdin=sys.stdin):
+    try:
+        (readable, _, _) = select.select([stdin], [], [], 0)
+    except (select.error, ValueError, io.UnsupportedOperation):
+        return False
+    return len(readable) > 0 and stdin.readline().strip() == 'stop'
+
+
 # Verify the results of a query on duplicates, by checking the ids
 # and the file name if they did not already occur somewhere.
 # The query res rows are expected to be in the format [ID, ..., file name].
@@ -229,10 +269,65 @@ def _verify_query(query_res):
     return duplicates
 
 
-def _retrieve_cmd(run_params, parse_data, password, db_type):
+# The scenario fields which determine the target list of a scenario.
+target_filter_fields = ['excluded_files', 'excluded_extensions', 'target_sys_files', 'exclude_containing']
+
+
+# Print the target list of a scenario. Scenarios with the same target filters share a
+# cached target list, as long as the backup snapshot of the data did not change.
+def _retrieve_cmd(run_params, parse_data, password, db_type, cache_file='fi-framework/target_list_cache.json'):
     scenario_id = run_params['scenario_id']
     test_scenario = parse_data['test_scenarios']['scenarios'][scenario_id]
-
+    use_cache = run_params['use_cache'] if 'use_cache' in run_params else True
+
+    cache_key = json.dumps([db_type] + [test_scenario.get(field) for field in target_filter_fields], sort_keys=True)
+    fingerprint = get_snapshot_fingerprint(run_params['backup'] if 'backup' in run_params else
+                                           'fi-framework/backup.tar.gz')
+    cache = load_target_list_cache(cache_file, fingerprint)
+    if use_cache and cache_key in cache['target_lists']:
+        target_list = cache['target_lists'][cache_key]
+    else:
+        target_list = _retrieve_target_list(test_scenario, run_params['container_id'], password, db_type)
+        # Do not cache a list of a failed retrieval, or when there is no snapshot yet.
+        if len(target_list) > 0 and fingerprint is not None:
+            cache['target_lists'][cache_key] = target_list
+            with io.open(cache_file, 'w') as f:
+                f.write(unicode(json.dumps(cache)))
+
+    for target in target_list:
+        print target
+
+
+# Fingerprint the backup snapshot via its file list manifest ({file_name: checksum}),
+# and the size and modification time of the backup archive itself. None is returned
+# when there is no backup yet.
+def get_snapshot_fingerprint(backup_path, backup_file_list=None):
+    if not os.path.exists(backup_path):
+        return None
+    if backup_file_list is None:
+        backup_file_list = get_backup_file_list(backup_path)
+    backup_stat = os.stat(backup_path)
+    with tarfile.open(backup_path) as backup_file:
+        tar_file_list = _get_tar_file_list(backup_file_list, backup_file)
+    manifest = json.dumps([backup_stat.st_size, backup_stat.st_mtime, tar_file_list], sort_keys=True)
+    return gen_checksum_from_bytes(manifest)
+
+
+# Load the cached target lists, which are invalidated when the snapshot fingerprint changed.
+def load_target_list_cache(cache_file, fingerprint):
+    if fingerprint is not None and os.path.exists(cache_file):
+        with io.open(cache_file, 'r') as f:
+            try:
+                cache = json.loads(f.read())
+            except ValueError:
+                cache = None
+        if cache is not None and cache['fingerprint'] == fingerprint:
+            return cache
+    return {'fingerprint': fingerprint, 'target_lists': {}}
+
+
+# Retrieve the valid target files of a scenario from the files traced in the container.
+def _retrieve_target_list(test_scenario, container_id, password, db_type):
     # Get the requested features of the target list.
     excluded_files = test_scenario['excluded_files'] if 'excluded_files' in test_scenario else None
     excluded_ext = test_scenario['excluded_extensions'] if 'excluded_extensions' in test_scenario else None
@@ -241,54 +336,69 @@ def _retrieve_cmd(run_params, parse_data, password, db_type):
 
     # Get the file list via a sudo command, as the file pointer of the files used in this script
     # can already be in use.
-    container_id = run_params['container_id']
     strace_cmd = os.path.dirname(os.path.abspath(__file__)) + os.sep + 'attach_strace.py'
     p = subprocess.Popen(['sudo', '-S', 'python', strace_cmd, db_type, 'list'], stdin=subprocess.PIPE,
                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
     (db_files, err) = p.communicate(password + '\n')
 
-    db_files = db_files.split('\n')
-    db_files = list(set(db_files))
+    db_files = set(db_files.split('\n'))
 
-    # Filter on specific file extensions.
+    # Filter on specific file extensions and excluded substrings.
     if excluded_ext is not None:
-        excluded_files = [db_file for db_file in db_files for ext in excluded_ext if db_file.endswith(ext)]
-        db_files = list(set(db_files) - set(excluded_files))
+        db_files = set(db_file for db_file in db_files if not db_file.endswith(tuple(excluded_ext)))
 
     if excluded_substrs is not None:
         db_files = remove_substrs_from_db_files(db_files, excluded_substrs)
 
-    base_cmd = ['sudo', '-S', 'docker', 'exec', container_id, 'file']
-
-    # Now retrieve a valid target file list.
+    # Skip non path files such as inode, excluded files and some system files.
+    candidates = []
     for db_file in db_files:
-        # Skip non path files such as inode, excluded files and some system files.
         if (db_file == '') or (db_file[0] != '/') or \
            (excluded_files is not None and db_file in excluded_files) or \
            (not target_sys_files and db_file in ['/proc/stat/', '/proc/stat', '/dev/urandom', '/dev/random']):
             continue
-
-        # Check if the file is not a directory and exists.
-        p = subprocess.Popen(base_cmd + [db_file], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE, universal_newlines=True)
-        (out, err) = p.communicate(password + '\n')
-        if not (': directory' in out or '(No such file or directory)' in out):
-            print db_file
-
-
+        candidates.append(db_file)
+
+    # Now retrieve a valid target file list, by checking in a single call if the
+    # files exist and are not a directory.
+    path_stats = stat_container_paths(container_id, candidates, password)
+    return [db_file for db_file, path_stat in sorted(path_stats.items())
+            if path_stat['exists'] and path_stat['type'] != 'directory']
+
+
+# Stat all paths inside a container via the stat_paths.py file copied into the container.
+def stat_container_paths(container_id, paths, password, stat_script='/stat_paths.py'):
+    if len(paths) == 0:
+        return {}
+    p = subprocess.Popen(['sudo', '-S', 'docker', 'exec', '-i', container_id, 'python', stat_script],
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                         universal_newlines=True)
+    (out, err) = p.communicate(password + '\n' + json.dumps(paths) + '\n')
+    try:
+        return json.loads(out.strip().split('\n')[-1])
+    except ValueError:
+        print >> sys.stderr, err
+        return {}
+
+
+# Remove the files containing one of the substrings (regular expressions), which
+# are combined into a single expression.
 def remove_substrs_from_db_files(db_files, excluded_substrs):
-    to_remove = []
-    for db_file in db_files:
-        for substr in excluded_substrs:
-            pattern = re.compile(substr)
-            if pattern.search(db_file):
-                to_remove.append(db_file)
-    return list(set(db_files) - set(to_remove))
+    if len(excluded_substrs) == 0:
+        return list(db_files)
+    pattern = re.compile('|'.join('(?:{})'.format(substr) for substr in excluded_substrs))
+    return [db_file for db_file in set(db_files) if not pattern.search(db_file)]
 
 
-def _restore_cmd(run_params, backup_file_list='fi-framework/backup_file_list.json'):
+# Restore the modified and removed files of the data directory from the backup, and
+# remove the new files. The number of removed and restored files and the restored
+# bytes are returned.
+def _restore_cmd(run_params, backup_file_list=None):
     backup_path = run_params['backup']
     data_path = run_params['data']
+    if backup_file_list is None:
+        backup_file_list = get_backup_file_list(backup_path)
+    restore_stats = {'removed_files': 0, 'restored_files': 0, 'restored_bytes': 0}
 
     backup_file = tarfile.open(backup_path)
     tar_file_list = _get_tar_file_list(backup_file_list, backup_file)
@@ -304,14 +414,16 @@ def _restore_cmd(run_params, backup_file_list='fi-framework/backup_file_list.jso
         # It is a newly added file. Which has to be removed.
         if data_file not in tar_file_list:
             os.remove(data_file)
+            restore_stats['removed_files'] += 1
         else:  # Now check if it is a changed files
             with io.open(data_file, 'rb') as f:
                 if tar_file_list[data_file] != gen_checksum_from_file(f, use_file=True):
                     modified_files.append(data_file)
 
     # No files are changed here, and all files specific files are still there.
-    if len(modified_files) == 0 and len(data_files) == len(tar_file_list):
-        return
+    if len(modified_files) == 0 and len(data_files) - restore_stats['removed_files'] == len(tar_file_list):
+        backup_file.close()
+        return restore_stats
 
     # Check if all backup files exists..
     for backup_file_path in tar_file_list:
@@ -324,16 +436,29 @@ def _restore_cmd(run_params, backup_file_list='fi-framework/backup_file_list.jso
             if member.name in modified_files:
                 backup_file.extract(member)
                 modified_files.remove(member.name)
+                restore_stats['restored_files'] += 1
+                restore_stats['restored_bytes'] += member.size
                 if len(modified_files) == 0:
                     break
     backup_file.close()
+    return restore_stats
+
+
+# Get the file of the cached checksum list of a backup archive, each archive (e.g. the
+# backup and the checkpoint archive) has its own list:
+# fi-framework/backup.tar.gz -> fi-framework/backup_file_list.json
+def get_backup_file_list(backup_path):
+    name = backup_path[:-len('.tar.gz')] if backup_path.endswith('.tar.gz') else os.path.splitext(backup_path)[0]
+    return name + '_file_list.json'
 
 
 def _get_tar_file_list(backup_file_list, backup_file):
     tar_file_list = {}
     # Create a {file_name : checksum} dictionary of all backup files.
-    # This has only to be created once. Else all data can just be read again.
-    if os.path.exists(backup_file_list):
+    # This has only to be created once per archive. Else all data can just be read again.
+    # The list is created again when the archive was recreated after it.
+    if os.path.exists(backup_file_list) and \
+       os.path.getmtime(backup_file_list) >= os.path.getmtime(backup_file.name):
         with io.open(backup_file_list, 'r') as f:
             tar_file_list = json.loads(f.read())
     else:
@@ -348,6 +473,41 @@ def _get_tar_file_list(backup_file_list, backup_file):
     return tar_file_list
 
 
+# Print the offset ranges of the requested SSTable regions of all files in the data
+# directory as json: {container_path: [[start, end], ..], ..}. Only the SSTables of
+# the keyspace of the scenario file are used.
+def _sstable_regions_cmd(run_params, parse_data, db_type):
+    if db_type != 'cassandra':
+        print "SSTable regions are not supported for db_type: {}".format(db_type)
+        return
+
+    from databases.cassandra.sstable_layout import get_region_ranges
+    regions = run_params['regions']
+    if not isinstance(regions, list):
+        regions = [regions]
+    fingerprint = get_snapshot_fingerprint(run_params['backup'] if 'backup' in run_params else
+                                           'fi-framework/backup.tar.gz')
+    data_dir = run_params['data'] if 'data' in run_params else 'fi-framework/db_data'
+    keyspaces = [parse_data['db_meta']['keyspace']] if 'keyspace' in parse_data['db_meta'] else None
+    print json.dumps(get_region_ranges(data_dir, regions, fingerprint, keyspaces=keyspaces))
+
+
+# Stream the docker logs of a container written since the 'since' time stamp (optional),
+# and only print the warnings, errors and their stack traces as they arrive.
+def _collect_logs_cmd(run_params):
+    logs_cmd = ['docker', 'logs']
+    if 'since' in run_params:
+        logs_cmd += ['--since', str(run_params['since'])]
+    logs_cmd.append(run_params['container_id'])
+
+    p = subprocess.Popen(logs_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    for line in filter_log_lines(iter(p.stdout.readline, '')):
+        sys.stdout.write(line)
+        sys.stdout.flush()
+    p.stdout.close()
+    p.wait()
+
+
 def _query_cmd(db_session, run_params):
     timeout = 60
     hash_files = False
@@ -356,17 +516,24 @@ def _query_cmd(db_session, run_params):
         hash_files = True
     if 'time_out' in run_params:
         timeout = run_params['time_out']
-    print db_session.query_db(run_params['query'], time_out=timeout, hash_files=hash_files)
+    print db_session.query_db(run_params['query'], time_out=timeout, hash_files=hash_files,
+                              node_ip=run_params.get('node_ip'))
 
 
 if __name__ == '__main__':
     if len(sys.argv) < 4:
-        print "Usage: python db_sever_querying.py <main_json.json> <host_id> <json_params>"
+        print "Usage: python db_sever_querying.py <main_json.json> <host_id> <json_params | @params_file>"
         print "Where <json params> could be:"
-        print "      {type: query, query:.., query_type:.., timeout:..}"
+        print "      {type: query, query:.., query_type:.., timeout:.., node_ip:..}"
         print "      {type: verify}"
         print "      {type: test, test_id, ..}"
         print "      {type: restore, backup: backup_path, data: data_path}"
+        print "      {type: collect_logs, container_id: id, since: unix_timestamp}"
         sys.exit()
 
-    verify_and_test_db(sys.argv[1], int(sys.argv[2]), json.loads(sys.argv[3].strip("'")))
+    # Large run params, e.g. long path lists, are given as a json file.
+    if sys.argv[3].startswith('@'):
+        main_run_params = load_json_file(sys.argv[3][1:])
+    else:
+        main_run_params = json.loads(sys.argv[3].strip("'"))
+    verify_and_test_db(sys.argv[1], int(sys.argv[2]), main_run_params)
@@ -0,0 +1,276 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file talks to the Docker Engine API over its unix socket, instead of
+parsing the text output of the docker CLI. A batch of container operations is
+executed in a single call of this file, so the client only needs a single
+(SSH) command per host to e.g. stop, remove, restore and start a container:
+
+- image:     find the id of an image given its name and tag.
+- container: find the id of a running container given its image id or name:tag.
+- stop:      stop a container.
+- remove:    remove a container.
+- create:    create a container from a config as the Engine API expects it.
+- start:     start a container, the last created container when none is given. A
+             container is resumed from a checkpoint when its name is given.
+- checkpoint: checkpoint a running container with CRIU, which stops it by default.
+- command:   execute a shell command in between, e.g. to restore the data volume.
+
+Each operation result contains its duration in seconds, and an error message when
+it failed (for a command: a non-zero exit code); the following operations are still
+executed.
+
+A FakeDockerEngine with the same interface keeps the images and containers in
+memory, so the batches can be tested without docker.
+
+FILE: docker_engine.py
+
+USAGE: python docker_engine.py <base64 encoded json list of operations> [socket_path]
+
+       e.g. the operations:
+       [{"op": "stop", "container": "abc"}, {"op": "remove", "container": "abc"},
+        {"op": "command", "cmd": "python restore.py"},
+        {"op": "create", "config": {"Image": "def", ..}}, {"op": "start"}]
+
+       The results are printed as a json list.
+
+NOTE: This file needs sudo privileges to access the docker socket.
+"""
+
+import sys
+import json
+import time
+import uuid
+import base64
+import socket
+import httplib
+import urllib
+import subprocess
+
+# The API version used, as supported by docker 1.12 and newer.
+api_version = 'v1.24'
+
+# The API version of the checkpoint operations, which need docker 1.13 or newer with
+# the experimental features enabled and CRIU installed.
+checkpoint_api_version = 'v1.25'
+
+
+class DockerEngineError(Exception):
+    def __init__(self, status, message):
+        Exception.__init__(self, '{}: {}'.format(status, message))
+        self.status = status
+
+
+# An HTTP connection over a unix socket.
+class UnixHTTPConnection(httplib.HTTPConnection):
+    def __init__(self, socket_path, timeout=120):
+        httplib.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+# Get the short (12 character) id of a docker id, e.g. 'sha256:0123..'.
+def short_id(docker_id):
+    return docker_id.split(':')[-1][:12]
+
+
+class DockerEngine:
+    def __init__(self, socket_path='/var/run/docker.sock'):
+        self.socket_path = socket_path
+
+    # Send a request to the Engine API, the decoded json response is returned.
+    def request(self, method, path, body=None, params=None, version=api_version):
+        url = '/{}{}'.format(version, path)
+        if params:
+            url += '?' + urllib.urlencode(params)
+        connection = UnixHTTPConnection(self.socket_path)
+        try:
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            connection.request(method, url, json.dumps(body) if body is not None else None, headers)
+            response = connection.getresponse()
+            data = response.read()
+        finally:
+            connection.close()
+
+        # 304: the container was already stopped or started.
+        if response.status >= 400:
+            try:
+                message = json.loads(data)['message']
+            except (ValueError, KeyError, TypeError):
+                message = data
+            raise DockerEngineError(response.status, message)
+        return json.loads(data) if data.strip() != '' else None
+
+    def find_image(self, name, tag='latest'):
+        for image in self.request('GET', '/images/json'):
+            if '{}:{}'.format(name, tag) in (image.get('RepoTags') or []):
+                return short_id(image['Id'])
+        return None
+
+    # Find a running container of an image, given as id or as name:tag.
+    def find_container(self, image_id, image_tag=None):
+        for container in self.request('GET', '/containers/json'):
+            if (image_id is not None and (container['Image'] == image_id or
+                                          short_id(container.get('ImageID', '')) == image_id)) or \
+               (image_tag is not None and container['Image'] == image_tag):
+                return short_id(container['Id'])
+        return None
+
+    def stop(self, container_id, timeout=10):
+        self.request('POST', '/containers/{}/stop'.format(container_id), params={'t': timeout})
+
+    def remove(self, container_id):
+        self.request('DELETE', '/containers/{}'.format(container_id))
+
+    def create(self, config, name=None):
+        return short_id(self.request('POST', '/containers/create', body=config,
+                                     params={'name': name} if name is not None else None)['Id'])
+
+    def start(self, container_id, checkpoint=None):
+        if checkpoint is None:
+            self.request('POST', '/containers/{}/start'.format(container_id))
+        else:
+            self.request('POST', '/containers/{}/start'.format(container_id), params={'checkpoint': checkpoint},
+                         version=checkpoint_api_version)
+
+    # Checkpoint a container, an earlier checkpoint with the same name is replaced.
+    def checkpoint(self, container_id, name, exit_container=True):
+        try:
+            self.request('DELETE', '/containers/{}/checkpoints/{}'.format(container_id, name),
+                         version=checkpoint_api_version)
+        except DockerEngineError:
+            pass
+        self.request('POST', '/containers/{}/checkpoints'.format(container_id),
+                     body={'CheckpointID': name, 'Exit': exit_container}, version=checkpoint_api_version)
+
+
+# An in memory stand-in of the DockerEngine, to test the container operations. The
+# checkpoint operations fail when criu is not set, as without CRIU installed.
+class FakeDockerEngine:
+    def __init__(self, images=None, criu=True):
+        # {image_id: ['name:tag', ..]}
+        self.images = images if images is not None else {}
+        # {container_id: {'Image': .., 'ImageID': .., 'running': bool, 'config': .., 'name': ..,
+        #                 'checkpoints': [..]}}
+        self.containers = {}
+        self.criu = criu
+
+    def _get_container(self, container_id):
+        for cur_id, container in self.containers.items():
+            if cur_id.startswith(container_id) or container['name'] == container_id:
+                return container
+        raise DockerEngineError(404, 'No such container: {}'.format(container_id))
+
+    def find_image(self, name, tag='latest'):
+        for image_id, tags in self.images.items():
+            if '{}:{}'.format(name, tag) in tags:
+                return short_id(image_id)
+        return None
+
+    def find_container(self, image_id, image_tag=None):
+        for container_id, container in sorted(self.containers.items()):
+            if container['running'] and ((image_id is not None and (container['Image'] == image_id or
+                                                                   short_id(container['ImageID']) == image_id)) or
+                                         (image_tag is not None and container['Image'] == image_tag)):
+                return short_id(container_id)
+        return None
+
+    def stop(self, container_id, timeout=10):
+        self._get_container(container_id)['running'] = False
+
+    def remove(self, container_id):
+        container = self._get_container(container_id)
+        if container['running']:
+            raise DockerEngineError(409, 'You cannot remove a running container')
+        self.containers = dict((cur_id, cur) for cur_id, cur in self.containers.items() if cur is not container)
+
+    def create(self, config, name=None):
+        image = config['Image']
+        image_id = None
+        for cur_id, tags in self.images.items():
+            if image in tags or image == cur_id or image == short_id(cur_id):
+                image_id = cur_id
+        if image_id is None:
+            raise DockerEngineError(404, 'No such image: {}'.format(image))
+        container_id = uuid.uuid4().hex + uuid.uuid4().hex
+        self.containers[container_id] = {'Image': image, 'ImageID': image_id, 'running': False,
+                                         'config': config, 'name': name, 'checkpoints': []}
+        return short_id(container_id)
+
+    def start(self, container_id, checkpoint=None):
+        container = self._get_container(container_id)
+        if checkpoint is not None and checkpoint not in container['checkpoints']:
+            raise DockerEngineError(404, 'No such checkpoint: {}'.format(checkpoint))
+        container['running'] = True
+
+    def checkpoint(self, container_id, name, exit_container=True):
+        container = self._get_container(container_id)
+        if not self.criu:
+            raise DockerEngineError(500, 'Cannot checkpoint container: criu is not installed')
+        if not container['running']:
+            raise DockerEngineError(409, 'Container {} is not running'.format(container_id))
+        if name not in container['checkpoints']:
+            container['checkpoints'].append(name)
+        if exit_container:
+            container['running'] = False
+
+
+# Execute the operations in order, the results are returned as a list.
+def run_operations(engine, operations):
+    results = []
+    created_id = None
+    for operation in operations:
+        start = time.time()
+        result = {'op': operation['op']}
+        try:
+            if operation['op'] == 'image':
+                result['id'] = engine.find_image(operation['name'], operation.get('tag', 'latest'))
+            elif operation['op'] == 'container':
+                result['id'] = engine.find_container(operation.get('image_id'), operation.get('image_tag'))
+            elif operation['op'] == 'stop':
+                engine.stop(operation['container'], operation.get('timeout', 10))
+            elif operation['op'] == 'remove':
+                engine.remove(operation['container'])
+            elif operation['op'] == 'create':
+                created_id = engine.create(operation['config'], operation.get('name'))
+                result['id'] = created_id
+            elif operation['op'] == 'start':
+                container_id = operation.get('container', created_id)
+                if container_id is None:
+                    raise DockerEngineError(404, 'No container created to start.')
+                engine.start(container_id, operation.get('checkpoint'))
+                result['id'] = container_id
+            elif operation['op'] == 'checkpoint':
+                engine.checkpoint(operation['container'], operation['name'], operation.get('exit', True))
+            elif operation['op'] == 'command':
+                p = subprocess.Popen(operation['cmd'], shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                (out, _) = p.communicate()
+                result['returncode'] = p.returncode
+                result['output'] = out.splitlines()[-10:]
+                if p.returncode != 0:
+                    result['error'] = 'Command exited with: {}'.format(p.returncode)
+            else:
+                raise ValueError('Unknown operation: {}'.format(operation['op']))
+        except (DockerEngineError, socket.error, ValueError, KeyError) as e:
+            result['error'] = str(e)
+            # Without a docker socket none of the operations can be executed.
+            if isinstance(e, socket.error) and operation['op'] in ['image', 'container']:
+                raise
+        result['duration'] = time.time() - start
+        results.append(result)
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print 'Give the base64 encoded json list of operations.'
+        sys.exit(1)
+    docker_engine = DockerEngine(sys.argv[2]) if len(sys.argv) > 2 else DockerEngine()
+    print json.dumps(run_operations(docker_engine, json.loads(base64.b64decode(sys.argv[1]))))
@@ -0,0 +1,99 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file expands the test scenarios into deterministic fault plans before a
+campaign starts. Each repetition of a scenario gets a plan with the exact bit
+flips to insert, as a list of (file, offset, bit, delay_ms) entries, where the
+delay is the time to wait before the flip is inserted. The entries of stuck bit
+scenarios also contain the stuck value, and are all asserted at the start.
+
+The plans are generated from a recorded seed, so the same seed, scenario and
+target files always result in the same plans. A plan id is derived from its
+contents, so the result store can tell which plans were already evaluated,
+and a single plan can be replayed.
+
+FILE: fault_plan.py
+
+USAGE:
+    from fault_plan import create_scenario_plans
+    plans = create_scenario_plans(seed, scenario_id, test_scenario, target_selector,
+                                  file_sizes, repetitions)
+    for flip in plans[0]['flips']:
+        print flip['file'], flip['offset'], flip['bit'], flip['delay_ms']
+
+"""
+
+import json
+import random
+from utils import gen_checksum_from_bytes
+
+
+# Create a new random seed, to be recorded with the plans.
+def new_seed():
+    return random.SystemRandom().randint(0, 2 ** 31 - 1)
+
+
+# Create the random generator of a scenario, independent of the other scenarios.
+def scenario_rng(seed, scenario_id):
+    return random.Random(int(gen_checksum_from_bytes('{}-{}'.format(seed, scenario_id)), 16))
+
+
+# Choose the offset of a flip in a file, within the offset range when it is given.
+def choose_offset(rng, file_size, offset_range=None):
+    start, end = 0, file_size
+    if offset_range is not None:
+        start = offset_range[0]
+        end = min(offset_range[1], file_size) if file_size is not None else offset_range[1]
+    if end is None or start >= end:
+        return None
+    return rng.randint(start, end - 1)
+
+
+# Create the plan of a single repetition of a scenario. Files which are empty are not
+# targeted, just as the bit flip injector skips them.
+def create_plan(rng, seed, scenario_id, run_id, test_scenario, target_selector, file_sizes, max_tries=100):
+    flips = []
+    delay_ms = test_scenario.get('start_delay_ms', 0)
+    for _ in range(test_scenario['num_files']):
+        for _ in range(max_tries):
+            file_name, offset_range = target_selector.choose(rng)
+            if choose_offset(rng, file_sizes.get(file_name), offset_range) is not None:
+                break
+        else:
+            break
+
+        for flip_id in range(test_scenario['flips_per_file']):
+            flip = {'file': file_name, 'offset': choose_offset(rng, file_sizes.get(file_name), offset_range),
+                    'bit': rng.randint(0, 7), 'delay_ms': delay_ms if flip_id == 0 else 0}
+            if test_scenario.get('FI_type') == 'stuck_bit':
+                flip['value'] = test_scenario.get('stuck_value', rng.randint(0, 1))
+            flips.append(flip)
+        delay_ms = test_scenario.get('delay_ms', 0)
+
+    plan = {'seed': seed, 'scenario_id': scenario_id, 'run_id': run_id, 'flips': flips}
+    plan['plan_id'] = gen_checksum_from_bytes(json.dumps(plan, sort_keys=True))
+    return plan
+
+
+# Create the plans of all repetitions of a scenario. The plan of a repetition does not
+# depend on the number of repetitions, so a campaign can be extended with more runs.
+def create_scenario_plans(seed, scenario_id, test_scenario, target_selector, file_sizes, repetitions):
+    rng = scenario_rng(seed, scenario_id)
+    if len(target_selector) == 0:
+        return []
+    return [create_plan(rng, seed, scenario_id, run_id, test_scenario, target_selector, file_sizes)
+            for run_id in range(repetitions)]
+
+
+# Group the flips of a plan into injections of a single file, which can be inserted
+# with one bit flip call: [(delay_ms, file, [(offset, bit), ..]), ..]
+def group_plan_injections(plan):
+    injections = []
+    for flip in plan['flips']:
+        if len(injections) > 0 and flip['delay_ms'] == 0 and injections[-1][1] == flip['file']:
+            injections[-1][2].append((flip['offset'], flip['bit']))
+        else:
+            injections.append((flip['delay_ms'], flip['file'], [(flip['offset'], flip['bit'])]))
+    return injections
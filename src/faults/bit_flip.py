@@ -4,16 +4,22 @@ Study:  Computer Science at the University of Amsterdam
 Date:   08-06-2016
 
 This file can be used to create faults such as single bitflips in files on
-specific offsets. Or random ones when not specifying file offsets.
+specific offsets. Or random ones when not specifying file offsets, optionally
+limited to an offset range such as a region read often by the queries.
 
 FILE: bit_flip.py
 
 USAGE: Function usage:
        insert_bit_flips([filepath, ..], [file_offsets, ..])
        insert_bit_flips([filepath, ..], None)
+       insert_bit_flips([filepath, ..], None, offset_range=(start, end))
+       insert_bit_flips([filepath, ..], [file_offsets, ..], file_bits=[bit, ..])
 
        Command line usage:
-       python bit_flip.py file_name n_bit_flips
+       python bit_flip.py file_name n_bit_flips [Opt:range_start range_end]
+       python bit_flip.py file_name -o offset bit [offset bit ..]
+
+       The offset and bit of each inserted flip are printed as: Flipped <offset> <bit>
 
 NOTE: This script probably needs sudo privileges to run on a opened file.
       Also create a BACKUP before testing this file!
@@ -28,7 +34,9 @@ from operator import xor
 
 
 # Insert n random bit flips in random locations of a file, or specified file_offsets.
-def insert_bit_flips(file_paths, file_offsets=None, debug=False):
+# The random offsets can be limited to an offset_range (start, end), which is
+# clamped to the file size. The flipped bits (0-7) can be given with file_bits.
+def insert_bit_flips(file_paths, file_offsets=None, debug=False, offset_range=None, file_bits=None):
     # Replace a random character with the same character where one if its bits is
     # flipped.
 
@@ -37,18 +45,24 @@ def insert_bit_flips(file_paths, file_offsets=None, debug=False):
         with io.open(path, 'rb+') as f:
             if file_offsets is None:
                 f.seek(0, os.SEEK_END)
-                offset = random.randint(0, f.tell() - 1)
+                start, end = 0, f.tell()
+                if offset_range is not None and offset_range[0] < end:
+                    start, end = offset_range[0], min(offset_range[1], end)
+                offset = random.randint(start, end - 1)
             else:
                 offset = file_offsets[i]
 
             f.seek(offset)
             f_data = f.read(1)
+            if len(f_data) == 0:
+                raise ValueError('Offset {} is not within file: {}'.format(offset, path))
             # Bit flip one of the bits of a single byte (8 bits) via xor, thus xor
             # with chars with binary format of:
             # 0000 0001,
             # 0000 0010,
             # etc. 2 ** n.
-            n_data = xor(ord(f_data), 2 ** random.randint(0, 8 - 1))
+            bit = random.randint(0, 8 - 1) if file_bits is None else file_bits[i]
+            n_data = xor(ord(f_data), 2 ** bit)
             if debug:
                 print 'Chars:', f_data, chr(n_data), '\tOrd:', ord(f_data), n_data
                 print bin(n_data), '\n', bin(ord(f_data)), '\n'
@@ -56,10 +70,17 @@ def insert_bit_flips(file_paths, file_offsets=None, debug=False):
             # Reset file pointer.
             f.seek(offset)
             f.write(chr(n_data))
+            print 'Flipped', offset, bit
 
 if __name__ == '__main__':
     file_name = sys.argv[1]
+    if sys.argv[2] == '-o':  # Flip the given bits of the given offsets.
+        flips = [int(arg) for arg in sys.argv[3:]]
+        insert_bit_flips([file_name] * (len(flips) // 2), flips[0::2], file_bits=flips[1::2])
+        sys.exit()
+
     n_insertions = int(sys.argv[2])
+    flip_range = (int(sys.argv[3]), int(sys.argv[4])) if len(sys.argv) > 4 else None
 
     for _ in range(n_insertions):
-        insert_bit_flips([file_name], None)
+        insert_bit_flips([file_name], None, offset_range=flip_range)
@@ -3,36 +3,65 @@ Author: Gerard Schroder
 Study:  Computer Science at the University of Amsterdam
 Date:   08-06-2016
 
-This file can be used to create faults such as stuck bits.
+This file can be used to create faults such as stuck bits. A stuck bit is pinned
+to 0 or 1, instead of being toggled as a bit flip. As the DBMS can overwrite
+the byte again (e.g. when a file is rewritten), a resident loop re-asserts the
+stuck bits with a fixed interval for a given duration.
+
+All stuck bits of a file are asserted via a single mmap of that file, and only
+bytes which do not have the stuck value are written. The time spent in the loop
+is bounded by max_load: when a pass over all stuck bits takes longer than
+max_load of the interval, the interval is stretched.
 
 FILE:  stuck_bit.py
 
-USAGE: Only for import usage.
-       insert_stuck_bit([filepath, ..], [file_offsets, ..], [bit_position, ...])
+USAGE: Function usage:
+       insert_stuck_bit([filepath, ..], [file_offsets, ..], [bit_position, ...], [stuck_value, ..])
+       loop = StuckBitLoop([(filepath, offset, bit_position, stuck_value), ..], interval=0.01)
+       loop.run(duration=10.0)
+
+       Command line usage, the offset, bit and value are chosen randomly when null:
+       python stuck_bit.py '{"duration": secs, "interval": secs, "max_load": 0.05,
+                             "bits": [{"file": path, "offset": n, "range": [start, end],
+                                       "bit": 0-7, "value": 0/1}, ..]}'
+
+       A long list of bits is given as a json file with the same params:
+       python stuck_bit.py @stuck_bit_params.json
 
+       The stuck bits are printed as a json list when the loop starts, and a json
+       summary of the loop is printed when it stops.
 
-NOTE: This file probably needs sudo privileges to open a running file. Moreover this
-      fault has to be repeated several times. A way has still be found to implement
-      this effect properly.
+NOTE: This file probably needs sudo privileges to open a running file.
 """
 
 import io
-from operator import xor
+import os
+import sys
+import json
+import time
+import mmap
+import random
 from itertools import izip
 
 
-def insert_stuck_bit(file_paths, file_offsets, bit_positions, debug=False):
-    for path, offset, bit_position in izip(file_paths, file_offsets, bit_positions):
-        with io.open(path, 'rb+') as f:
+# Set a bit of a byte to the stuck value (0 or 1).
+def stuck_byte(byte_value, bit_position, stuck_value):
+    if stuck_value:
+        return byte_value | (1 << bit_position)
+    return byte_value & ~(1 << bit_position) & 0xff
+
 
+# Assert each stuck bit once.
+def insert_stuck_bit(file_paths, file_offsets, bit_positions, stuck_values=None, debug=False):
+    if stuck_values is None:
+        stuck_values = [0] * len(file_paths)
+    for path, offset, bit_position, stuck_value in izip(file_paths, file_offsets, bit_positions, stuck_values):
+        with io.open(path, 'rb+') as f:
             f.seek(offset)
             f_data = f.read(1)
-            # Bit flip one of the bits of a single byte (8 bits) via xor, thus xor
-            # with chars with binary format of:
-            # 0000 0001,
-            # 0000 0010,
-            # etc. 2 ** n.
-            n_data = xor(ord(f_data), 2 ** bit_position)
+            if len(f_data) == 0:
+                raise ValueError('Offset {} is not within file: {}'.format(offset, path))
+            n_data = stuck_byte(ord(f_data), bit_position, stuck_value)
             if debug:
                 print 'Chars:', f_data, chr(n_data), '\tOrd:', ord(f_data), n_data
                 print bin(n_data), '\n', bin(ord(f_data)), '\n'
@@ -40,3 +69,151 @@ def insert_stuck_bit(file_paths, file_offsets, bit_positions, debug=False):
             # Reset file pointer.
             f.seek(offset)
             f.write(chr(n_data))
+
+
+# A file with its stuck bits, mapped in memory. The file is mapped again when it is
+# replaced or grows, as the DBMS can rewrite its files.
+class StuckFile:
+    def __init__(self, path, stuck_bits):
+        self.path = path
+        # Combine the stuck bits of the same byte into a set and clear mask.
+        masks = {}
+        for offset, bit_position, stuck_value in stuck_bits:
+            set_mask, clear_mask = masks.get(offset, (0, 0))
+            if stuck_value:
+                set_mask |= 1 << bit_position
+            else:
+                clear_mask |= 1 << bit_position
+            masks[offset] = (set_mask, clear_mask)
+        self.masks = sorted((offset, set_mask, clear_mask) for offset, (set_mask, clear_mask) in masks.items())
+        self.file, self.map, self.inode, self.size = None, None, None, None
+
+    # Map the file, an empty file can not be mapped and is mapped when it grows.
+    def open(self):
+        self.close()
+        try:
+            self.file = io.open(self.path, 'rb+')
+            file_stat = os.fstat(self.file.fileno())
+            self.inode, self.size = file_stat.st_ino, file_stat.st_size
+            if self.size > 0:
+                self.map = mmap.mmap(self.file.fileno(), 0)
+        except (IOError, OSError, mmap.error):
+            self.close()
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        if self.file is not None:
+            self.file.close()
+        self.file, self.map, self.inode, self.size = None, None, None, None
+
+    # Check if the opened file is still the file at the path with the same size.
+    def changed(self):
+        try:
+            path_stat = os.stat(self.path)
+        except OSError:
+            return self.file is not None
+        return path_stat.st_ino != self.inode or path_stat.st_size != self.size
+
+    # Assert all stuck bits of the file, the number of written bytes is returned.
+    def assert_bits(self):
+        if self.map is None:
+            return 0
+        written = 0
+        size = len(self.map)
+        for offset, set_mask, clear_mask in self.masks:
+            if offset >= size:
+                continue
+            byte_value = ord(self.map[offset])
+            n_value = (byte_value | set_mask) & ~clear_mask
+            if n_value != byte_value:
+                self.map[offset] = chr(n_value)
+                written += 1
+        return written
+
+
+class StuckBitLoop:
+    # stuck_bits: a list of (path, offset, bit_position, stuck_value).
+    # interval: the time in seconds between two passes over all stuck bits.
+    # max_load: the maximal fraction of the time spent in the passes.
+    # reopen_interval: the time in seconds between checks if the files changed.
+    def __init__(self, stuck_bits, interval=0.01, max_load=0.05, reopen_interval=1.0):
+        if not 0 < max_load <= 1:
+            raise ValueError('The max_load must be in (0, 1], given: {}'.format(max_load))
+        files = {}
+        for path, offset, bit_position, stuck_value in stuck_bits:
+            files.setdefault(path, []).append((offset, bit_position, stuck_value))
+        self.files = [StuckFile(path, bits) for path, bits in files.items()]
+        self.interval = interval
+        self.max_load = max_load
+        self.reopen_interval = reopen_interval
+        self.passes, self.written, self.pass_time = 0, 0, 0.0
+
+    # Re-assert the stuck bits till the duration (in seconds) passed.
+    def run(self, duration):
+        for stuck_file in self.files:
+            stuck_file.open()
+        start = time.time()
+        last_reopen = start
+        try:
+            while time.time() - start < duration:
+                pass_start = time.time()
+                if pass_start - last_reopen > self.reopen_interval:
+                    for stuck_file in self.files:
+                        if stuck_file.changed():
+                            stuck_file.open()
+                    last_reopen = pass_start
+                for stuck_file in self.files:
+                    self.written += stuck_file.assert_bits()
+                pass_duration = time.time() - pass_start
+                self.passes += 1
+                self.pass_time += pass_duration
+
+                # Stretch the interval when a pass takes more than max_load of it.
+                time.sleep(max(0.0, max(self.interval, pass_duration / self.max_load) - pass_duration))
+        finally:
+            for stuck_file in self.files:
+                if stuck_file.map is not None:
+                    stuck_file.map.flush()
+                stuck_file.close()
+        return self.summary(time.time() - start)
+
+    def summary(self, run_time):
+        return {'passes': self.passes, 'written': self.written, 'run_time': run_time,
+                'load': self.pass_time / run_time if run_time > 0 else 0.0,
+                'mean_pass_time': self.pass_time / self.passes if self.passes > 0 else 0.0}
+
+
+# Choose the offset, bit and value of a stuck bit which are not given.
+def choose_stuck_bit(spec):
+    offset = spec.get('offset')
+    if offset is None:
+        try:
+            size = os.path.getsize(spec['file'])
+        except OSError:
+            return None
+        start, end = 0, size
+        if spec.get('range') is not None and spec['range'][0] < size:
+            start, end = spec['range'][0], min(spec['range'][1], size)
+        if start >= end:
+            return None
+        offset = random.randint(start, end - 1)
+    bit_position = spec['bit'] if spec.get('bit') is not None else random.randint(0, 8 - 1)
+    stuck_value = spec['value'] if spec.get('value') is not None else random.randint(0, 1)
+    return spec['file'], offset, bit_position, stuck_value
+
+
+if __name__ == '__main__':
+    # Large params, e.g. long lists of bits, are given as a json file.
+    if sys.argv[1].startswith('@'):
+        with io.open(sys.argv[1][1:], 'r') as f:
+            params = json.load(f)
+    else:
+        params = json.loads(sys.argv[1])
+    stuck_bits = [stuck_bit for stuck_bit in (choose_stuck_bit(spec) for spec in params['bits'])
+                  if stuck_bit is not None]
+    print json.dumps(stuck_bits)
+    sys.stdout.flush()
+
+    loop = StuckBitLoop(stuck_bits, interval=params.get('interval', 0.01), max_load=params.get('max_load', 0.05))
+    print json.dumps(loop.run(params.get('duration', 10.0)))
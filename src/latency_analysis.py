@@ -0,0 +1,126 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file contains the analysis of the time differences between the fault
+injections and the detected faults. All time stamps are converted once to
+integer microseconds since midnight and kept in arrays. The nearest injection
+of each fault is found with a binary search in the sorted injection times.
+
+FILE: latency_analysis.py
+
+USAGE:
+    from latency_analysis import LatencyAnalysis
+    analysis = LatencyAnalysis()
+    analysis.add_nearest(injection_times, fault_times)
+    analysis.add_latency(last_injection_time, first_log_time)
+    analysis.extend(cached_latencies_in_micros)
+    print analysis.summary()
+
+"""
+
+import math
+from array import array
+from bisect import bisect_left
+from utils import time_str_to_micros
+
+
+# Convert a list of time strings to a sorted array of microseconds since midnight.
+def to_micros_array(time_strs):
+    return array('l', sorted(time_str_to_micros(time_str) for time_str in time_strs))
+
+
+# Find the absolute difference between a time and the nearest of the sorted times.
+def nearest_difference(sorted_times, time_micros):
+    index = bisect_left(sorted_times, time_micros)
+    differences = [abs(sorted_times[i] - time_micros) for i in (index - 1, index)
+                   if 0 <= i < len(sorted_times)]
+    return min(differences) if len(differences) > 0 else None
+
+
+# Format microseconds in the Hours:Mins:Secs.micros format as str(datetime.time()) does.
+def micros_to_str(micros):
+    secs, micros = divmod(int(micros), 1000000)
+    mins, secs = divmod(secs, 60)
+    hours, mins = divmod(mins, 60)
+    time_str = '{:02d}:{:02d}:{:02d}'.format(hours, mins, secs)
+    return time_str + '.{:06d}'.format(micros) if micros != 0 else time_str
+
+
+class LatencyAnalysis:
+    def __init__(self):
+        # Time differences in microseconds, the sorted copy is created when requested.
+        self.latencies = array('l')
+        self._sorted = None
+
+    def __len__(self):
+        return len(self.latencies)
+
+    # Add the difference of each fault time with its nearest injection time.
+    def add_nearest(self, injection_times, fault_times):
+        injections = to_micros_array(injection_times)
+        differences = array('l')
+        if len(injections) == 0:
+            return differences
+        for fault_time in fault_times:
+            differences.append(nearest_difference(injections, time_str_to_micros(fault_time)))
+        self.latencies.extend(differences)
+        self._sorted = None
+        return differences
+
+    # Add the absolute difference between two time strings.
+    def add_latency(self, time_a, time_b):
+        difference = abs(time_str_to_micros(time_b) - time_str_to_micros(time_a))
+        self.latencies.append(difference)
+        self._sorted = None
+        return difference
+
+    # Add already computed latencies in microseconds.
+    def extend(self, latencies):
+        self.latencies.extend(latencies)
+        self._sorted = None
+
+    def _sorted_latencies(self):
+        if self._sorted is None:
+            self._sorted = array('l', sorted(self.latencies))
+        return self._sorted
+
+    def mean(self):
+        if len(self.latencies) == 0:
+            return None
+        return sum(self.latencies) / float(len(self.latencies))
+
+    # Get the percentiles (0-100) of the latencies using nearest rank.
+    def percentiles(self, percents=(50, 90, 95, 99)):
+        latencies = self._sorted_latencies()
+        if len(latencies) == 0:
+            return {}
+        result = {}
+        for percent in percents:
+            rank = int(math.ceil(percent * len(latencies) / 100.0))
+            result[percent] = latencies[min(max(rank, 1), len(latencies)) - 1]
+        return result
+
+    # Create a histogram of the latencies with bins of bin_micros wide, as a
+    # sorted list of (bin start in microseconds, count).
+    def histogram(self, bin_micros=1000000):
+        bins = {}
+        for latency in self.latencies:
+            start = latency - latency % bin_micros
+            bins[start] = bins.get(start, 0) + 1
+        return sorted(bins.items())
+
+    # Summary of the latencies in seconds.
+    def summary(self, percents=(50, 90, 95, 99), bin_micros=1000000):
+        if len(self.latencies) == 0:
+            return {'n': 0}
+        latencies = self._sorted_latencies()
+        return {
+            'n': len(latencies),
+            'mean': self.mean() * 10 ** -6,
+            'min': latencies[0] * 10 ** -6,
+            'max': latencies[-1] * 10 ** -6,
+            'percentiles': dict((percent, val * 10 ** -6) for (percent, val) in self.percentiles(percents).items()),
+            'histogram': [(start * 10 ** -6, count) for (start, count) in self.histogram(bin_micros)]
+        }
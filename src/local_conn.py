@@ -0,0 +1,179 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file implements a local executor with the same interface as the
+SSHConnection, for hosts which are the client machine itself. The commands are
+executed with a subprocess (without a PTY) from the home directory, just as the
+SSH commands are. Files are copied instead of archived and transferred, and the
+files of directories (e.g. the data sets) are hard linked when possible.
+
+The executor of a host is chosen with the "executor" field of the server meta
+data: "ssh", "local" or "auto" (default). With "auto" the local executor is only
+used for loopback hosts on port 22, as a loopback host with another port is
+usually a forwarded port of a virtual machine.
+
+FILE: local_conn.py
+
+USAGE:
+
+    from local_conn import create_connection
+    conn = create_connection('127.0.0.1', port=22, user=name, password=pass)
+
+    (stdout, stderr) = conn.execute_cmd('command', sudo=False, return_streams=False,
+                                        print_output=True)
+
+    conn.transfer_file('dir/file', 'dir location relative from home on server')
+
+"""
+
+import io
+import os
+import time
+import errno
+import shutil
+import subprocess
+from utils import color_str
+
+# The executors which can be chosen in the server meta data.
+executors = ['auto', 'ssh', 'local']
+
+
+# Check if a host is the loopback address of the client itself.
+def is_loopback_host(host):
+    return host == 'localhost' or host.startswith('127.') or host == '::1'
+
+
+# Create the connection to a host with the chosen executor.
+def create_connection(host, port=22, user=None, password=None, executor='auto'):
+    if executor not in executors:
+        raise ValueError('Unknown executor: {}, implemented: {}'.format(executor, executors))
+    if executor == 'local' or (executor == 'auto' and is_loopback_host(host) and int(port) == 22):
+        return LocalConnection(host, port=port, user=user, password=password)
+
+    from server_conn import SSHConnection
+    return SSHConnection(host, port=port, user=user, password=password)
+
+
+# The channel of a local command, closing it hangs up the command as closing an SSH
+# channel does.
+class LocalChannel:
+    def __init__(self, process):
+        self.process = process
+
+    def close(self):
+        if self.process.poll() is None:
+            try:
+                self.process.terminate()
+            except OSError:
+                pass
+
+
+# A stream of a local command with the channel of the command, as the paramiko streams.
+class LocalStream:
+    def __init__(self, stream, process):
+        self.stream = stream
+        self.channel = LocalChannel(process)
+
+    def __iter__(self):
+        return iter(self.stream.readline, '')
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class LocalConnection:
+    def __init__(self, host, port=22, user=None, password=None):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.n_commands = 0
+        self.command_time = 0.0
+
+    # Execute a command from the home directory.
+    def execute_cmd(self, command, sudo=False, print_output=True, return_streams=False, debug=True):
+        start = time.time()
+        self.n_commands += 1
+        if sudo:
+            command = "sudo -S -p '' {}".format(command)
+
+        if debug:
+            print "{}: {}".format(color_str('[Executing]', color='y'), command)
+        # The errors of a command returning its streams are written to the output, as
+        # with the PTY of an SSH command, so an unread error stream can not block it.
+        process = subprocess.Popen(command, shell=True, cwd=self.get_user_dir(), stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT if return_streams else subprocess.PIPE)
+        password_input = self.password + '\n' if sudo and self.password is not None else ''
+        if return_streams:
+            process.stdin.write(password_input)
+            process.stdin.flush()
+            self.command_time += time.time() - start
+            return (LocalStream(process.stdin, process), LocalStream(process.stdout, process),
+                    LocalStream(io.BytesIO(), process))
+
+        (out, error) = process.communicate(password_input)
+        self.command_time += time.time() - start
+        if not print_output:
+            return out.splitlines(True), error.splitlines(True)
+
+        if out != "":
+            print "Output:"
+            print out,
+        if error != "":
+            print "Errors:"
+            print error,
+        return out, error
+
+    # Get the home directory of the user, from which all commands are executed.
+    def get_user_dir(self):
+        user_dir = os.path.expanduser('~{}'.format(self.user if self.user is not None else ''))
+        if user_dir.startswith('~'):
+            user_dir = os.path.expanduser('~')
+        return user_dir.rstrip('/') + '/'
+
+    # Copy a file or directory to the location (relative from the home directory when
+    # it is not absolute), at the same relative path as the archive of the SSHConnection
+    # would extract it. The files of a directory are hard linked when possible.
+    def transfer_file(self, transfer_file, transfer_location=None):
+        transfer_file = transfer_file.strip()  # Remove redundant spaces
+        if transfer_location is None:
+            transfer_location = self.get_user_dir()
+        target = os.path.join(self.get_user_dir(), transfer_location, transfer_file)
+
+        if os.path.isdir(transfer_file):
+            print "{}: '{}'".format(color_str('[Copying directory]', color='y'), transfer_file)
+            for root_dir, _, files in os.walk(transfer_file):
+                for name in files:
+                    source_file = os.path.join(root_dir, name)
+                    self._copy_file(source_file, os.path.join(target, os.path.relpath(source_file, transfer_file)),
+                                    link=True)
+        else:
+            print "{}: '{}' of size: {} bytes".format(color_str('[Copying file]', color='y'),
+                                                      transfer_file, os.path.getsize(transfer_file))
+            self._copy_file(transfer_file, target)
+
+    # Copy or hard link a single file, an existing target file is replaced.
+    @staticmethod
+    def _copy_file(source_file, target_file, link=False):
+        if os.path.exists(target_file):
+            if os.path.samefile(source_file, target_file):
+                return
+            os.remove(target_file)
+        elif not os.path.exists(os.path.dirname(target_file)):
+            os.makedirs(os.path.dirname(target_file))
+
+        if link:
+            try:
+                os.link(source_file, target_file)
+                return
+            except OSError as e:
+                if e.errno not in [errno.EXDEV, errno.EPERM, errno.EMLINK]:
+                    raise
+        shutil.copy2(source_file, target_file)
+
+    # Close the connection, nothing has to be closed for local commands.
+    def close_connection(self):
+        pass
@@ -0,0 +1,116 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file correlates the DBMS logs with the executed queries. The time windows
+around the query time stamps are merged once into a sorted interval list, the
+time stamp of each log line is parsed once, and the matching windows and query
+ids are found with a binary search.
+
+The log lines can already be filtered at the server side, so only warnings,
+errors and their stack traces are transferred to the client.
+
+FILE: log_correlation.py
+
+USAGE:
+    from log_correlation import LogCorrelator
+    correlator = LogCorrelator({query_id: 'HH:MM:SS.micros', ..}, interval=3)
+    for log, query_ids in correlator.correlate(log_lines):
+        print log, query_ids
+
+    for line in filter_log_lines(log_lines):
+        print line,
+
+"""
+
+import re
+from bisect import bisect_left, bisect_right
+from utils import time_str_to_micros
+
+# Number of microseconds in a day, query windows are clamped within a single day.
+day_micros = 24 * 60 * 60 * 1000000
+
+# Expression to analyse the Cassandra database logs:
+# WARN  10:19:29  the log message.
+# It extracts the timestamp and warning.
+cassandra_log_regex = re.compile('(WARN|ERROR|FATAL)\s*([0-9]{2}:[0-9]{2}:[0-9]{2})')
+cassandra_log_starts = re.compile('WARN|ERROR|FATAL|INFO')
+
+
+# Merge (start, end) intervals into a sorted list of non overlapping intervals.
+def merge_intervals(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if len(merged) > 0 and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+# Only yield the WARN/ERROR/FATAL log lines, and the lines continuing them such as
+# stack traces. The lines are read lazily so a log stream can be filtered.
+def filter_log_lines(lines, log_regex=cassandra_log_regex, log_starts=cassandra_log_starts):
+    continues_log = False
+    for line in lines:
+        if log_regex.match(line) is not None:
+            continues_log = True
+        elif log_starts.match(line) is not None:
+            continues_log = False
+        if continues_log:
+            yield line
+
+
+class LogCorrelator:
+    def __init__(self, query_times, interval=3, log_regex=cassandra_log_regex, log_starts=cassandra_log_starts):
+        self.interval = int(interval * 1000000)
+        self.log_regex = log_regex
+        self.log_starts = log_starts
+
+        # The query time stamps sorted, to find all queries of a log time.
+        queries = sorted((time_str_to_micros(timestamp), query_id) for query_id, timestamp in query_times.items())
+        self.query_times = [query_time for query_time, _ in queries]
+        self.query_ids = [query_id for _, query_id in queries]
+
+        # The merged query windows, to check if a log time is in any of the windows.
+        windows = merge_intervals([(max(query_time - self.interval, 0), min(query_time + self.interval, day_micros))
+                                   for query_time in self.query_times])
+        self.window_starts = [start for start, _ in windows]
+        self.window_ends = [end for _, end in windows]
+
+    # Check if a time in microseconds lies in one of the query windows.
+    def in_window(self, log_time):
+        index = bisect_right(self.window_starts, log_time) - 1
+        return index >= 0 and log_time <= self.window_ends[index]
+
+    # Get the ids of all queries whose window contains the time in microseconds.
+    def overlapping_queries(self, log_time):
+        low = bisect_left(self.query_times, log_time - self.interval)
+        high = bisect_right(self.query_times, log_time + self.interval)
+        return self.query_ids[low:high]
+
+    # Get the relevant logs with the ids of the queries they overlap. All fatal or
+    # error logs are returned, warnings only when they are within a query window.
+    # Lines which do not start a new log (e.g. stack traces) are appended to the
+    # previous relevant log.
+    def correlate(self, logs):
+        errors = []
+        continues_log = False
+        for line in logs:
+            result = self.log_regex.match(line)
+
+            if result is not None:
+                level, log_time = result.groups()
+                log_time = time_str_to_micros(log_time)
+                continues_log = level in ['ERROR', 'FATAL'] or self.in_window(log_time)
+                if continues_log:
+                    errors.append([line.strip(), self.overlapping_queries(log_time)])
+            # Check if a new log is starting or maybe the current log is continuing.
+            # This can happen with stack traces which are split on multi lines.
+            elif self.log_starts.match(line) is None:
+                if continues_log and len(errors) > 0:
+                    errors[-1][0] += line
+            else:
+                continues_log = False
+        return errors
@@ -0,0 +1,161 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file follows the logs of a DBMS docker container on the server side and
+parses the log lines incrementally into structured events. Each event is printed
+as a single JSON line, so the client can read them over the SSH channel while
+the faults are injected.
+
+An event contains the level, timestamp, logger, thread, message and stack lines
+of a log. An event which is still pending when no lines arrive for a while is
+printed early, and is printed again with "update": true and all its stack lines
+when more stack lines follow. Both the Cassandra console format:
+    WARN  10:19:29,123 the log message.
+and the Cassandra system.log format are supported:
+    ERROR [SharedPool-Worker-1] 2016-06-08 10:19:29,123 Logger.java:207 - the log message.
+
+FILE: log_tailer.py
+
+USAGE: python log_tailer.py <container_id> [Opt:since_unix_timestamp] [Opt:min_level]
+
+       # Or parse lines in code:
+       parser = LogEventParser()
+       for line in lines:
+           event = parser.feed(line)
+       event = parser.flush()
+
+"""
+
+import re
+import os
+import sys
+import json
+import select
+import subprocess
+
+# Log levels from low to high, only events of at least the minimal level are emitted.
+log_levels = ['TRACE', 'DEBUG', 'INFO', 'WARN', 'ERROR', 'FATAL']
+
+console_log_regex = re.compile('(TRACE|DEBUG|INFO|WARN|ERROR|FATAL)\s+' +
+                               '([0-9]{2}:[0-9]{2}:[0-9]{2})(?:[,.]([0-9]{3}))?\s*(.*)')
+system_log_regex = re.compile('(TRACE|DEBUG|INFO|WARN|ERROR|FATAL)\s+\[([^\]]*)\]\s+' +
+                              '[0-9]{4}-[0-9]{2}-[0-9]{2}\s+([0-9]{2}:[0-9]{2}:[0-9]{2})(?:[,.]([0-9]{3}))?\s+' +
+                              '(\S+)\s+-\s+(.*)')
+
+
+class LogEventParser:
+    def __init__(self, min_level='WARN'):
+        self.min_level = log_levels.index(min_level)
+        self.event = None
+        # The number of stack lines of the current event when it was emitted early.
+        self.emitted_stack = None
+
+    # Create an event when a line starts a new log, else None is returned.
+    @staticmethod
+    def parse_log_start(line):
+        result = system_log_regex.match(line)
+        if result is not None:
+            level, thread, timestamp, millis, logger, message = result.groups()
+        else:
+            result = console_log_regex.match(line)
+            if result is None:
+                return None
+            level, timestamp, millis, message = result.groups()
+            thread, logger = None, None
+
+        if millis is not None:
+            timestamp += '.' + millis
+        return {'level': level, 'timestamp': timestamp, 'logger': logger, 'thread': thread,
+                'message': message.strip(), 'stack': []}
+
+    # Feed a single log line. The previous event is returned when it is finished,
+    # as the stack lines of an event are only known when a new log starts.
+    def feed(self, line):
+        event = self.parse_log_start(line)
+        if event is None:
+            if self.event is not None and line.strip() != '':
+                self.event['stack'].append(line.rstrip())
+            return None
+
+        finished_event = self.flush()
+        if log_levels.index(event['level']) >= self.min_level:
+            self.event = event
+        return finished_event
+
+    # Return the current event when it is finished, as no new lines are expected. An
+    # event which was emitted early is only returned again, as an update, when stack
+    # lines were added since.
+    def flush(self):
+        event, emitted_stack = self.event, self.emitted_stack
+        self.event, self.emitted_stack = None, None
+        if event is None or emitted_stack is None:
+            return event
+        if len(event['stack']) == emitted_stack:
+            return None
+        return dict(event, update=True)
+
+    # Return the current event early, when no lines arrived for a while. The event is
+    # kept, so the stack lines which arrive later are still added to it.
+    def idle_flush(self):
+        if self.event is None or self.emitted_stack == len(self.event['stack']):
+            return None
+        event = self.event if self.emitted_stack is None else dict(self.event, update=True)
+        self.emitted_stack = len(self.event['stack'])
+        return event
+
+
+def print_event(event):
+    sys.stdout.write(json.dumps(event) + '\n')
+    sys.stdout.flush()
+
+
+# Follow the docker logs of a container and print the parsed events. Pending events
+# are printed early when no new lines arrive within flush_timeout seconds.
+def tail_container_logs(container_id, since=None, min_level='WARN', flush_timeout=0.5):
+    logs_cmd = ['docker', 'logs', '-f']
+    if since is not None:
+        logs_cmd += ['--since', since]
+    logs_cmd.append(container_id)
+
+    parser = LogEventParser(min_level=min_level)
+    p = subprocess.Popen(logs_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    # Read the pipe unbuffered, so select does not miss lines already read into a buffer.
+    log_fd = p.stdout.fileno()
+    buf = ''
+    try:
+        while True:
+            readable, _, _ = select.select([log_fd], [], [], flush_timeout)
+            if len(readable) == 0:
+                event = parser.idle_flush()
+                if event is not None:
+                    print_event(event)
+                continue
+
+            data = os.read(log_fd, 65536)
+            if data == '':  # The container stopped.
+                break
+            lines = (buf + data).split('\n')
+            buf = lines.pop()
+            for line in lines:
+                event = parser.feed(line)
+                if event is not None:
+                    print_event(event)
+
+        for event in [parser.feed(buf) if buf != '' else None, parser.flush()]:
+            if event is not None:
+                print_event(event)
+    finally:
+        if p.poll() is None:
+            p.terminate()
+        p.stdout.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print "Usage: python log_tailer.py <container_id> [since_unix_timestamp] [min_level]"
+        sys.exit()
+
+    tail_container_logs(sys.argv[1], since=sys.argv[2] if len(sys.argv) > 2 else None,
+                        min_level=sys.argv[3] if len(sys.argv) > 3 else 'WARN')
@@ -0,0 +1,167 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file times the phases of the fault injection runs, such as the readiness
+wait, the injection, the queries, the log fetch, the result assembly and the
+restore steps of each host. A span is recorded per phase and host with a
+monotonic clock (time.time is used when no monotonic clock is available), as
+seconds since the start of the campaign. The wall clock time of the campaign
+start is kept, so the spans of the runs can be placed on a single timeline.
+
+The spans of a run are stored with its result, and the stored results can be
+exported to the Chrome trace event format, which can be opened with
+chrome://tracing or https://ui.perfetto.dev.
+
+FILE: phase_timing.py
+
+USAGE:
+    from phase_timing import PhaseTimer
+    campaign_timer = PhaseTimer()
+    run_timer = PhaseTimer(parent=campaign_timer)
+    with run_timer.span('query', host=0):
+        ...
+    test_scenario['phase_timing'] = run_timer.to_dict()
+
+    campaign_timer.print_totals()
+    export_chrome_trace(result_db.query_db(), 'timeline.json')
+
+"""
+
+import io
+import os
+import json
+import time
+import ctypes
+import ctypes.util
+from threading import Lock
+from contextlib import contextmanager
+
+
+# Timespec of the clock_gettime call.
+class _Timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+# Get the monotonic clock of the system, as python 2 has no time.monotonic.
+def _get_monotonic_clock():
+    if hasattr(time, 'monotonic'):
+        return time.monotonic, 'monotonic'
+    try:
+        librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1', use_errno=True)
+        clock_gettime = librt.clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+    except (OSError, AttributeError):
+        return time.time, 'time'
+
+    # CLOCK_MONOTONIC on Linux.
+    def monotonic():
+        timespec = _Timespec()
+        if clock_gettime(1, ctypes.pointer(timespec)) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return timespec.tv_sec + timespec.tv_nsec * 1e-9
+    return monotonic, 'monotonic'
+
+
+monotonic, clock_name = _get_monotonic_clock()
+
+
+class PhaseTimer:
+    # The spans of a timer with a parent are also added to the parent, and are timed
+    # relative to the start of the parent. The on_span function is called with each
+    # added span, e.g. to update the campaign metrics.
+    def __init__(self, parent=None, on_span=None):
+        self.parent = parent
+        self.on_span = on_span
+        if parent is not None:
+            self.origin, self.origin_time = parent.origin, parent.origin_time
+        else:
+            self.origin, self.origin_time = monotonic(), time.time()
+        self.spans = []
+        self.lock = Lock()
+
+    def add_span(self, span):
+        with self.lock:
+            self.spans.append(span)
+        if self.parent is not None:
+            self.parent.add_span(span)
+        if self.on_span is not None:
+            self.on_span(span)
+
+    # Record a span of a phase on a host, given the monotonic start and end times.
+    def record(self, phase, start, end, host=None):
+        self.add_span({'phase': phase, 'host': host, 'start': start - self.origin,
+                       'end': end - self.origin, 'duration': end - start})
+
+    # Time the code of a with statement as a span of a phase on a host.
+    @contextmanager
+    def span(self, phase, host=None):
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.record(phase, start, monotonic(), host)
+
+    # Wrap a function, e.g. the target of a thread, so each call is timed as a span.
+    def timed(self, phase, func, host=None):
+        def timed_func(*args, **kwargs):
+            with self.span(phase, host):
+                return func(*args, **kwargs)
+        return timed_func
+
+    def to_dict(self):
+        with self.lock:
+            return {'clock': clock_name, 'origin_time': self.origin_time, 'spans': list(self.spans)}
+
+    # The number of spans and total duration of each phase: {phase: (count, total)}.
+    def phase_totals(self):
+        totals = {}
+        with self.lock:
+            for span in self.spans:
+                count, total = totals.get(span['phase'], (0, 0.0))
+                totals[span['phase']] = (count + 1, total + span['duration'])
+        return totals
+
+    def print_totals(self):
+        totals = self.phase_totals()
+        print "=== Time per phase ==="
+        for phase, (count, total) in sorted(totals.items(), key=lambda item: -item[1][1]):
+            print "{:<20} total: {:10.2f}s  mean: {:8.3f}s  count: {}".format(phase, total, total / count, count)
+
+
+# Convert the phase timings stored with the results to Chrome trace events. Each host
+# is a process of the timeline, and each run is shown as a span of the campaign.
+def to_chrome_trace(results):
+    events = []
+    hosts = set()
+    for result in results:
+        timing = result.get('test_scenario', {}).get('phase_timing')
+        if timing is None or len(timing['spans']) == 0:
+            continue
+        args = {'res_id': str(result['res_id']), 'run_id': result['run_id']}
+        for span in timing['spans']:
+            host = span['host'] if span['host'] is not None else 0
+            hosts.add(host)
+            events.append({'name': span['phase'], 'cat': 'phase', 'ph': 'X', 'pid': host + 1, 'tid': 0,
+                           'ts': (timing['origin_time'] + span['start']) * 1e6,
+                           'dur': span['duration'] * 1e6, 'args': args})
+
+        start = min(span['start'] for span in timing['spans'])
+        end = max(span['end'] for span in timing['spans'])
+        events.append({'name': 'run {}'.format(result['run_id']), 'cat': 'run', 'ph': 'X', 'pid': 0, 'tid': 0,
+                       'ts': (timing['origin_time'] + start) * 1e6, 'dur': (end - start) * 1e6, 'args': args})
+
+    # Name the processes of the timeline.
+    events.append({'name': 'process_name', 'ph': 'M', 'pid': 0, 'args': {'name': 'campaign'}})
+    for host in sorted(hosts):
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': host + 1, 'args': {'name': 'host {}'.format(host)}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def export_chrome_trace(results, trace_file):
+    trace = to_chrome_trace(results)
+    with io.open(trace_file, 'w') as f:
+        f.write(unicode(json.dumps(trace)))
+    return len(trace['traceEvents'])
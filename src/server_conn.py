@@ -20,11 +20,16 @@ USAGE:
 
     conn.transfer_file('dir/file', 'dir location relative from home on server')
 
+    # The number of executed commands and their total time in seconds. The time of
+    # a command returning its streams only includes the start of the command.
+    print conn.n_commands, conn.command_time
+
 """
 
 from paramiko import SSHClient
 from paramiko.client import AutoAddPolicy
 import os
+import time
 import tarfile
 from utils import color_str
 
@@ -44,6 +49,8 @@ class SSHConnection:
         self.port = port
         self.user = user
         self.password = password
+        self.n_commands = 0
+        self.command_time = 0.0
         self.client = self.connect_client()
 
     # Connect to a server.
@@ -56,6 +63,8 @@ class SSHConnection:
     # Execute a command on the server. Sudo command referenced from:
     # https://stackoverflow.com/questions/22587855/
     def execute_cmd(self, command, sudo=False, print_output=True, return_streams=False, debug=True):
+        start = time.time()
+        self.n_commands += 1
         if sudo:
             command = "sudo -S -p '' {}".format(command)
 
@@ -72,9 +81,12 @@ class SSHConnection:
             stdout.readline()
 
         if return_streams:
+            self.command_time += time.time() - start
             return stdin, stdout, stderr
         elif not print_output:
-            return stdout.readlines(), stderr.readlines()
+            out, error = stdout.readlines(), stderr.readlines()
+            self.command_time += time.time() - start
+            return out, error
 
         out = ""
         for line in stdout:
@@ -89,6 +101,7 @@ class SSHConnection:
                 print "Errors:"
             error += line
             print line,
+        self.command_time += time.time() - start
         return out, error
 
     # Get user home directory from current ssh system.
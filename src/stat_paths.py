@@ -0,0 +1,53 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file is copied into the DBMS docker container, and stats a batch of paths
+inside the container in a single call. The paths are read as a JSON list from
+stdin, and for each path the existence, type and size are printed as JSON:
+    {path: {"exists": true, "type": "file", "size": 1024}, ..}
+
+Lines preceding the JSON list on stdin (such as a sudo password) are ignored.
+
+FILE: stat_paths.py
+
+USAGE: echo '["/path", ..]' | docker exec -i <container_id> python /stat_paths.py
+
+"""
+
+import os
+import sys
+import json
+import stat
+
+
+# Get the type name of a stat mode.
+def get_path_type(mode):
+    if stat.S_ISDIR(mode):
+        return 'directory'
+    elif stat.S_ISREG(mode):
+        return 'file'
+    elif stat.S_ISLNK(mode):
+        return 'link'
+    elif stat.S_ISCHR(mode) or stat.S_ISBLK(mode):
+        return 'device'
+    return 'other'
+
+
+def stat_paths(paths):
+    results = {}
+    for path in paths:
+        try:
+            path_stat = os.stat(path)
+        except OSError:
+            results[path] = {'exists': False, 'type': None, 'size': 0}
+            continue
+        results[path] = {'exists': True, 'type': get_path_type(path_stat.st_mode), 'size': path_stat.st_size}
+    return results
+
+
+if __name__ == '__main__':
+    input_lines = [line for line in sys.stdin.read().split('\n') if line.strip() != '']
+    input_paths = json.loads(input_lines[-1]) if len(input_lines) > 0 else []
+    sys.stdout.write(json.dumps(stat_paths(input_paths)) + '\n')
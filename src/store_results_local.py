@@ -4,7 +4,14 @@ Study:  Computer Science at the University of Amsterdam
 Date:   08-06-2016
 
 This file implements a small wrapper to easily insert the query results
-locally from the MongoDB client.
+locally from the MongoDB client. An embedded SQLite backend with the same
+interface is available for machines without a MongoDB instance. Next to the
+full result documents, it stores the per query effects in flattened columns
+so aggregations are simple local table scans.
+
+Both result stores create indexes on the run identifiers and scenario fields,
+and offer the per scenario totals and per run time stamps as aggregations. So
+the result analyzer only has to stream the aggregated rows.
 
 FILE: store_results_local.py
 
@@ -15,49 +22,603 @@ USAGE:
     db.insert_fi_result(n_nodes, db_type, db_meta, test_dataset,
                         test_scenario, effects, run_id, res_id)
 
+    # Select the backend as given in the "result_store" field of a scenario file:
+    # {"backend": "sqlite", "path": "results/"}
+    db = create_local_db('test', store_meta={'backend': 'sqlite'})
+
+    # Per scenario (res_id) totals and per run time stamps.
+    for row in db.aggregate_scenarios():
+        print row['res_id'], row['runs'], row['errors']
+    for row in db.aggregate_run_times({'res_id': res_id}):
+        print row['run_id'], row['fault_times'], row['injection_times']
+
+    # Store the fault plans of a campaign, and mark them evaluated by a run.
+    db.insert_fault_plans(plans)
+    db.set_plan_evaluated(plan_id, res_id, run_id)
+    evaluated_plan_ids = db.get_evaluated_plan_ids()
+
+    # Cache compact run summaries and their per scenario aggregates, and only read the
+    # results inserted after the mark. The mark is the insert id of the last summarized
+    # result, results which can still be in flight have an insert id >= the settled mark.
+    for result in db.query_new_results(db.get_high_water_mark()):
+        db.insert_run_summaries([{'res_id': result['res_id'], 'run_id': result['run_id'], ...}],
+                                aggregates=[{'res_id': result['res_id'], ...}],
+                                high_water_mark=result['insert_id'])
+    for aggregate in db.query_summary_aggregates({'res_id': res_id}):
+        print aggregate['totals']
+
 """
 
-from pymongo import MongoClient
-from datetime import datetime
+import os
+import json
+import uuid
+import sqlite3
+from datetime import datetime, timedelta
+
+try:
+    from pymongo import MongoClient
+    from bson.objectid import ObjectId
+except ImportError:
+    MongoClient = None
+
+
+# Names of the result store backends which can be chosen in the scenario file.
+result_store_backends = ['mongodb', 'sqlite']
+
+# Effect counters of a single query which are stored as flattened columns.
+effect_columns = ["read_failure", "time_out", "coordinator_failure", "write_failure",
+                  "invalid_request", "no_host_available", "verification_errors",
+                  "results_missing", "duplicates"]
+
+# Effect counters which are raised by the DBMS itself, and thus are detected.
+db_error_columns = effect_columns[:6]
+
+# Scenario fields which are indexed and returned with the aggregated scenario rows.
+scenario_fields = ["FI_type", "num_files", "flips_per_file"]
+
+
+# Create a local result database given the "result_store" field of a scenario file.
+def create_local_db(db_name, store_meta=None, collection="faults"):
+    backend = 'mongodb'
+    if store_meta is not None and 'backend' in store_meta:
+        backend = store_meta['backend']
+
+    if backend == 'mongodb':
+        return LocalDB(db_name, collection=collection)
+    elif backend == 'sqlite':
+        path = store_meta['path'] if 'path' in store_meta else None
+        return SQLiteResultDB(db_name, collection=collection, path=path)
+
+    raise ValueError("Unknown result store backend: {}, implemented backends: {}".format(
+        backend, result_store_backends))
+
+
+# Create the result document as stored by each of the result stores.
+def create_fi_document(n_nodes, db_type, db_version, db_meta, test_dataset,
+                       test_scenario, effects, run_id, res_id):
+    return {
+        "server_params":
+            {
+                "n_nodes": n_nodes
+            },
+        "db_type": db_type,
+        "db_version": db_version,
+        "db_meta": db_meta,
+        "tested_dataset": test_dataset,
+        "test_scenario": test_scenario,
+        "effects": effects,
+        "run_id": run_id,
+        "res_id": res_id,
+        "time": datetime.now().isoformat()
+    }
+
+
+# MongoDB expression of all query effects of a result as [{k: query_id, v: effect}, ..].
+# A list of effects is stored when no results could be retrieved from the DBMS.
+def _mongo_effects_array():
+    effects = {'$cond': [{'$eq': [{'$type': '$effects'}, 'object']}, '$effects', {}]}
+    return {'$filter': {'input': {'$objectToArray': effects}, 'as': 'e',
+                        'cond': {'$eq': [{'$type': '$$e.v'}, 'object']}}}
+
+
+# MongoDB expression of the sum of absolute counters of a single query effect.
+def _mongo_abs_sum(effect, columns):
+    return {'$add': [{'$abs': {'$ifNull': ['{}.{}'.format(effect, col), 0]}} for col in columns]}
+
+
+# MongoDB expression of the sum of an expression over all query effects of a result.
+def _mongo_effects_sum(expression):
+    return {'$sum': {'$map': {'input': '$effects', 'as': 'e', 'in': expression}}}
 
 
 class LocalDB:
     def __init__(self, db_name, collection="faults"):
+        if MongoClient is None:
+            raise ImportError("The pymongo module is required for the mongodb result store.")
         self.client = MongoClient()
         self.db = self.create_db(db_name)
         self.collection = collection
+        self.create_indexes()
 
     def create_db(self, db_name):
         return self.client[db_name]
 
     def switch_db(self, db_name):
         self.db = self.client[db_name]
+        self.create_indexes()
 
     def switch_col(self, col_name):
         self.collection = col_name
+        self.create_indexes()
 
     def print_db_info(self):
         print "Current DB: {}\nCurrent collection: {}".format(self.db, self.collection)
 
+    # Index the run identifiers and scenario fields; existing indexes are left as is.
+    def create_indexes(self):
+        collection = self.db[self.collection]
+        for field in ['res_id', 'run_id', 'db_type', 'time']:
+            collection.create_index(field)
+        collection.create_index([('test_scenario.' + field, 1) for field in scenario_fields])
+        self.db[self.collection + '_summaries'].create_index('res_id')
+        self.db[self.collection + '_summaries'].create_index('insert_id')
+        self.db[self.collection + '_plans'].create_index([('seed', 1), ('scenario_id', 1)])
+
     def insert_fi_result(self, n_nodes, db_type, db_version, db_meta, test_dataset,
                          test_scenario, effects, run_id, res_id):
         self.db[self.collection].insert_one(
-            {
-                "server_params":
-                    {
-                        "n_nodes": n_nodes
-                    },
-                "db_type": db_type,
-                "db_version": db_version,
-                "db_meta": db_meta,
-                "tested_dataset": test_dataset,
-                "test_scenario": test_scenario,
-                "effects": effects,
-                "run_id": run_id,
-                "res_id": res_id,
-                "time": datetime.now().isoformat()
-             }
-            )
+            create_fi_document(n_nodes, db_type, db_version, db_meta, test_dataset,
+                               test_scenario, effects, run_id, res_id))
 
     def query_db(self, query=None):
         return self.db[self.collection].find(query)
+
+    # Aggregate the totals of each scenario (res_id) in the database.
+    def aggregate_scenarios(self, query=None):
+        run_fields = {'res_id': 1, 'effects': _mongo_effects_array(),
+                      'n_db_error_logs': {'$size': {'$ifNull': ['$test_scenario.db_error_logs', []]}}}
+        for field in scenario_fields:
+            run_fields[field] = '$test_scenario.' + field
+
+        run_totals = {'res_id': 1, 'n_db_error_logs': 1,
+                      'error_sum': _mongo_effects_sum(_mongo_abs_sum('$$e.v', effect_columns)),
+                      'db_errors': _mongo_effects_sum(_mongo_abs_sum('$$e.v', db_error_columns))}
+        for field in scenario_fields:
+            run_totals[field] = 1
+        for col in effect_columns:
+            run_totals[col] = _mongo_effects_sum({'$ifNull': ['$$e.v.' + col, 0]})
+
+        scenario_totals = {'_id': '$res_id', 'runs': {'$sum': 1}, 'error_sum': {'$sum': '$error_sum'},
+                           'errors': {'$sum': {'$cond': [{'$gt': ['$error_sum', 0]}, 1, 0]}},
+                           'error_sum_detected_db': {'$sum': {'$cond': [{'$gt': ['$db_errors', 0]}, 1, 0]}},
+                           'error_sum_detected_log': {'$sum': {'$cond': [{'$gt': ['$n_db_error_logs', 0]}, 1, 0]}}}
+        for field in scenario_fields:
+            scenario_totals[field] = {'$first': '$' + field}
+        for col in effect_columns:
+            scenario_totals[col] = {'$sum': '$' + col}
+
+        pipeline = [{'$match': query if query is not None else {}},
+                    {'$project': run_fields},
+                    {'$project': run_totals},
+                    {'$group': scenario_totals}]
+        for row in self.db[self.collection].aggregate(pipeline, allowDiskUse=True):
+            row['res_id'] = row.pop('_id')
+            yield row
+
+    # Get the injection times, fault times (of queries with effects) and error logs of each run.
+    def aggregate_run_times(self, query=None):
+        faulty_effects = {'$filter': {'input': _mongo_effects_array(), 'as': 'e',
+                                      'cond': {'$gt': [_mongo_abs_sum('$$e.v', effect_columns), 0]}}}
+        run_fields = {'_id': 0, 'res_id': 1, 'run_id': 1,
+                      'injection_times': {'$ifNull': ['$test_scenario.injection_times', []]},
+                      'db_error_logs': {'$ifNull': ['$test_scenario.db_error_logs', []]},
+                      'fault_times': {'$map': {'input': faulty_effects, 'as': 'e', 'in': '$$e.v.timestamp'}}}
+        pipeline = [{'$match': query if query is not None else {}},
+                    {'$project': run_fields}]
+        return self.db[self.collection].aggregate(pipeline, allowDiskUse=True)
+
+    # Get the results inserted after the high water mark (the ObjectId of a result), in
+    # insert order. The insert id of each result is added as 'insert_id'.
+    def query_new_results(self, high_water_mark=None):
+        query = {'_id': {'$gt': high_water_mark}} if high_water_mark is not None else {}
+        for result in self.db[self.collection].find(query).sort('_id', 1):
+            result['insert_id'] = result['_id']
+            yield result
+
+    # The ObjectId of a result is created by the client before it is inserted, so a result
+    # with a lower id can still be inserted by a concurrent run. Results of which the id
+    # is newer than settle_secs are not summarized into the high water mark yet.
+    def get_settled_mark(self, settle_secs=60):
+        return ObjectId.from_datetime(datetime.utcnow() - timedelta(seconds=settle_secs))
+
+    # Store run summaries, and optionally the updated aggregates of their scenarios and
+    # the high water mark of the summarized results.
+    def insert_run_summaries(self, summaries, aggregates=None, high_water_mark=None):
+        if len(summaries) > 0:
+            self.db[self.collection + '_summaries'].insert_many([dict(summary) for summary in summaries])
+        for aggregate in (aggregates if aggregates is not None else []):
+            self.db[self.collection + '_aggregates'].replace_one({'_id': aggregate['res_id']},
+                                                                 dict(aggregate, _id=aggregate['res_id']),
+                                                                 upsert=True)
+        if high_water_mark is not None:
+            self.set_high_water_mark(high_water_mark)
+
+    def query_run_summaries(self, query=None):
+        return self.db[self.collection + '_summaries'].find(query, {'_id': 0}).sort('insert_id', 1)
+
+    # Get the aggregates of the run summaries per scenario, only the res_id field of the
+    # query is used.
+    def query_summary_aggregates(self, query=None):
+        aggregate_query = {'_id': query['res_id']} if query is not None and 'res_id' in query else {}
+        return self.db[self.collection + '_aggregates'].find(aggregate_query, {'_id': 0})
+
+    # Remove the cached run summaries and aggregates, e.g. to summarize all results again.
+    def clear_run_summaries(self):
+        self.db[self.collection + '_summaries'].delete_many({})
+        self.db[self.collection + '_aggregates'].delete_many({})
+        self.db[self.collection + '_meta'].delete_one({'_id': 'high_water_mark'})
+
+    # Get the high water mark, None when no results are summarized, or when the mark is
+    # not an insert id (the result time of earlier versions).
+    def get_high_water_mark(self):
+        mark = self.db[self.collection + '_meta'].find_one({'_id': 'high_water_mark'})
+        if mark is None or not isinstance(mark['value'], ObjectId):
+            return None
+        return mark['value']
+
+    def set_high_water_mark(self, high_water_mark):
+        self.db[self.collection + '_meta'].replace_one({'_id': 'high_water_mark'},
+                                                       {'_id': 'high_water_mark', 'value': high_water_mark},
+                                                       upsert=True)
+
+    # Store the fault plans, plans which are already stored keep their evaluations.
+    def insert_fault_plans(self, plans):
+        for plan in plans:
+            self.db[self.collection + '_plans'].update_one(
+                {'_id': plan['plan_id']}, {'$setOnInsert': dict(plan, evaluated=False, results=[])}, upsert=True)
+
+    def query_fault_plans(self, query=None):
+        return self.db[self.collection + '_plans'].find(query, {'_id': 0}).sort([('scenario_id', 1), ('run_id', 1)])
+
+    # Mark a plan as evaluated by the result of a run.
+    def set_plan_evaluated(self, plan_id, res_id, run_id):
+        self.db[self.collection + '_plans'].update_one(
+            {'_id': plan_id}, {'$set': {'evaluated': True}, '$push': {'results': {'res_id': res_id, 'run_id': run_id}}})
+
+    def get_evaluated_plan_ids(self):
+        return set(self.db[self.collection + '_plans'].distinct('_id', {'evaluated': True}))
+
+
+class SQLiteResultDB:
+    # Top level fields which are stored in their own column and can be queried directly.
+    indexed_fields = ['res_id', 'run_id', 'db_type', 'db_version']
+
+    def __init__(self, db_name, collection="faults", path=None):
+        self.db_name = db_name
+        self.collection = collection
+        if path is not None and not os.path.exists(path):
+            os.makedirs(path)
+        self.db_file = os.path.join(path if path is not None else '.', db_name + '.sqlite')
+        self.connection = sqlite3.connect(self.db_file)
+        self.setup()
+
+    def switch_col(self, col_name):
+        self.collection = col_name
+        self.setup()
+
+    def print_db_info(self):
+        print "Current DB: {}\nCurrent collection: {}".format(self.db_file, self.collection)
+
+    def close_connection(self):
+        self.connection.close()
+
+    def _effects_table(self):
+        return self.collection + '_effects'
+
+    # Create the result table and the flattened per query effects table.
+    def setup(self):
+        cursor = self.connection.cursor()
+        cursor.execute("CREATE TABLE IF NOT EXISTS {} (".format(self.collection) +
+                       "id               INTEGER PRIMARY KEY AUTOINCREMENT," +
+                       "res_id           TEXT    NOT NULL," +
+                       "run_id           INTEGER NOT NULL," +
+                       "db_type          TEXT," +
+                       "db_version       TEXT," +
+                       "n_nodes          INTEGER," +
+                       "fi_type          TEXT," +
+                       "num_files        INTEGER," +
+                       "flips_per_file   INTEGER," +
+                       "error_sum        INTEGER," +
+                       "n_db_error_logs  INTEGER," +
+                       "time             TEXT," +
+                       "injection_times  TEXT," +
+                       "db_error_logs    TEXT," +
+                       "document         TEXT    NOT NULL);")
+        cursor.execute("CREATE TABLE IF NOT EXISTS {} (".format(self._effects_table()) +
+                       "result_id  INTEGER NOT NULL," +
+                       "res_id     TEXT    NOT NULL," +
+                       "run_id     INTEGER NOT NULL," +
+                       "query_id   INTEGER NOT NULL," +
+                       "timestamp  TEXT," +
+                       ", ".join("{} INTEGER DEFAULT 0".format(col) for col in effect_columns) + ");")
+
+        # The cached run summaries and the high water mark of the summarized results.
+        cursor.execute("CREATE TABLE IF NOT EXISTS {}_summaries (".format(self.collection) +
+                       "res_id     TEXT    NOT NULL," +
+                       "run_id     INTEGER NOT NULL," +
+                       "time       TEXT," +
+                       "insert_id  INTEGER," +
+                       "summary    TEXT    NOT NULL);")
+        # Summaries cached by earlier versions have no insert id, they are summarized again.
+        cursor.execute("PRAGMA table_info({}_summaries)".format(self.collection))
+        if 'insert_id' not in [column[1] for column in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE {}_summaries ADD COLUMN insert_id INTEGER".format(self.collection))
+        cursor.execute("CREATE TABLE IF NOT EXISTS {}_aggregates (".format(self.collection) +
+                       "res_id     TEXT    PRIMARY KEY," +
+                       "aggregate  TEXT    NOT NULL);")
+        cursor.execute("CREATE TABLE IF NOT EXISTS {}_meta (".format(self.collection) +
+                       "key    TEXT PRIMARY KEY," +
+                       "value  TEXT);")
+
+        # The fault plans of the scenarios, and the results which evaluated them.
+        cursor.execute("CREATE TABLE IF NOT EXISTS {}_plans (".format(self.collection) +
+                       "plan_id      TEXT    PRIMARY KEY," +
+                       "seed         INTEGER," +
+                       "scenario_id  INTEGER," +
+                       "run_id       INTEGER," +
+                       "evaluated    INTEGER DEFAULT 0," +
+                       "results      TEXT    DEFAULT '[]'," +
+                       "plan         TEXT    NOT NULL);")
+
+        # Index the run identifiers and scenario fields.
+        for field in ['res_id', 'run_id', 'db_type', 'time']:
+            cursor.execute("CREATE INDEX IF NOT EXISTS {0}_{1} ON {0} ({1})".format(self.collection, field))
+        cursor.execute("CREATE INDEX IF NOT EXISTS {0}_summaries_res_id ON {0}_summaries (res_id)".format(
+            self.collection))
+        cursor.execute("CREATE INDEX IF NOT EXISTS {0}_scenario ON {0} ".format(self.collection) +
+                       "(fi_type, num_files, flips_per_file)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS {0}_result_id ON {0} (result_id)".format(self._effects_table()))
+        cursor.execute("CREATE INDEX IF NOT EXISTS {0}_plans_scenario ON {0}_plans (seed, scenario_id)".format(
+            self.collection))
+        self.connection.commit()
+
+    def insert_fi_result(self, n_nodes, db_type, db_version, db_meta, test_dataset,
+                         test_scenario, effects, run_id, res_id):
+        document = create_fi_document(n_nodes, db_type, db_version, db_meta, test_dataset,
+                                      test_scenario, effects, run_id, str(res_id))
+
+        # A list of effects is received when no results could be retrieved from the DBMS.
+        query_effects = []
+        if isinstance(effects, dict):
+            query_effects = [(query_id, query_effect) for query_id, query_effect in effects.items()
+                             if isinstance(query_effect, dict)]
+        error_sum = 0
+        for _, query_effect in query_effects:
+            error_sum += sum(abs(query_effect[col]) for col in effect_columns if col in query_effect)
+
+        cursor = self.connection.cursor()
+        insert_stmt = "INSERT INTO {} (res_id, run_id, db_type, db_version, n_nodes, ".format(self.collection) +\
+                      "fi_type, num_files, flips_per_file, error_sum, n_db_error_logs, time, " +\
+                      "injection_times, db_error_logs, document) " +\
+                      "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        cursor.execute(insert_stmt, (str(res_id), run_id, db_type, db_version, n_nodes,
+                                     test_scenario.get('FI_type'), test_scenario.get('num_files'),
+                                     test_scenario.get('flips_per_file'), error_sum,
+                                     len(test_scenario.get('db_error_logs', [])), document['time'],
+                                     json.dumps(test_scenario.get('injection_times', [])),
+                                     json.dumps(test_scenario.get('db_error_logs', [])),
+                                     json.dumps(document)))
+        result_id = cursor.lastrowid
+
+        effect_stmt = "INSERT INTO {} (result_id, res_id, run_id, query_id, timestamp, ".format(self._effects_table()) +\
+                      ", ".join(effect_columns) + ") VALUES (?, ?, ?, ?, ?, " +\
+                      ", ".join(['?'] * len(effect_columns)) + ")"
+        cursor.executemany(effect_stmt, [[result_id, str(res_id), run_id, int(query_id), query_effect.get('timestamp')] +
+                                         [query_effect.get(col, 0) for col in effect_columns]
+                                         for query_id, query_effect in query_effects])
+        self.connection.commit()
+
+    # Query the result documents with a MongoDB like query of the form {field: value, ..}.
+    # Fields in indexed_fields are filtered by SQLite, all other fields on the documents.
+    def query_db(self, query=None):
+        query = query if query is not None else {}
+        where_stmt, where_params = self._where(query)
+        select_stmt = "SELECT document FROM {}{} ORDER BY id".format(self.collection, where_stmt)
+
+        cursor = self.connection.cursor()
+        cursor.execute(select_stmt, where_params)
+        for (document,) in cursor:
+            document = json.loads(document)
+            document['res_id'] = uuid.UUID(document['res_id'])
+            if all(document.get(key) == val for key, val in query.items() if key not in self.indexed_fields):
+                yield document
+
+    # Create the WHERE clause and parameters of the indexed fields in a query.
+    def _where(self, query, table=None):
+        where = [(key, str(val) if isinstance(val, uuid.UUID) else val)
+                 for key, val in (query if query is not None else {}).items() if key in self.indexed_fields]
+        if len(where) == 0:
+            return "", []
+        prefix = table + '.' if table is not None else ''
+        return " WHERE " + " AND ".join("{}{}=?".format(prefix, key) for key, _ in where), [val for _, val in where]
+
+    # Aggregate the totals of each scenario (res_id) in the database.
+    # Only the indexed fields of the query are used as filter.
+    def aggregate_scenarios(self, query=None):
+        where_stmt, where_params = self._where(query, table='r')
+        effect_sums = ", ".join("SUM({0}) AS {0}".format(col) for col in effect_columns)
+        db_errors = " + ".join("ABS({})".format(col) for col in db_error_columns)
+        select_stmt = "SELECT r.res_id, r.fi_type, r.num_files, r.flips_per_file, COUNT(*), " +\
+                      "SUM(r.error_sum != 0), SUM(r.error_sum), " +\
+                      "SUM(COALESCE(e.db_errors, 0) > 0), SUM(r.n_db_error_logs > 0), " +\
+                      ", ".join("COALESCE(SUM(e.{0}), 0)".format(col) for col in effect_columns) +\
+                      " FROM {} r LEFT JOIN ".format(self.collection) +\
+                      "(SELECT result_id, SUM({}) AS db_errors, {} ".format(db_errors, effect_sums) +\
+                      "FROM {} GROUP BY result_id) e ON e.result_id = r.id".format(self._effects_table()) +\
+                      where_stmt + " GROUP BY r.res_id ORDER BY MIN(r.id)"
+
+        cursor = self.connection.cursor()
+        cursor.execute(select_stmt, where_params)
+        for row in cursor:
+            aggregated = dict(zip(['res_id'] + scenario_fields + ['runs', 'errors', 'error_sum',
+                                                                  'error_sum_detected_db', 'error_sum_detected_log'] +
+                                  effect_columns, row))
+            aggregated['res_id'] = uuid.UUID(aggregated['res_id'])
+            yield aggregated
+
+    # Get the injection times, fault times (of queries with effects) and error logs of each run.
+    def aggregate_run_times(self, query=None):
+        where_stmt, where_params = self._where(query)
+        abs_sum = " + ".join("ABS({})".format(col) for col in effect_columns)
+
+        # Group the fault times of all faulty queries by their result row.
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT result_id, timestamp FROM {} ".format(self._effects_table()) +
+                       "WHERE {} > 0 AND result_id IN ".format(abs_sum) +
+                       "(SELECT id FROM {}{}) ORDER BY result_id, query_id".format(self.collection, where_stmt),
+                       where_params)
+        fault_times = {}
+        for result_id, timestamp in cursor:
+            fault_times.setdefault(result_id, []).append(timestamp)
+
+        cursor.execute("SELECT id, res_id, run_id, injection_times, db_error_logs " +
+                       "FROM {}{} ORDER BY id".format(self.collection, where_stmt), where_params)
+        for result_id, res_id, run_id, injection_times, db_error_logs in cursor:
+            yield {'res_id': uuid.UUID(res_id), 'run_id': run_id,
+                   'injection_times': json.loads(injection_times), 'db_error_logs': json.loads(db_error_logs),
+                   'fault_times': fault_times.get(result_id, [])}
+
+    # Get the results inserted after the high water mark (the row id of a result), in
+    # insert order. The row id of each result is added as 'insert_id'.
+    def query_new_results(self, high_water_mark=None):
+        select_stmt = "SELECT id, document FROM {}".format(self.collection)
+        params = []
+        if high_water_mark is not None:
+            select_stmt += " WHERE id > ?"
+            params.append(high_water_mark)
+
+        cursor = self.connection.cursor()
+        cursor.execute(select_stmt + " ORDER BY id", params)
+        for (result_id, document) in cursor:
+            document = json.loads(document)
+            document['res_id'] = uuid.UUID(document['res_id'])
+            document['insert_id'] = result_id
+            yield document
+
+    # SQLite serializes the inserts, so a row id is only assigned after all lower row ids
+    # are committed and all results are settled.
+    def get_settled_mark(self):
+        return None
+
+    # Store run summaries, and optionally the updated aggregates of their scenarios and
+    # the high water mark of the summarized results, in a single transaction.
+    def insert_run_summaries(self, summaries, aggregates=None, high_water_mark=None):
+        summaries = [dict(summary, res_id=str(summary['res_id'])) for summary in summaries]
+        self.connection.executemany("INSERT INTO {}_summaries (res_id, run_id, time, insert_id, summary) ".format(
+            self.collection) + "VALUES (?, ?, ?, ?, ?)", [(summary['res_id'], summary['run_id'], summary.get('time'),
+                                                           summary.get('insert_id'), json.dumps(summary))
+                                                          for summary in summaries])
+        aggregates = [dict(aggregate, res_id=str(aggregate['res_id']))
+                      for aggregate in (aggregates if aggregates is not None else [])]
+        self.connection.executemany("INSERT OR REPLACE INTO {}_aggregates (res_id, aggregate) ".format(self.collection) +
+                                    "VALUES (?, ?)", [(aggregate['res_id'], json.dumps(aggregate))
+                                                      for aggregate in aggregates])
+        if high_water_mark is not None:
+            self.connection.execute("INSERT OR REPLACE INTO {}_meta (key, value) ".format(self.collection) +
+                                    "VALUES ('high_water_mark', ?)", (high_water_mark,))
+        self.connection.commit()
+
+    # Get the cached run summaries, only the res_id and run_id fields of the query are used.
+    def query_run_summaries(self, query=None):
+        where = [(key, str(val) if isinstance(val, uuid.UUID) else val)
+                 for key, val in (query if query is not None else {}).items() if key in ['res_id', 'run_id']]
+        select_stmt = "SELECT summary FROM {}_summaries".format(self.collection)
+        if len(where) > 0:
+            select_stmt += " WHERE " + " AND ".join("{}=?".format(key) for key, _ in where)
+
+        cursor = self.connection.cursor()
+        cursor.execute(select_stmt + " ORDER BY insert_id", [val for _, val in where])
+        for (summary,) in cursor:
+            summary = json.loads(summary)
+            summary['res_id'] = uuid.UUID(summary['res_id'])
+            yield summary
+
+    # Get the aggregates of the run summaries per scenario, only the res_id field of the
+    # query is used.
+    def query_summary_aggregates(self, query=None):
+        select_stmt = "SELECT aggregate FROM {}_aggregates".format(self.collection)
+        params = []
+        if query is not None and 'res_id' in query:
+            select_stmt += " WHERE res_id=?"
+            params.append(str(query['res_id']))
+
+        cursor = self.connection.cursor()
+        cursor.execute(select_stmt, params)
+        for (aggregate,) in cursor:
+            aggregate = json.loads(aggregate)
+            aggregate['res_id'] = uuid.UUID(aggregate['res_id'])
+            yield aggregate
+
+    # Remove the cached run summaries and aggregates, e.g. to summarize all results again.
+    def clear_run_summaries(self):
+        self.connection.execute("DELETE FROM {}_summaries".format(self.collection))
+        self.connection.execute("DELETE FROM {}_aggregates".format(self.collection))
+        self.connection.execute("DELETE FROM {}_meta WHERE key='high_water_mark'".format(self.collection))
+        self.connection.commit()
+
+    # Get the high water mark, None when no results are summarized, or when the mark is
+    # not a row id (the result time of earlier versions).
+    def get_high_water_mark(self):
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT value FROM {}_meta WHERE key='high_water_mark'".format(self.collection))
+        mark = cursor.fetchone()
+        if mark is None or not str(mark[0]).isdigit():
+            return None
+        return int(mark[0])
+
+    def set_high_water_mark(self, high_water_mark):
+        self.connection.execute("INSERT OR REPLACE INTO {}_meta (key, value) ".format(self.collection) +
+                                "VALUES ('high_water_mark', ?)", (high_water_mark,))
+        self.connection.commit()
+
+    # Store the fault plans, plans which are already stored keep their evaluations.
+    def insert_fault_plans(self, plans):
+        self.connection.executemany("INSERT OR IGNORE INTO {}_plans ".format(self.collection) +
+                                    "(plan_id, seed, scenario_id, run_id, plan) VALUES (?, ?, ?, ?, ?)",
+                                    [(plan['plan_id'], plan['seed'], plan['scenario_id'], plan['run_id'],
+                                      json.dumps(plan)) for plan in plans])
+        self.connection.commit()
+
+    # Get the fault plans, only the plan_id, seed, scenario_id, run_id and evaluated
+    # fields of the query are used.
+    def query_fault_plans(self, query=None):
+        where = [(key, val) for key, val in (query if query is not None else {}).items()
+                 if key in ['plan_id', 'seed', 'scenario_id', 'run_id', 'evaluated']]
+        select_stmt = "SELECT plan, evaluated, results FROM {}_plans".format(self.collection)
+        if len(where) > 0:
+            select_stmt += " WHERE " + " AND ".join("{}=?".format(key) for key, _ in where)
+
+        cursor = self.connection.cursor()
+        cursor.execute(select_stmt + " ORDER BY scenario_id, run_id", [val for _, val in where])
+        for plan, evaluated, results in cursor:
+            plan = json.loads(plan)
+            plan['evaluated'] = evaluated == 1
+            plan['results'] = [dict(result, res_id=uuid.UUID(result['res_id'])) for result in json.loads(results)]
+            yield plan
+
+    # Mark a plan as evaluated by the result of a run.
+    def set_plan_evaluated(self, plan_id, res_id, run_id):
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT results FROM {}_plans WHERE plan_id=?".format(self.collection), (plan_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return
+        results = json.loads(row[0]) + [{'res_id': str(res_id), 'run_id': run_id}]
+        cursor.execute("UPDATE {}_plans SET evaluated=1, results=? WHERE plan_id=?".format(self.collection),
+                       (json.dumps(results), plan_id))
+        self.connection.commit()
+
+    def get_evaluated_plan_ids(self):
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT plan_id FROM {}_plans WHERE evaluated=1".format(self.collection))
+        return set(plan_id for (plan_id,) in cursor)
@@ -0,0 +1,108 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file selects the fault injection targets of a scenario. By default each
+target file is chosen uniformly, but the read counts of the file tracer can be
+used to favour the files (and offset ranges) the query workload actually reads:
+
+- uniform:    every target file has the same probability.
+- weighted:   a file is chosen proportional to its read (or access) count.
+- hot_region: a file is chosen as with weighted, and one of its offset ranges
+              proportional to the reads of that range.
+
+Files without any recorded reads keep a small weight (min_weight), so cold files
+can still be targeted once in a while.
+
+When the offset ranges of specific regions are given (e.g. the SSTable regions of
+sstable_layout.py), only the files of these regions are targeted, and an offset
+range is chosen proportional to its length.
+
+FILE: target_selection.py
+
+USAGE:
+    from target_selection import TargetSelector
+    selector = TargetSelector(target_list, tracer_counts, mode='hot_region')
+    selector = TargetSelector(target_list, tracer_counts, region_ranges={path: [[start, end], ..]})
+    file_name, offset_range = selector.choose()
+
+"""
+
+import random
+from bisect import bisect_right
+
+# The implemented target selection modes.
+selection_modes = ['uniform', 'weighted', 'hot_region']
+
+
+# Create a cumulative weight list, to choose an item with a binary search.
+def cumulative_weights(weights):
+    total = 0
+    cumulative = []
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    return cumulative
+
+
+# Choose an index of the cumulative weights proportional to its weight.
+def weighted_index(cumulative, rng=random):
+    return bisect_right(cumulative, rng.random() * cumulative[-1])
+
+
+class TargetSelector:
+    def __init__(self, target_list, counts=None, mode='uniform', min_weight=1, region_ranges=None):
+        if mode not in selection_modes:
+            raise ValueError('Unknown target selection mode: {}, implemented: {}'.format(mode, selection_modes))
+        if counts is None or mode == 'uniform':
+            counts = {}
+
+        # The regions can be in files not traced, e.g. when their extension is excluded.
+        if region_ranges is not None:
+            target_list = sorted(region_ranges)
+        self.target_list = list(target_list)
+        self.mode = mode
+        self.range_size = counts.get('range_size', 0)
+
+        # Prefer the read counts, as a flip in a written region is overwritten again.
+        reads = counts.get('reads', {})
+        if len(reads) == 0:
+            reads = counts.get('accesses', {})
+        self.cumulative = cumulative_weights([reads.get(target, 0) + min_weight for target in self.target_list])
+
+        # The sorted offset ranges of each file with their cumulative read counts.
+        self.read_ranges = {}
+        if mode == 'hot_region':
+            for target, ranges in counts.get('read_ranges', {}).items():
+                ranges = sorted((int(index), n) for index, n in ranges.items())
+                self.read_ranges[target] = ([index for index, _ in ranges],
+                                            cumulative_weights([n for _, n in ranges]))
+
+        # The offset ranges of the targeted regions with their cumulative lengths.
+        self.region_ranges = {}
+        if region_ranges is not None:
+            for target, ranges in region_ranges.items():
+                self.region_ranges[target] = (ranges, cumulative_weights([end - start for start, end in ranges]))
+
+    def __len__(self):
+        return len(self.target_list)
+
+    # Choose a target file and optionally a (start, end) offset range of the file to
+    # insert the fault in. The range is None when any offset of the file can be used.
+    # A seeded random generator (rng) can be given to create reproducible choices.
+    def choose(self, rng=random):
+        if self.mode == 'uniform':
+            target = rng.choice(self.target_list)
+        else:
+            target = self.target_list[weighted_index(self.cumulative, rng)]
+
+        if target in self.region_ranges:
+            ranges, cumulative = self.region_ranges[target]
+            return target, tuple(ranges[weighted_index(cumulative, rng)])
+        if target not in self.read_ranges:
+            return target, None
+
+        indices, cumulative = self.read_ranges[target]
+        start = indices[weighted_index(cumulative, rng)] * self.range_size
+        return target, (start, start + self.range_size)
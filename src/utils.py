@@ -36,6 +36,17 @@ def get_time_from_str(time_str, return_list=False):
         return dt.time(time_numbers[0], time_numbers[1], int(time_str_numbers[2]))
 
 
+# Convert a string in format Hours:Mins:Secs[.fraction] in microseconds since midnight.
+def time_str_to_micros(time_str):
+    hours, mins, secs = time_str.split(':')
+    if '.' in secs:
+        secs, fraction = secs.split('.')
+        micros = int((fraction + '000000')[:6])
+    else:
+        micros = 0
+    return ((int(hours) * 60 + int(mins)) * 60 + int(secs)) * 1000000 + micros
+
+
 # Find the time between a and b return a time object
 def get_time_difference(time_a, time_b):
     datetime_a = dt.datetime(1, 1, 1, time_a.hour, time_a.minute, time_a.second, time_a.microsecond)
@@ -0,0 +1,121 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file expands the query file into the list of executed queries. Next to the
+static "queries", a "workload" of parameterized queries can be given, of which
+the parameters are drawn from a key distribution:
+
+- uniform:    each key between min and max is equally likely.
+- zipfian:    key min is the most popular, the popularity of key min + i - 1 is
+              proportional to 1 / i^theta (0 < theta < 1, 0.99 by default). The
+              keys are drawn with the closed form generator of YCSB, so large key
+              ranges need no table of the key popularities.
+- sequential: the keys min till max in order, starting again at min.
+- value:      a constant parameter.
+
+The keys are drawn from a random generator with the seed of the workload, so the
+verification run and each test run execute exactly the same queries, and the
+results can be verified per query.
+
+FILE: workload.py
+
+USAGE:
+    from workload import expand_workload
+    for (query, params) in expand_workload(load_json_file('queries.json')):
+        db_session.query_db(query, params)
+
+    The query file:
+    {"queries": ["SELECT * FROM a_table;"],
+     "workload": {"seed": 42,
+                  "operations": [{"query": "SELECT * FROM a_table WHERE id = ?", "count": 100,
+                                  "params": [{"distribution": "zipfian", "min": 1, "max": 31}]}]}}
+
+"""
+
+import random
+
+# The implemented key distributions.
+distributions = ['uniform', 'zipfian', 'sequential', 'value']
+
+# The number of terms of the zeta function which are summed exactly, the remaining
+# terms are approximated.
+zeta_exact_terms = 10000
+
+
+# Get the zeta function sum(1 / i^theta for i in 1..n). For a large n the tail of the
+# sum is approximated with the Euler-Maclaurin formula, which is exact up to a
+# relative error far below the precision of the drawn keys.
+def zeta(n, theta):
+    m = min(n, zeta_exact_terms)
+    total = sum(1.0 / i ** theta for i in range(1, m + 1))
+    if n > m:
+        total += (n ** (1 - theta) - m ** (1 - theta)) / (1 - theta)
+        total += (n ** -theta - m ** -theta) / 2
+        total += theta / 12 * (m ** (-theta - 1) - n ** (-theta - 1))
+    return total
+
+
+class KeyGenerator:
+    def __init__(self, param, rng):
+        self.distribution = param.get('distribution', 'uniform' if 'value' not in param else 'value')
+        if self.distribution not in distributions:
+            raise ValueError('Unknown key distribution: {}, implemented: {}'.format(self.distribution,
+                                                                                    distributions))
+        self.rng = rng
+        self.value = param.get('value')
+        self.min_key, self.max_key = param.get('min', 0), param.get('max', 0)
+        self.next_key = self.min_key
+
+        if self.distribution == 'zipfian':
+            # The constants of the YCSB zipfian generator (Gray et al., Quickly generating
+            # billion-record synthetic databases).
+            self.theta = param.get('theta', 0.99)
+            if not 0 < self.theta < 1:
+                raise ValueError('The zipfian theta must be in (0, 1), given: {}'.format(self.theta))
+            self.n_keys = self.max_key - self.min_key + 1
+            self.zeta_n = zeta(self.n_keys, self.theta)
+            self.alpha = 1.0 / (1 - self.theta)
+            # With at most two keys, the keys are drawn without the inverse formula.
+            self.eta = 0.0
+            if self.n_keys > 2:
+                self.eta = (1 - (2.0 / self.n_keys) ** (1 - self.theta)) / (1 - zeta(2, self.theta) / self.zeta_n)
+
+    def next(self):
+        if self.distribution == 'value':
+            return self.value
+        elif self.distribution == 'uniform':
+            return self.rng.randint(self.min_key, self.max_key)
+        elif self.distribution == 'zipfian':
+            return self.next_zipfian()
+
+        key = self.next_key
+        self.next_key = key + 1 if key < self.max_key else self.min_key
+        return key
+
+    def next_zipfian(self):
+        u = self.rng.random()
+        uz = u * self.zeta_n
+        if uz < 1.0 or self.n_keys == 1:
+            return self.min_key
+        if uz < 1.0 + 0.5 ** self.theta:
+            return self.min_key + 1
+        rank = int(self.n_keys * (self.eta * u - self.eta + 1) ** self.alpha)
+        return self.min_key + min(rank, self.n_keys - 1)
+
+
+# Expand the query file into a list of (query, params) tuples, the params are None for
+# the static queries. Each operation of the workload is repeated count times.
+def expand_workload(query_data):
+    queries = [(query, None) for query in query_data.get('queries', [])]
+    if 'workload' not in query_data:
+        return queries
+
+    workload = query_data['workload']
+    rng = random.Random(workload.get('seed', 0))
+    for operation in workload['operations']:
+        generators = [KeyGenerator(param, rng) for param in operation.get('params', [])]
+        for _ in range(operation.get('count', 1)):
+            queries.append((operation['query'], [generator.next() for generator in generators]))
+    return queries
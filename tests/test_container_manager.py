@@ -0,0 +1,116 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file tests the Docker Engine API batches of the container manager with the
+in memory FakeDockerEngine, in particular the failure paths: a failed restore
+command fails the batch, and a container created by a failed batch is removed.
+
+FILE: test_container_manager.py
+
+USAGE: python -m unittest discover -b -s tests -t .
+"""
+
+import unittest
+from src.docker_engine import FakeDockerEngine, DockerEngineError, run_operations
+from src.container_manager import ContainerManager, create_container_config, get_done_operations
+
+image_id = 'sha256:0123456789abcdef'
+image_tag = 'cassandra-backup:1.0'
+
+
+# A fake engine of which starting a container without a checkpoint fails.
+class FailingStartEngine(FakeDockerEngine):
+    def start(self, container_id, checkpoint=None):
+        if checkpoint is None:
+            raise DockerEngineError(500, 'Cannot start container: port is already allocated')
+        FakeDockerEngine.start(self, container_id, checkpoint)
+
+
+class ContainerManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = FakeDockerEngine(images={image_id: [image_tag]})
+        self.manager = ContainerManager(engine=self.engine)
+        self.config = create_container_config(image_tag)
+        self.container_id = self.engine.create(self.config)
+        self.engine.start(self.container_id)
+
+    def running_ids(self):
+        return [container_id[:12] for container_id, container in self.engine.containers.items()
+                if container['running']]
+
+    def test_command_error(self):
+        results = run_operations(self.engine, [{'op': 'command', 'cmd': 'exit 3'}, {'op': 'command', 'cmd': 'true'}])
+        self.assertEqual(results[0]['returncode'], 3)
+        self.assertIn('error', results[0])
+        self.assertNotIn('error', results[1])
+
+    def test_recreate(self):
+        self.assertEqual(self.manager.get_container_id(image_id[7:19], image_tag), self.container_id)
+        (new_id, results) = self.manager.recreate(self.container_id, self.config, commands=['true'])
+        self.assertIsNotNone(new_id)
+        self.assertEqual(self.running_ids(), [new_id])
+        self.assertEqual(len(self.engine.containers), 1)
+        self.assertEqual(self.manager.get_container_id(image_id[7:19], image_tag), new_id)
+
+    def test_recreate_failed_restore(self):
+        (new_id, results) = self.manager.recreate(self.container_id, self.config, commands=['exit 1'])
+        self.assertIsNone(new_id)
+        # The container created after the failed restore is removed again.
+        self.assertEqual(self.engine.containers, {})
+        self.assertEqual(get_done_operations(results), set(['stop', 'remove', 'create', 'start']))
+
+    def test_recreate_failed_create(self):
+        (new_id, results) = self.manager.recreate(self.container_id, create_container_config('unknown:1.0'),
+                                                  commands=['true'])
+        self.assertIsNone(new_id)
+        self.assertEqual(self.engine.containers, {})
+        self.assertEqual(get_done_operations(results), set(['stop', 'remove', 'command']))
+
+    def test_recreate_failed_start(self):
+        engine = FailingStartEngine(images={image_id: [image_tag]})
+        container_id = engine.create(self.config)
+        (new_id, results) = ContainerManager(engine=engine).recreate(container_id, self.config, commands=['true'])
+        self.assertIsNone(new_id)
+        self.assertEqual(engine.containers, {})
+        self.assertNotIn('start', get_done_operations(results))
+
+    def test_recreate_unknown_container(self):
+        (new_id, results) = self.manager.recreate('unknown', self.config)
+        self.assertIsNone(new_id)
+        # The running container is left as is.
+        self.assertEqual(self.running_ids(), [self.container_id])
+        self.assertNotIn('remove', get_done_operations(results))
+
+    def test_checkpoint_and_restore(self):
+        (created, _) = self.manager.checkpoint(self.container_id, 'fi-warm', commands=['true'])
+        self.assertTrue(created)
+        self.assertEqual(self.running_ids(), [])
+        (resumed, _) = self.manager.restore_checkpoint(self.container_id, 'fi-warm', commands=['true'])
+        self.assertTrue(resumed)
+        self.assertEqual(self.running_ids(), [self.container_id])
+
+    def test_checkpoint_failed_archive(self):
+        (created, results) = self.manager.checkpoint(self.container_id, 'fi-warm', commands=['exit 2'])
+        self.assertFalse(created)
+
+    def test_checkpoint_without_criu(self):
+        engine = FakeDockerEngine(images={image_id: [image_tag]}, criu=False)
+        container_id = engine.create(self.config)
+        engine.start(container_id)
+        (created, _) = ContainerManager(engine=engine).checkpoint(container_id, 'fi-warm')
+        self.assertFalse(created)
+
+    def test_restore_checkpoint_failed_restore(self):
+        self.manager.checkpoint(self.container_id, 'fi-warm')
+        (resumed, results) = self.manager.restore_checkpoint(self.container_id, 'fi-warm', commands=['exit 1'])
+        self.assertFalse(resumed)
+
+    def test_restore_unknown_checkpoint(self):
+        (resumed, _) = self.manager.restore_checkpoint(self.container_id, 'fi-warm')
+        self.assertFalse(resumed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file tests the seeded fault plans: the same seed gives the same plans, the
+plan of a run does not depend on the number of repetitions, and the evaluated
+plans are tracked by the result store.
+
+FILE: test_fault_plan.py
+
+USAGE: python -m unittest discover -b -s tests -t .
+"""
+
+import shutil
+import tempfile
+import unittest
+import uuid
+from src.fault_plan import create_scenario_plans, group_plan_injections
+from src.target_selection import TargetSelector
+from src.store_results_local import create_local_db
+
+file_sizes = {'a-Data.db': 4096, 'b-Data.db': 1024, 'empty-Data.db': 0}
+test_scenario = {'FI_type': 'bitflip', 'num_files': 2, 'flips_per_file': 3, 'start_delay_ms': 5, 'delay_ms': 10}
+
+
+def create_plans(seed, repetitions, scenario=None, scenario_id=0):
+    target_selector = TargetSelector(sorted(file_sizes))
+    return create_scenario_plans(seed, scenario_id, scenario if scenario is not None else test_scenario,
+                                 target_selector, file_sizes, repetitions)
+
+
+class FaultPlanTest(unittest.TestCase):
+    def test_seeded_plans(self):
+        self.assertEqual(create_plans(42, 5), create_plans(42, 5))
+        self.assertNotEqual([plan['plan_id'] for plan in create_plans(42, 5)],
+                            [plan['plan_id'] for plan in create_plans(43, 5)])
+        self.assertNotEqual(create_plans(42, 1)[0]['plan_id'], create_plans(42, 1, scenario_id=1)[0]['plan_id'])
+
+    def test_extended_campaign(self):
+        self.assertEqual(create_plans(42, 10)[:5], create_plans(42, 5))
+
+    def test_flips(self):
+        for plan in create_plans(42, 20):
+            self.assertEqual(len(plan['flips']), 6)
+            for flip in plan['flips']:
+                self.assertNotEqual(flip['file'], 'empty-Data.db')
+                self.assertTrue(0 <= flip['offset'] < file_sizes[flip['file']])
+                self.assertTrue(0 <= flip['bit'] <= 7)
+            self.assertEqual([flip['delay_ms'] for flip in plan['flips']], [5, 0, 0, 10, 0, 0])
+
+    def test_stuck_bit_values(self):
+        plans = create_plans(42, 3, dict(test_scenario, FI_type='stuck_bit', stuck_value=1))
+        self.assertEqual(set(flip['value'] for plan in plans for flip in plan['flips']), set([1]))
+
+    def test_no_targets(self):
+        self.assertEqual(create_scenario_plans(42, 0, test_scenario, TargetSelector([]), file_sizes, 5), [])
+
+    def test_group_injections(self):
+        plan = {'flips': [{'file': 'a', 'offset': 1, 'bit': 0, 'delay_ms': 5},
+                          {'file': 'a', 'offset': 2, 'bit': 1, 'delay_ms': 0},
+                          {'file': 'b', 'offset': 3, 'bit': 2, 'delay_ms': 0},
+                          {'file': 'b', 'offset': 4, 'bit': 3, 'delay_ms': 10}]}
+        self.assertEqual(group_plan_injections(plan), [(5, 'a', [(1, 0), (2, 1)]), (0, 'b', [(3, 2)]),
+                                                       (10, 'b', [(4, 3)])])
+
+
+class EvaluatedPlanTest(unittest.TestCase):
+    def setUp(self):
+        self.result_path = tempfile.mkdtemp()
+        self.result_db = create_local_db('test', {'backend': 'sqlite', 'path': self.result_path})
+
+    def tearDown(self):
+        self.result_db.close_connection()
+        shutil.rmtree(self.result_path)
+
+    def test_evaluated_plans(self):
+        plans = create_plans(42, 3)
+        self.result_db.insert_fault_plans(plans)
+        res_id = uuid.uuid4()
+        self.result_db.set_plan_evaluated(plans[1]['plan_id'], res_id, 1)
+        self.assertEqual(self.result_db.get_evaluated_plan_ids(), set([plans[1]['plan_id']]))
+
+        # Storing the plans again keeps their evaluations.
+        self.result_db.insert_fault_plans(plans)
+        stored = list(self.result_db.query_fault_plans({'plan_id': plans[1]['plan_id']}))
+        self.assertTrue(stored[0]['evaluated'])
+        self.assertEqual(stored[0]['results'], [{'res_id': res_id, 'run_id': 1}])
+
+
+if __name__ == '__main__':
+    unittest.main()
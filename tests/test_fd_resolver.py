@@ -0,0 +1,55 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file tests the file descriptor resolver of the strace tracer: descriptors
+are resolved via /proc, and a descriptor which can not be resolved falls back to
+lsof only once until it is opened or closed again.
+
+FILE: test_fd_resolver.py
+
+USAGE: python -m unittest discover -b -s tests -t .
+"""
+
+import os
+import tempfile
+import unittest
+from src import attach_strace
+from src.attach_strace import FileDescriptorResolver
+
+
+class FileDescriptorResolverTest(unittest.TestCase):
+    def setUp(self):
+        self.lsof_calls = []
+        self.search_file_descriptor_file = attach_strace.search_file_descriptor_file
+        attach_strace.search_file_descriptor_file = lambda pid, fd: self.lsof_calls.append(fd)
+        self.resolver = FileDescriptorResolver(os.getpid())
+
+    def tearDown(self):
+        attach_strace.search_file_descriptor_file = self.search_file_descriptor_file
+
+    def test_resolve_open_fd(self):
+        with tempfile.NamedTemporaryFile() as f:
+            fd = str(f.fileno())
+            self.assertEqual(self.resolver.resolve(fd), os.path.realpath(f.name))
+        # The cached path is used till the descriptor is invalidated.
+        self.assertEqual(self.resolver.resolve(fd), os.path.realpath(f.name))
+        self.assertEqual(self.lsof_calls, [])
+
+    def test_closed_fd_single_lsof(self):
+        (fd, path) = tempfile.mkstemp()
+        os.close(fd)
+        os.remove(path)
+        for _ in range(100):
+            self.assertIsNone(self.resolver.resolve(str(fd)))
+        self.assertEqual(self.lsof_calls, [str(fd)])
+
+        # A close or open of the descriptor resolves it again.
+        self.resolver.invalidate(str(fd))
+        self.resolver.resolve(str(fd))
+        self.assertEqual(self.lsof_calls, [str(fd), str(fd)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file tests the high water mark of the incremental result analyzer: results
+stored out of time order by concurrent runs, or with equal time stamps, are
+summarized exactly once, and the cached totals equal the aggregated totals.
+
+FILE: test_incremental_summaries.py
+
+USAGE: python -m unittest discover -b -s tests -t .
+"""
+
+import shutil
+import tempfile
+import unittest
+import uuid
+import result_analyzer
+from src import store_results_local
+from src.store_results_local import create_local_db
+
+
+class IncrementalSummaryTest(unittest.TestCase):
+    def setUp(self):
+        self.result_path = tempfile.mkdtemp()
+        self.result_db = create_local_db('test', {'backend': 'sqlite', 'path': self.result_path})
+        self.res_id = uuid.uuid4()
+        self.create_fi_document = store_results_local.create_fi_document
+
+    def tearDown(self):
+        store_results_local.create_fi_document = self.create_fi_document
+        self.result_db.close_connection()
+        shutil.rmtree(self.result_path)
+
+    # Insert a result with the given result time and number of read failures.
+    def insert(self, run_id, time_str, read_failures=0):
+        create_fi_document = self.create_fi_document
+        store_results_local.create_fi_document = lambda *args: dict(create_fi_document(*args), time=time_str)
+        effects = {'1': {'read_failure': read_failures, 'timestamp': '10:00:01.000000'}}
+        test_scenario = {'FI_type': 'bitflip', 'num_files': 1, 'flips_per_file': 1,
+                         'injection_times': ['10:00:00.500000'], 'db_error_logs': []}
+        self.result_db.insert_fi_result(1, 'cassandra', '3.5', {}, 'data/', test_scenario, effects, run_id,
+                                        self.res_id)
+
+    def totals(self):
+        return result_analyzer.summarize_incremental(self.result_db)
+
+    def test_earlier_time_stored_later(self):
+        self.insert(0, '2016-06-08T10:00:02')
+        self.assertEqual(self.totals()['total_results'], 1)
+        # A concurrent run stamped its result before the first one, but stored it later.
+        self.insert(1, '2016-06-08T10:00:01', read_failures=1)
+        totals = self.totals()
+        self.assertEqual(totals['total_results'], 2)
+        self.assertEqual(totals['errors'], 1)
+
+    def test_equal_times(self):
+        self.insert(0, '2016-06-08T10:00:02')
+        self.totals()
+        self.insert(1, '2016-06-08T10:00:02')
+        self.assertEqual(self.totals()['total_results'], 2)
+
+    def test_results_summarized_once(self):
+        for run_id in range(3):
+            self.insert(run_id, '2016-06-08T10:00:0{}'.format(run_id), read_failures=run_id)
+            self.totals()
+        self.assertEqual(len(list(self.result_db.query_run_summaries())), 3)
+        totals = self.totals()
+        aggregated = result_analyzer.summarize_aggregated(self.result_db)
+        for key in ['total_results', 'errors', 'no_errors', 'error_sum', 'read_failure']:
+            self.assertEqual(totals[key], aggregated[key])
+        self.assertEqual(totals['time_diff_fault_time_and_injections']['n'], 2)
+
+    def test_cached_summaries_not_read(self):
+        self.insert(0, '2016-06-08T10:00:00')
+        self.totals()
+        self.insert(1, '2016-06-08T10:00:01', read_failures=2)
+
+        # The totals are updated from the cached aggregate and the new result only.
+        def query_run_summaries(query=None):
+            raise AssertionError('The cached run summaries were read.')
+        self.result_db.query_run_summaries = query_run_summaries
+        totals = self.totals()
+        self.assertEqual(totals['total_results'], 2)
+        self.assertEqual(totals['read_failure'], 2)
+
+    def test_mark_of_earlier_version(self):
+        self.insert(0, '2016-06-08T10:00:00')
+        self.totals()
+        # Earlier versions stored the result time as the mark.
+        self.result_db.set_high_water_mark('2016-06-08T10:00:00')
+        self.assertEqual(self.totals()['total_results'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file tests the stop request of the test queries, used to stop a run early
+on a fatal DBMS log event without losing the results of the executed queries.
+
+FILE: test_query_stop.py
+
+USAGE: python -m unittest discover -b -s tests -t .
+"""
+
+import os
+import unittest
+from fi_client import request_query_stop
+from src.db_server_querying import stop_requested
+
+
+class QueryStopTest(unittest.TestCase):
+    def setUp(self):
+        (read_fd, write_fd) = os.pipe()
+        self.query_stdin = os.fdopen(read_fd, 'r')
+        self.client_stdin = os.fdopen(write_fd, 'w')
+
+    def tearDown(self):
+        self.query_stdin.close()
+        if not self.client_stdin.closed:
+            self.client_stdin.close()
+
+    def test_stop_request(self):
+        stop_times = []
+        self.assertFalse(stop_requested(self.query_stdin))
+        request_query_stop(self.client_stdin, stop_times)
+        self.assertTrue(stop_requested(self.query_stdin))
+        self.assertEqual(len(stop_times), 1)
+
+    def test_closed_stdin(self):
+        self.client_stdin.close()
+        self.assertFalse(stop_requested(self.query_stdin))
+
+    def test_finished_query_command(self):
+        # The query command already finished, so its stdin is closed.
+        self.query_stdin.close()
+        stop_times = []
+        request_query_stop(self.client_stdin, stop_times)
+        self.assertEqual(len(stop_times), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
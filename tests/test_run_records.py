@@ -0,0 +1,88 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file tests that the result record of each run of a scenario only contains
+the faults and fault plan of that run, as all repetitions share the scenario.
+
+FILE: test_run_records.py
+
+USAGE: python -m unittest discover -b -s tests -t .
+"""
+
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import uuid
+import fi_client
+from src.phase_timing import PhaseTimer
+from src.store_results_local import create_local_db
+
+
+# Create a client of a single local host, storing its results in a SQLite store.
+def create_local_client(result_path):
+    fi_file = os.path.join(result_path, 'scenarios.json')
+    with io.open(fi_file, 'w') as f:
+        f.write(unicode(json.dumps({
+            'server_meta': {'n_nodes': 1, 'user': 'user', 'host': ['127.0.0.1'], 'executor': 'local',
+                            'docker_api': 'cli'},
+            'db_type': 'cassandra', 'db_version': '3.5',
+            'db_meta': {'connection_ip': ['127.0.0.1']},
+            'data_to_insert': {'files': 'data/'},
+            'result_store': {'backend': 'sqlite', 'path': result_path}})))
+    return fi_client.FIClient(fi_file)
+
+
+class RunRecordTest(unittest.TestCase):
+    def setUp(self):
+        self.result_path = tempfile.mkdtemp()
+        self.client = create_local_client(self.result_path)
+        self.res_id = uuid.uuid4()
+
+    def tearDown(self):
+        shutil.rmtree(self.result_path)
+
+    def assemble(self, test_scenario, run_id, fault_plan=None, fault_details=None):
+        run_records = []
+        self.client._assemble_results_thread(test_scenario, [], {}, ['a-Data.db'], ['10:00:00.000000'],
+                                             self.res_id, run_id, fault_plan=fault_plan,
+                                             fault_details=fault_details, timer=PhaseTimer(),
+                                             return_records=run_records)
+        return run_records[0]
+
+    def stored_scenarios(self):
+        local_result_db = create_local_db(self.client.local_database_name, self.client.result_store_meta)
+        return dict((result['run_id'], result['test_scenario']) for result in local_result_db.query_db())
+
+    def test_plan_does_not_leak(self):
+        test_scenario = {'FI_type': 'bitflip', 'num_files': 1, 'flips_per_file': 1}
+        fault_plan = {'plan_id': 'plan-0', 'seed': 42, 'flips': [{'file': 'a-Data.db', 'offset': 1, 'bit': 2}]}
+        self.assemble(test_scenario, 0, fault_plan=fault_plan)
+        record = self.assemble(test_scenario, 1)
+
+        stored = self.stored_scenarios()
+        self.assertEqual(stored[0]['plan_id'], 'plan-0')
+        for scenario in [record, stored[1], test_scenario]:
+            for field in ['plan_id', 'fault_plan_seed', 'fault_plan']:
+                self.assertNotIn(field, scenario)
+
+    def test_fault_details_do_not_leak(self):
+        test_scenario = {'FI_type': 'stuck_bit', 'num_files': 1, 'flips_per_file': 1}
+        fault_details = {'stuck_bits': [['a-Data.db', 1, 2, 1]], 'stuck_bit_loop': {'passes': 3}}
+        self.assemble(test_scenario, 0, fault_details=fault_details)
+        # A run of which the injection failed has no fault details.
+        self.assemble(test_scenario, 1, fault_details={})
+
+        stored = self.stored_scenarios()
+        self.assertEqual(stored[0]['stuck_bits'], [['a-Data.db', 1, 2, 1]])
+        self.assertNotIn('stuck_bits', stored[1])
+        self.assertNotIn('stuck_bit_loop', stored[1])
+        self.assertNotIn('run_outcome', test_scenario)
+
+
+if __name__ == '__main__':
+    unittest.main()
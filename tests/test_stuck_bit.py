@@ -0,0 +1,129 @@
+"""
+Author: Gerard Schroder
+Study:  Computer Science at the University of Amsterdam
+Date:   08-06-2016
+
+This file tests the stuck bit loop: the stuck bits are re-asserted when the DBMS
+overwrites them, and a file is mapped again when it is replaced or grows, also
+when it was empty when it was opened.
+
+FILE: test_stuck_bit.py
+
+USAGE: python -m unittest discover -b -s tests -t .
+"""
+
+import io
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from threading import Thread
+from src.faults.stuck_bit import StuckFile, StuckBitLoop, stuck_byte
+
+
+class StuckFileTest(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.data_dir, 'a-Data.db')
+        # Bit 0 of byte 2 is stuck at 1.
+        self.stuck_file = StuckFile(self.path, [(2, 0, 1)])
+
+    def tearDown(self):
+        self.stuck_file.close()
+        shutil.rmtree(self.data_dir)
+
+    def write(self, data, path=None):
+        with io.open(path if path is not None else self.path, 'wb') as f:
+            f.write(data)
+
+    def read(self):
+        with io.open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_assert_bits(self):
+        self.write(b'\x00' * 4)
+        self.stuck_file.open()
+        self.assertFalse(self.stuck_file.changed())
+        self.assertEqual(self.stuck_file.assert_bits(), 1)
+        self.assertEqual(self.stuck_file.assert_bits(), 0)
+        self.stuck_file.map.flush()
+        self.assertEqual(self.read(), b'\x00\x00\x01\x00')
+
+    def test_empty_file_grows(self):
+        self.write(b'')
+        self.stuck_file.open()
+        self.assertIsNone(self.stuck_file.map)
+        self.assertFalse(self.stuck_file.changed())
+
+        self.write(b'\x00' * 4)
+        self.assertTrue(self.stuck_file.changed())
+        self.stuck_file.open()
+        self.assertEqual(self.stuck_file.assert_bits(), 1)
+
+    def test_missing_file_created(self):
+        self.stuck_file.open()
+        self.assertIsNone(self.stuck_file.file)
+        self.write(b'\x00' * 4)
+        self.assertTrue(self.stuck_file.changed())
+
+    def test_file_replaced(self):
+        self.write(b'\x00' * 4)
+        self.stuck_file.open()
+        replacement = os.path.join(self.data_dir, 'tmp-Data.db')
+        self.write(b'\x00' * 4, replacement)
+        os.rename(replacement, self.path)
+        self.assertTrue(self.stuck_file.changed())
+
+
+class StuckBitLoopTest(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.data_dir, 'a-Data.db')
+        with io.open(self.path, 'wb') as f:
+            f.write(b'\xff' * 8)
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def read(self):
+        with io.open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_stuck_byte(self):
+        self.assertEqual(stuck_byte(0x00, 3, 1), 0x08)
+        self.assertEqual(stuck_byte(0xff, 3, 0), 0xf7)
+        self.assertEqual(stuck_byte(0x08, 3, 1), 0x08)
+
+    def test_invalid_max_load(self):
+        for max_load in [0, -0.5, 1.5]:
+            self.assertRaises(ValueError, StuckBitLoop, [(self.path, 0, 0, 0)], max_load=max_load)
+
+    def test_reassert_overwritten_bits(self):
+        loop = StuckBitLoop([(self.path, 1, 0, 0), (self.path, 1, 7, 0), (self.path, 5, 2, 0)],
+                            interval=0.005, max_load=0.5)
+
+        # The DBMS overwrites the stuck byte while the loop runs.
+        def overwrite():
+            for _ in range(5):
+                with io.open(self.path, 'rb+') as f:
+                    f.seek(1)
+                    f.write(b'\xff')
+                time.sleep(0.02)
+        thread = Thread(target=overwrite)
+        thread.start()
+        summary = loop.run(duration=0.3)
+        thread.join()
+
+        self.assertEqual(self.read(), b'\xff\x7e\xff\xff\xff\xfb\xff\xff')
+        self.assertGreater(summary['passes'], 1)
+        self.assertGreaterEqual(summary['written'], 2)
+        self.assertLessEqual(summary['load'], 0.5)
+
+    def test_missing_file(self):
+        summary = StuckBitLoop([(os.path.join(self.data_dir, 'missing'), 0, 0, 1)], interval=0.01).run(0.05)
+        self.assertEqual(summary['written'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()